@@ -0,0 +1,264 @@
+"""
+In-memory stand-in for the supabase-py client, for load tests.
+
+Implements just the query-builder surface the bridge uses (``table()``
+with select/insert/update/upsert/delete, eq/in_/order/limit/single, and
+``rpc()`` for the encrypt/decrypt functions), with an optional per-call
+latency to model the PostgREST round trip. Blocking, like the real sync
+client; ``FakeAsyncPostgrestClient`` serves the same tables to the async
+data access in services.account_manager, paying the latency with
+``asyncio.sleep``.
+
+``install()`` must run before the bridge is imported so every
+``from database.supabase_client import get_supabase_client`` picks it up.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+ENCRYPTED_PREFIX = "bench:"
+
+
+class _Response:
+    __slots__ = ("data", "count")
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Not:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _Query:
+    def __init__(self, client: "FakeSupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._filters: List = []
+        self._order: Optional[tuple] = None
+        self._limit: Optional[int] = None
+        self._single = False
+
+    def select(self, *columns, **kwargs):
+        self._op = "select"
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self._op, self._payload = "upsert", payload
+        return self
+
+    def update(self, payload, **kwargs):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, value))
+        return self
+
+    def neq(self, column, value):
+        self._filters.append((column, _Not(value)))
+        return self
+
+    def in_(self, column, values):
+        allowed = {str(value) for value in values}
+        self._filters.append((column, allowed))
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count, **kwargs):
+        self._limit = count
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    maybe_single = single
+
+    def _matches(self, row):
+        return all(
+            str(row.get(column)) in value if isinstance(value, set)
+            else str(row.get(column)) != str(value.value) if isinstance(value, _Not)
+            else str(row.get(column)) == str(value)
+            for column, value in self._filters
+        )
+
+    def execute(self):
+        self._client._pay()
+        return self._client._execute(self)
+
+
+class _AsyncQuery(_Query):
+    async def execute(self):
+        await self._client._pay_async()
+        return self._client._execute(self)
+
+
+class FakeSupabaseClient:
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    from_ = table
+
+    def rpc(self, function: str, params: Dict[str, Any]):
+        client = self
+
+        class _Rpc:
+            def execute(self):
+                client._pay()
+                if function == "encrypt_password":
+                    return _Response(ENCRYPTED_PREFIX + params["password"])
+                if function == "decrypt_password":
+                    encrypted = params["encrypted"]
+                    return _Response(encrypted[len(ENCRYPTED_PREFIX):] if encrypted.startswith(ENCRYPTED_PREFIX) else None)
+                raise RuntimeError(f"404: function {function} not found")
+
+        return _Rpc()
+
+    def _pay(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    async def _pay_async(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+
+    def _execute(self, query: _Query) -> _Response:
+        with self._lock:
+            rows = self.tables.setdefault(query._table, [])
+            if query._op in ("insert", "upsert"):
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                inserted = []
+                for item in payload:
+                    row = dict(item)
+                    row.setdefault("id", str(uuid.uuid4()))
+                    row.setdefault("created_at", _now())
+                    if query._op == "upsert":
+                        rows[:] = [r for r in rows if r.get("id") != row["id"]]
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return _Response(inserted)
+
+            matched = [row for row in rows if query._matches(row)]
+            if query._op == "update":
+                for row in matched:
+                    row.update(query._payload)
+                    row["updated_at"] = _now()
+                return _Response([dict(row) for row in matched])
+            if query._op == "delete":
+                rows[:] = [row for row in rows if not query._matches(row)]
+                return _Response([dict(row) for row in matched])
+
+            if query._order:
+                column, desc = query._order
+                matched.sort(key=lambda row: str(row.get(column)), reverse=desc)
+            if query._limit is not None:
+                matched = matched[:query._limit]
+            data = [dict(row) for row in matched]
+            if query._single:
+                if len(data) != 1:
+                    raise RuntimeError(f"JSON object requested, multiple (or no) rows returned ({len(data)})")
+                return _Response(data[0])
+            return _Response(data)
+
+    def seed_accounts(self, table: str, users: int, accounts_per_user: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Create ``users`` users with ``accounts_per_user`` MT5 accounts each."""
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        login = 5000000
+        for u in range(users):
+            user_id = str(uuid.UUID(int=u + 1))
+            for a in range(accounts_per_user):
+                login += 1
+                row = {
+                    "id": str(uuid.UUID(int=(u + 1) * 1000 + a)),
+                    "user_id": user_id,
+                    "account_name": f"bench-{u}-{a}",
+                    "login": str(login),
+                    "server": "Fake-Demo",
+                    "broker_name": "Fake Broker",
+                    "account_type": "demo",
+                    "is_active": True,
+                    "is_default": a == 0,
+                    "encrypted_password": ENCRYPTED_PREFIX + f"pw{login}",
+                    "created_at": _now(),
+                    "updated_at": _now(),
+                }
+                self.tables.setdefault(table, []).append(row)
+                by_user.setdefault(user_id, []).append(row)
+        return by_user
+
+
+class FakeAsyncPostgrestClient:
+    """The async PostgREST client surface over a FakeSupabaseClient's tables."""
+
+    def __init__(self, client: FakeSupabaseClient):
+        self._client = client
+
+    def table(self, name: str) -> _AsyncQuery:
+        return _AsyncQuery(self._client, name)
+
+    from_ = table
+
+    async def aclose(self):
+        pass
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def install(client: FakeSupabaseClient):
+    """Make every ``get_supabase_client()`` in this process return ``client``."""
+    import database.supabase_client as supabase_module
+
+    original = supabase_module.get_supabase_client
+
+    def get_supabase_client():
+        return client
+
+    async_client = FakeAsyncPostgrestClient(client)
+    original_async = supabase_module.get_async_postgrest_client
+
+    def get_async_postgrest_client():
+        return async_client
+
+    supabase_module.get_supabase_client = get_supabase_client
+    supabase_module.get_async_postgrest_client = get_async_postgrest_client
+    # Modules that already did ``from ... import get_supabase_client``
+    for module in list(sys.modules.values()):
+        if getattr(module, "get_supabase_client", None) is original:
+            module.get_supabase_client = get_supabase_client
+        if getattr(module, "get_async_postgrest_client", None) is original_async:
+            module.get_async_postgrest_client = get_async_postgrest_client
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the FastAPI bridge against the fake MT5 terminal.
+
+Runs ``mt5_api_bridge.app`` in-process (ASGI, no sockets) with
+services.fake_mt5 as the terminal and benchmarks.fake_supabase as the
+database, so results are reproducible on any Linux box. Concurrent
+workers drive a weighted mix of operations as a set of seeded users, each
+with several MT5 accounts, so requests for different users force real
+account switches on the shared terminal.
+
+Reported per endpoint: requests, errors, throughput, p50/p95/p99 latency
+and terminal round trips per request (measured in a sequential calibration
+pass, since the fake's counters are process-wide). ``--output`` saves the
+report as JSON; ``--baseline`` compares against an earlier report.
+
+Usage:
+    python -m benchmarks.load_test --workload mixed --concurrency 16 --duration 20
+    python -m benchmarks.load_test --workload orders --output after.json --baseline before.json
+
+Fake terminal behaviour (latency, failure injection...) is configured with
+the MT5_FAKE_* variables, see README "Fake Terminal".
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import jwt
+
+SERVICE_KEY = "bench-service-key"
+SYMBOLS = ("EURUSD", "GBPUSD", "USDJPY", "XAUUSD")
+
+# name -> {operation: weight}
+WORKLOADS: Dict[str, Dict[str, int]] = {
+    "mixed": {
+        "market_data": 30, "market_data_service": 10, "positions": 25, "account_info": 10,
+        "order_roundtrip": 10, "history": 5, "switch_account": 5, "symbols": 5,
+    },
+    "market-data": {"market_data": 3, "market_data_service": 1},
+    "orders": {"order_roundtrip": 1},
+    "positions": {"positions": 4, "account_info": 1},
+    "switching": {"switch_account": 2, "positions": 1, "account_info": 1},
+}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.round_trips: Dict[str, List[int]] = defaultdict(list)
+        self.recording = True
+
+    def add(self, label: str, status_code: int, elapsed_ms: float):
+        if self.recording:
+            self.latencies[label].append(elapsed_ms)
+            self.statuses[label][status_code] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        all_latencies: List[float] = []
+        all_errors = 0
+        for label in sorted(self.latencies):
+            values = sorted(self.latencies[label])
+            all_latencies.extend(values)
+            errors = sum(n for code, n in self.statuses[label].items() if code >= 400)
+            all_errors += errors
+            endpoints[label] = {
+                "requests": len(values),
+                "errors": errors,
+                "statuses": {str(code): n for code, n in sorted(self.statuses[label].items())},
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "latency_ms": _latency(values),
+                "round_trips": _round_trips(self.round_trips.get(label)),
+            }
+        all_latencies.sort()
+        return {
+            "overall": {
+                "requests": len(all_latencies),
+                "errors": all_errors,
+                "throughput_rps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+                "latency_ms": _latency(all_latencies),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def _latency(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(_percentile(values, 50), 2),
+        "p95": round(_percentile(values, 95), 2),
+        "p99": round(_percentile(values, 99), 2),
+        "mean": round(statistics.fmean(values), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+def _round_trips(samples: Optional[List[int]]) -> Optional[float]:
+    if not samples:
+        return None
+    return round(statistics.fmean(samples), 2)
+
+
+class Harness:
+    def __init__(self, client, users: Dict[str, List[Dict[str, Any]]], recorder: Recorder, terminal=None):
+        self.client = client
+        self.users = users
+        self.user_ids = list(users)
+        self.tokens = {user_id: _token(user_id) for user_id in users}
+        self.recorder = recorder
+        self.terminal = terminal
+        self.measure_round_trips = False
+
+    async def request(self, label: str, method: str, url: str, user_id: Optional[str] = None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if user_id:
+            headers["Authorization"] = f"Bearer {self.tokens[user_id]}"
+        before = self.terminal.round_trips if self.terminal is not None and self.measure_round_trips else None
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+            status_code = response.status_code
+        except Exception:
+            response, status_code = None, 599
+        self.recorder.add(label, status_code, (time.perf_counter() - started) * 1000)
+        if before is not None:
+            self.recorder.round_trips[label].append(self.terminal.round_trips - before)
+        return response
+
+    # ---------- operations ----------
+
+    async def market_data(self, rng: random.Random, user_id: str):
+        symbol = rng.choice(SYMBOLS)
+        await self.request("GET /api/v1/market-data/{symbol}", "GET", f"/api/v1/market-data/{symbol}?timeframe=M5&bars=200", user_id)
+
+    async def market_data_service(self, rng: random.Random, user_id: str):
+        symbol = rng.choice(SYMBOLS)
+        await self.request(
+            "GET /api/v1/market-data/{symbol} (service key)", "GET",
+            f"/api/v1/market-data/{symbol}?timeframe=M5&bars=200", headers={"X-Service-Key": SERVICE_KEY},
+        )
+
+    async def positions(self, rng: random.Random, user_id: str):
+        await self.request("GET /api/v1/positions", "GET", "/api/v1/positions", user_id)
+
+    async def account_info(self, rng: random.Random, user_id: str):
+        await self.request("GET /api/v1/account/info", "GET", "/api/v1/account/info", user_id)
+
+    async def history(self, rng: random.Random, user_id: str):
+        await self.request("GET /api/v1/trades/history", "GET", "/api/v1/trades/history", user_id)
+
+    async def symbols(self, rng: random.Random, user_id: str):
+        await self.request("GET /api/v1/symbols", "GET", "/api/v1/symbols", user_id)
+
+    async def order_roundtrip(self, rng: random.Random, user_id: str):
+        order = {"symbol": rng.choice(SYMBOLS), "order_type": rng.choice(("buy", "sell")), "volume": 0.01}
+        response = await self.request("POST /api/v1/trades", "POST", "/api/v1/trades", user_id, json=order)
+        if response is None or response.status_code != 200:
+            return
+        ticket = response.json().get("ticket")
+        if ticket:
+            await self.request("DELETE /api/v1/positions/{ticket}", "DELETE", f"/api/v1/positions/{ticket}", user_id)
+
+    async def switch_account(self, rng: random.Random, user_id: str):
+        account = rng.choice(self.users[user_id])
+        await self.request("POST /api/v1/accounts/{account_id}/switch", "POST", f"/api/v1/accounts/{account['id']}/switch", user_id)
+
+    # ---------- drivers ----------
+
+    def operations(self, workload: Dict[str, int]) -> Tuple[List[Callable], List[int]]:
+        names = list(workload)
+        return [getattr(self, name) for name in names], [workload[name] for name in names]
+
+    async def calibrate(self, workload: Dict[str, int], seed: int, rounds: int = 3):
+        """Sequential pass: terminal round trips per endpoint, nothing else in flight."""
+        if self.terminal is None:
+            return
+        rng = random.Random(seed)
+        self.recorder.recording = False
+        self.measure_round_trips = True
+        try:
+            for operation, _ in zip(*self.operations(workload)):
+                for _ in range(rounds):
+                    await operation(rng, rng.choice(self.user_ids))
+        finally:
+            self.measure_round_trips = False
+            self.recorder.recording = True
+
+    async def run(self, workload: Dict[str, int], concurrency: int, duration: float, warmup: float, seed: int) -> float:
+        operations, weights = self.operations(workload)
+        deadline_warm = time.perf_counter() + warmup
+        deadline = deadline_warm + duration
+
+        async def worker(index: int):
+            rng = random.Random(seed * 1000 + index)
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    return
+                self.recorder.recording = now >= deadline_warm
+                operation = rng.choices(operations, weights)[0]
+                await operation(rng, rng.choice(self.user_ids))
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return time.perf_counter() - deadline_warm
+
+
+def _token(user_id: str) -> str:
+    # The bridge accepts Supabase-issued JWTs by their payload; the signature
+    # is checked upstream by Supabase, so any key works here.
+    payload = {"sub": user_id, "email": f"{user_id[-4:]}@bench.local", "iss": "https://bench.supabase.co/auth/v1", "exp": int(time.time()) + 86400}
+    return jwt.encode(payload, "bench", algorithm="HS256")
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _print_report(report: Dict[str, Any]):
+    overall = report["overall"]
+    print(f"\nworkload={report['config']['workload']} concurrency={report['config']['concurrency']} "
+          f"duration={report['elapsed_seconds']}s requests={overall['requests']} errors={overall['errors']} "
+          f"throughput={overall['throughput_rps']} req/s")
+    print(f"{'endpoint':<52}{'reqs':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rt':>6}")
+    for label, stats in report["endpoints"].items():
+        latency = stats["latency_ms"]
+        rt = "-" if stats["round_trips"] is None else f"{stats['round_trips']:g}"
+        print(f"{label:<52}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}{rt:>6}")
+    latency = overall["latency_ms"]
+    print(f"{'overall':<52}{overall['requests']:>7}{overall['errors']:>6}{overall['throughput_rps']:>9}"
+          f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}")
+
+
+def _print_comparison(report: Dict[str, Any], baseline: Dict[str, Any]):
+    def change(new, old):
+        return "n/a" if not old else f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nvs baseline {baseline.get('git_revision') or ''} ({baseline.get('timestamp')})")
+    print(f"{'endpoint':<52}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("overall", report["overall"], baseline["overall"])]
+    rows += [(label, stats, baseline["endpoints"][label]) for label, stats in report["endpoints"].items() if label in baseline["endpoints"]]
+    for label, new, old in rows:
+        print(f"{label:<52}{change(new['throughput_rps'], old['throughput_rps']):>10}"
+              + "".join(f"{change(new['latency_ms'][p], old['latency_ms'][p]):>10}" for p in ("p50", "p95", "p99")))
+
+
+async def _main(args) -> Dict[str, Any]:
+    # Must happen before the bridge (and its services) are imported
+    os.environ["MT5_FAKE_TERMINAL"] = "1"
+    os.environ["BACKEND_SERVICE_KEY"] = SERVICE_KEY
+    from benchmarks import fake_supabase
+
+    supabase = fake_supabase.FakeSupabaseClient(latency_ms=args.supabase_latency_ms)
+    fake_supabase.install(supabase)
+
+    import httpx
+
+    import mt5_api_bridge
+    from services import account_manager, fake_mt5
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    users = supabase.seed_accounts(account_manager.MT5_ACCOUNTS_TABLE, args.users, args.accounts_per_user)
+
+    app = mt5_api_bridge.app
+    await app.router.startup()
+    try:
+        terminal = fake_mt5.shared_terminal()
+        recorder = Recorder()
+        async with httpx.AsyncClient(app=app, base_url="http://bridge.bench", timeout=60) as client:
+            harness = Harness(client, users, recorder, terminal)
+            workload = WORKLOADS[args.workload]
+            await harness.calibrate(workload, args.seed)
+            rt_before = terminal.round_trips
+            supabase_before = supabase.calls
+            elapsed = await harness.run(workload, args.concurrency, args.duration, args.warmup, args.seed)
+            total_round_trips = terminal.round_trips - rt_before
+            supabase_calls = supabase.calls - supabase_before
+    finally:
+        await app.router.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {
+            "workload": args.workload,
+            "mix": WORKLOADS[args.workload],
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "users": args.users,
+            "accounts_per_user": args.accounts_per_user,
+            "seed": args.seed,
+            "supabase_latency_ms": args.supabase_latency_ms,
+            "fake_terminal": {k: v for k, v in vars(terminal.config).items() if k != "symbols"},
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        **recorder.summary(elapsed),
+    }
+    report["overall"]["terminal_round_trips"] = total_round_trips
+    report["overall"]["supabase_calls"] = supabase_calls
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds, after warm-up")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--accounts-per-user", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--supabase-latency-ms", type=float, default=3)
+    parser.add_argument("--log-level", default="error")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main(args))
+    _print_report(report)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            _print_comparison(report, json.load(fh))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nSaved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+CPU cost of request-path logging, before and after the queue pipeline.
+
+Replays the log lines one ``place_order`` request emits (symbol/filling-mode
+dump, one line per filling-mode attempt, success) through four setups:
+
+- legacy:       eager f-strings at INFO, synchronous StreamHandler (the old basicConfig)
+- legacy+queue: same lines, through services.log_pipeline's queue handler
+- lazy:         the current %-style lines (attempts at DEBUG), synchronous handler
+- lazy+queue:   current lines through the queue pipeline (the default now)
+
+"caller" is CPU burnt on the thread that logs - the event loop in the
+bridge - and is what the pipeline is meant to cut; "process" includes the
+writer thread.
+
+Usage:
+    python -m benchmarks.logging_overhead [--requests 20000] [--attempts 3] [--json] [--output /dev/null]
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+from services import log_pipeline
+
+SYMBOL = "EURUSD"
+
+
+def legacy_request(logger, attempts):
+    filling_modes = 2
+    logger.info(f"Symbol {SYMBOL} filling_mode: {filling_modes}")
+    logger.info(f"Using ORDER_FILLING_IOC (value: {1})")
+    for mode in range(attempts):
+        logger.info(f"Trying order: symbol={SYMBOL}, type=BUY, volume={0.1}, price={1.08123}, filling_mode={mode or 'auto'}")
+    logger.info(f"Order succeeded with filling_mode={mode or 'auto'}")
+
+
+def lazy_request(logger, attempts):
+    filling_modes = 2
+    logger.debug("Symbol %s filling_mode=%s, using %s", SYMBOL, filling_modes, 1)
+    for mode in range(attempts):
+        logger.debug(
+            "Trying order: symbol=%s, type=%s, volume=%s, price=%s, filling_mode=%s",
+            SYMBOL, "BUY", 0.1, 1.08123, mode,
+        )
+    logger.info("Order %s filled: %s %s %s @ %s (filling_mode=%s)", 123456, "BUY", 0.1, SYMBOL, 1.08123, mode)
+
+
+def run(name, emit, use_queue, requests, attempts, output, formatter):
+    stream = open(output, "a")
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter)
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if use_queue:
+        queue_handler = log_pipeline.NonBlockingQueueHandler(queue.Queue(log_pipeline.LOG_QUEUE_SIZE))
+        listener = logging.handlers.QueueListener(queue_handler.queue, handler)
+        listener.start()
+        logger.addHandler(queue_handler)
+    else:
+        logger.addHandler(handler)
+
+    process_started = time.process_time()
+    caller_started = time.thread_time()
+    wall_started = time.perf_counter()
+    for _ in range(requests):
+        emit(logger, attempts)
+    caller = time.thread_time() - caller_started
+    wall = time.perf_counter() - wall_started
+    if listener is not None:
+        listener.stop()  # drain, so "process" includes the writer's share
+    process = time.process_time() - process_started
+    logger.handlers.clear()
+    stream.close()
+    return {
+        "setup": name,
+        "caller_us": caller / requests * 1e6,
+        "process_us": process / requests * 1e6,
+        "wall_us": wall / requests * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--attempts", type=int, default=3, help="filling-mode attempts logged per request")
+    parser.add_argument("--json", action="store_true", help="format records with the JSON formatter")
+    parser.add_argument("--output", default=os.devnull, help="where formatted lines are written")
+    args = parser.parse_args()
+
+    formatter = log_pipeline.JsonFormatter() if args.json else logging.Formatter(log_pipeline.TEXT_FORMAT)
+    setups = (
+        ("legacy", legacy_request, False),
+        ("legacy+queue", legacy_request, True),
+        ("lazy", lazy_request, False),
+        ("lazy+queue", lazy_request, True),
+    )
+    results = [run(name, emit, use_queue, args.requests, args.attempts, args.output, formatter) for name, emit, use_queue in setups]
+
+    baseline = results[0]["caller_us"]
+    print(f"{'setup':<14}{'caller us/req':>15}{'process us/req':>16}{'wall us/req':>13}{'caller vs legacy':>18}")
+    for row in results:
+        print(
+            f"{row['setup']:<14}{row['caller_us']:>15.1f}{row['process_us']:>16.1f}{row['wall_us']:>13.1f}"
+            f"{row['caller_us'] / baseline:>17.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Count RPyC round trips per bridge operation, before and after terminal-side batching.
+
+Connects to a running mt5linux RPyC server (same MT5_RPC_HOST / MT5_RPC_PORT
+as the bridge), wraps the connection's ``sync_request`` with a counter and
+runs each operation twice: the way the handlers used to read netrefs
+attribute by attribute, and through services.mt5_remote helpers.
+
+Usage:
+    python -m benchmarks.rpc_roundtrips [--symbol EURUSD] [--days 30] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from mt5linux import MetaTrader5
+
+from services import mt5_remote
+
+POSITION_FIELDS = ("ticket", "symbol", "type", "volume", "price_open", "price_current", "profit", "sl", "tp", "magic")
+DEAL_FIELDS = ("position_id", "entry", "type", "price", "symbol", "volume", "profit", "time", "commission", "swap")
+
+
+class RoundTripCounter:
+    def __init__(self, conn):
+        self.count = 0
+        original = conn.sync_request
+
+        def counted(handler, *args):
+            self.count += 1
+            return original(handler, *args)
+
+        conn.sync_request = counted
+
+    def measure(self, fn, repeat):
+        """Round trips of one call and median wall time over ``repeat`` calls."""
+        start_count = self.count
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return (self.count - start_count) // repeat, statistics.median(timings)
+
+
+def legacy_positions(mt5):
+    positions = mt5.positions_get()
+    for pos in positions or ():
+        for field in POSITION_FIELDS:
+            getattr(pos, field)
+
+
+def legacy_symbol_snapshot(mt5, symbol):
+    info = mt5.symbol_info(symbol)
+    tick = mt5.symbol_info_tick(symbol)
+    info.filling_mode, tick.ask, tick.bid
+
+
+def legacy_deals(mt5, start_ts, end_ts):
+    deals = mt5.history_deals_get(start_ts, end_ts)
+    for deal in deals or ():
+        for field in DEAL_FIELDS:
+            getattr(deal, field)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("MT5_RPC_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MT5_RPC_PORT", "8001")))
+    parser.add_argument("--symbol", default="EURUSD")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    mt5 = MetaTrader5(host=args.host, port=args.port)
+    mt5.initialize()
+    counter = RoundTripCounter(mt5._MetaTrader5__conn)
+    # Install outside the measurement; it happens once per connection
+    mt5_remote.install(mt5)
+
+    start_ts = int((datetime.now() - timedelta(days=args.days)).timestamp())
+    end_ts = int(datetime.now().timestamp())
+    positions = mt5_remote.positions(mt5) or []
+    deals = mt5_remote.deals_range(mt5, start_ts, end_ts) or []
+
+    cases = [
+        (f"positions ({len(positions)} open)", lambda: legacy_positions(mt5), lambda: mt5_remote.positions(mt5)),
+        (f"symbol_info + tick ({args.symbol})", lambda: legacy_symbol_snapshot(mt5, args.symbol), lambda: mt5_remote.symbol_snapshot(mt5, args.symbol)),
+        (f"deals, last {args.days}d ({len(deals)} deals)", lambda: legacy_deals(mt5, start_ts, end_ts), lambda: mt5_remote.deals_range(mt5, start_ts, end_ts)),
+    ]
+
+    print(f"{'operation':<40} {'before':>14} {'after':>14}")
+    for name, before, after in cases:
+        before_trips, before_ms = counter.measure(before, args.repeat)
+        after_trips, after_ms = counter.measure(after, args.repeat)
+        print(f"{name:<40} {before_trips:>5} rt {before_ms:>6.1f}ms {after_trips:>5} rt {after_ms:>6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import os
 from functools import lru_cache
 from typing import Optional
 
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from supabase import Client, create_client
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,7 @@ SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 SUPABASE_KEY = SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
 
 
 @lru_cache(maxsize=1)
@@ -37,6 +40,32 @@ def get_supabase_client() -> Optional[Client]:
         return None
 
 
+_async_client: Optional[AsyncPostgrestClient] = None
+
+
+def get_async_postgrest_client() -> Optional[AsyncPostgrestClient]:
+    """
+    Async PostgREST client for code running on the event loop, with the
+    same credentials as ``get_supabase_client()``. It keeps one pooled
+    httpx.AsyncClient, so requests reuse warm keep-alive connections.
+    """
+    global _async_client
+    if _async_client is None and SUPABASE_URL and SUPABASE_KEY:
+        headers = dict(DEFAULT_POSTGREST_CLIENT_HEADERS, apikey=SUPABASE_KEY, Authorization=f"Bearer {SUPABASE_KEY}")
+        _async_client = AsyncPostgrestClient(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1", headers=headers, timeout=SUPABASE_TIMEOUT_SECONDS,
+        )
+    return _async_client
+
+
+async def close_async_postgrest_client():
+    """Close the async client's pooled connections (at shutdown)."""
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+
+
 def is_supabase_available() -> bool:
     return get_supabase_client() is not None
 
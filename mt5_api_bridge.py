@@ -5,13 +5,17 @@ Web API for MT5 trading and data access on Linux VPS
 Uses Supabase JWT authentication (same as Trainflow backend)
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Query, status, BackgroundTasks, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import logging
+import math
 import os
 import jwt
 import time
@@ -22,7 +26,7 @@ from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 # Supabase authentication (same as backend)
 from supabase import Client
 
-from database.supabase_client import get_supabase_client, is_supabase_available
+from database.supabase_client import close_async_postgrest_client, get_supabase_client, is_supabase_available
 from models.account_models import (
     AccountConnectRequest,
     AccountListResponse,
@@ -30,8 +34,8 @@ from models.account_models import (
     AccountUpdateRequest,
     SwitchAccountResponse,
 )
-from services import account_manager, account_switcher
-from services.trade_journal_logger import log_closed_position_to_journal
+from services import account_manager, account_switcher, deal_cache, deal_reconciler, encryption_client, fake_mt5, health_monitor, idempotency, journal_writer, log_pipeline, metrics, mt5_connection, mt5_lanes, mt5_remote, order_book, order_pipeline, profiler, rate_limiter, request_timing, single_flight, tracing
+from services.trade_journal_logger import build_deal_journal_entry, log_deal_positions_to_journal
 
 # Try to import MT5 library
 MT5_INSTANCE = None
@@ -53,15 +57,27 @@ except ImportError:
         MT5_AVAILABLE = False
         MT5_LIBRARY = None
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Records are queued and written by a background thread (services/log_pipeline.py)
+log_pipeline.configure()
 logger = logging.getLogger(__name__)
 
 supabase_client: Optional[Client] = get_supabase_client()
 SUPABASE_AVAILABLE = is_supabase_available()
 
+# How often the background heartbeat re-verifies the terminal's logged-in account
+LOGIN_HEARTBEAT_SECONDS = float(os.getenv("MT5_LOGIN_HEARTBEAT_SECONDS", "30"))
+_login_heartbeat_task: Optional[asyncio.Task] = None
+
+# Upper bound for a single RPyC call; 0 keeps rpyc's default (30s)
+MT5_RPC_TIMEOUT = float(os.getenv("MT5_RPC_TIMEOUT", "0"))
+
+# Largest basket accepted by POST /api/v1/trades/batch
+MT5_BATCH_MAX_ORDERS = int(os.getenv("MT5_BATCH_MAX_ORDERS", "50"))
+
+# Run against the in-process fake terminal (services/fake_mt5.py) instead of
+# a real one - for load tests and benchmarks on machines without Wine/MT5
+MT5_FAKE_TERMINAL = os.getenv("MT5_FAKE_TERMINAL", "").lower() in ("1", "true", "yes")
+
 app = FastAPI(
     title="MT5 API Bridge",
     description="Web API for MT5 trading and data access",
@@ -78,11 +94,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+# Stores responses of requests sent with an Idempotency-Key (see idempotency_key below)
+app.add_middleware(idempotency.IdempotencyMiddleware)
+app.add_exception_handler(idempotency.Replay, idempotency.replay_response)
+
+
+def _json_safe(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    """FastAPI's 422, except that NaN/infinity echoed from the input are sent as strings (JSON has neither)."""
+    return JSONResponse(status_code=422, content={"detail": _json_safe(jsonable_encoder(exc.errors()))})
+
+# Admin-only diagnostics (/admin/*, per-request profiling); disabled when unset
+ADMIN_KEY = os.getenv("MT5_ADMIN_KEY")
+app.add_middleware(profiler.RequestProfilerMiddleware, admin_key=ADMIN_KEY)
+
+# Per-request stage breakdown in the Server-Timing response header
+app.add_middleware(request_timing.ServerTimingMiddleware)
+# Server span per request (no-op unless MT5_TRACING_EXPORTER is set)
+tracing.configure()
+app.add_middleware(tracing.TracingMiddleware)
+# Outermost, so latency includes CORS and error handling
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Optional bearer token protecting /metrics (leave unset if only Prometheus can reach it)
+METRICS_TOKEN = os.getenv("MT5_METRICS_TOKEN")
+
 security = HTTPBearer()
 
 # Supabase JWT verification (same as backend security.py)
+@request_timing.timed("auth")
+@tracing.traced("verify_token")
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """
     Verify JWT token using Supabase (same as backend core/security.py)
@@ -230,9 +284,29 @@ async def verify_token_or_service_role(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+async def idempotency_key(request: Request, user: dict = Depends(verify_token)):
+    """
+    Dependency for order endpoints: a retry carrying the same Idempotency-Key
+    gets the first response back instead of sending the order again
+    """
+    await idempotency.reserve(request, user["user_id"])
+
+def rate_limit(route_class: str, auth=verify_token):
+    """
+    Dependency charging the request to the caller's quota for ``route_class``
+    (see services.rate_limiter); 429 with Retry-After once it is used up
+    """
+    async def charge(user: dict = Depends(auth)):
+        rate_limiter.check(user, route_class)
+    return Depends(charge)
+
 # ============ MODELS ============
 
-class TradeRequest(BaseModel):
+class TerminalRequest(BaseModel):
+    """Body sent on to the terminal: NaN and infinity are rejected with 422."""
+    model_config = ConfigDict(allow_inf_nan=False)
+
+class TradeRequest(TerminalRequest):
     symbol: str
     order_type: str  # "buy" or "sell"
     volume: float
@@ -240,12 +314,66 @@ class TradeRequest(BaseModel):
     stop_loss: Optional[float] = None
     take_profit: Optional[float] = None
 
+class BatchTradeRequest(BaseModel):
+    orders: List[TradeRequest]
+
+class PendingOrderRequest(TerminalRequest):
+    symbol: str
+    order_type: str  # buy_limit, sell_limit, buy_stop, sell_stop, buy_stop_limit, sell_stop_limit
+    volume: float
+    price: float  # limit price, or stop (trigger) price
+    stop_limit_price: Optional[float] = None  # stop-limit only: limit price once the stop is reached
+    stop_loss: Optional[float] = None
+    take_profit: Optional[float] = None
+    expiration: Optional[datetime] = None  # good till cancelled when omitted
+
+class PendingOrderModifyRequest(TerminalRequest):
+    price: Optional[float] = None
+    stop_limit_price: Optional[float] = None
+    stop_loss: Optional[float] = None  # 0 removes it, omitted keeps it
+    take_profit: Optional[float] = None  # 0 removes it, omitted keeps it
+    expiration: Optional[datetime] = None
+
+class PositionModifyRequest(TerminalRequest):
+    stop_loss: Optional[float] = None  # new SL; 0 removes it, omitted keeps it
+    take_profit: Optional[float] = None  # new TP; 0 removes it, omitted keeps it
+    volume: Optional[float] = None  # close this much of the position
+
+class BulkCloseRequest(BaseModel):
+    all: bool = False  # required (true) when no filter is given
+    symbol: Optional[str] = None
+    magic: Optional[int] = None
+    side: Optional[str] = None  # "buy" or "sell"
+    close_by: bool = False  # net opposite positions with TRADE_ACTION_CLOSE_BY first (hedging accounts)
+
 # ============ INITIALIZATION ============
 
+def _create_terminal():
+    """Build a fresh terminal connection (used at startup and by the reconnect supervisor)"""
+    if MT5_LIBRARY == "mt5linux":
+        rpc_host = os.getenv("MT5_RPC_HOST", "localhost")
+        rpc_port = int(os.getenv("MT5_RPC_PORT", "8001"))  # Docker uses 8001
+        terminal = MetaTrader5(host=rpc_host, port=rpc_port)
+        if MT5_RPC_TIMEOUT > 0:
+            mt5_connection.set_request_timeout(terminal, MT5_RPC_TIMEOUT)
+        return terminal
+    if MT5_LIBRARY == "fake":
+        return fake_mt5.connect()
+    return mt5_module
+
 @app.on_event("startup")
 async def startup():
     """Initialize MT5 on startup"""
-    global MT5_INSTANCE
+    global MT5_INSTANCE, MT5_LIBRARY, MT5_AVAILABLE, _login_heartbeat_task
+    
+    if MT5_FAKE_TERMINAL:
+        MT5_LIBRARY = "fake"
+        MT5_AVAILABLE = True
+    
+    loop = asyncio.get_running_loop()
+    metrics.track_executor("default", lambda: loop._default_executor)
+    
+    journal_writer.start()
     
     logger.info("🚀 Starting MT5 API Bridge")
     logger.info(f"📚 MT5 Library: {MT5_LIBRARY}")
@@ -267,7 +395,7 @@ async def startup():
             rpc_port = int(os.getenv("MT5_RPC_PORT", "8001"))  # Docker uses 8001
             
             try:
-                MT5_INSTANCE = MetaTrader5(host=rpc_host, port=rpc_port)
+                MT5_INSTANCE = _create_terminal()
                 logger.info(f"✅ Created MT5 instance for {rpc_host}:{rpc_port}")
                 
                 # Initialize MT5 connection
@@ -281,8 +409,9 @@ async def startup():
                 
                 # Test connection
                 try:
-                    account = MT5_INSTANCE.account_info()
+                    account = mt5_remote.account_info(MT5_INSTANCE)
                     if account:
+                        account_switcher.set_current_login(account.login)
                         logger.info(f"✅ MT5 connection verified - Account: {account.login}")
                     else:
                         logger.warning("⚠️  Connected but account_info() returned None")
@@ -313,6 +442,11 @@ async def startup():
             else:
                 MT5_INSTANCE = mt5_module
                 logger.info("✅ MT5 library loaded")
+                
+        elif MT5_LIBRARY == "fake":
+            logger.warning("🧪 MT5_FAKE_TERMINAL is set - using the fake terminal, no real orders will be placed")
+            MT5_INSTANCE = _create_terminal()
+            MT5_INSTANCE.initialize()
     except Exception as e:
         logger.error(f"❌ MT5 initialization error: {e}")
         MT5_INSTANCE = None
@@ -320,22 +454,62 @@ async def startup():
         logger.error(f"❌ MT5 initialization error: {e}")
         MT5_INSTANCE = None
         return
-    
+
+    # Hand the connection to the supervisor; if the terminal wasn't reachable
+    # it keeps retrying in the background instead of staying down until restart
+    mt5_connection.configure(_create_terminal, MT5_INSTANCE)
+    mt5_connection.start()
+
+    if LOGIN_HEARTBEAT_SECONDS > 0:
+        _login_heartbeat_task = asyncio.create_task(_login_heartbeat_loop())
+
+    health_monitor.start(mt5_connection.current)
+    # Journals SL/TP hits and terminal-side closes from the deal history
+    deal_reconciler.start(mt5_connection.current)
+
+
+async def _login_heartbeat_loop():
+    """
+    Periodically confirm which account the terminal is logged into so
+    ensure_account_session can trust its cached login between requests.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(LOGIN_HEARTBEAT_SECONDS)
+        terminal = mt5_connection.current()
+        if terminal is None:
+            continue
+        try:
+            await loop.run_in_executor(None, account_switcher.verify_current_login, terminal)
+        except Exception as e:
+            logger.warning(f"Login heartbeat error: {e}")
+
 @app.on_event("shutdown")
 async def shutdown():
     """Shutdown MT5"""
     global MT5_INSTANCE
-    if MT5_INSTANCE and hasattr(MT5_INSTANCE, 'shutdown'):
-        MT5_INSTANCE.shutdown()
-        logger.info("MT5 shut down")
+    if _login_heartbeat_task:
+        _login_heartbeat_task.cancel()
+    await health_monitor.stop()
+    await asyncio.get_running_loop().run_in_executor(None, deal_reconciler.stop)
+    mt5_connection.shutdown()
+    # Last flush attempt off the loop; whatever is left stays in the outbox
+    await asyncio.get_running_loop().run_in_executor(None, journal_writer.stop)
+    await close_async_postgrest_client()
+    await asyncio.get_running_loop().run_in_executor(None, encryption_client.stop)
+    tracing.shutdown()
+    logger.info("MT5 shut down")
     MT5_INSTANCE = None
 
 # Helper function to get MT5 instance or raise error
 def get_mt5():
-    """Get MT5 instance, raise error if not available"""
-    if not MT5_AVAILABLE or MT5_INSTANCE is None:
+    """
+    Get the supervised MT5 instance, raise error if not available.
+    Fails fast with 503 (and Retry-After) while the circuit breaker is open.
+    """
+    if not MT5_AVAILABLE:
         raise HTTPException(status_code=503, detail="MT5 not connected. Ensure MT5 Terminal is running with RPC server active.")
-    return MT5_INSTANCE
+    return mt5_connection.get_terminal()
 
 # Helper to get MT5 constants (for timeframe, order types, etc.)
 def get_mt5_const(name):
@@ -345,22 +519,26 @@ def get_mt5_const(name):
         return getattr(MetaTrader5, name, None)
     elif MT5_LIBRARY == "MetaTrader5":
         return getattr(mt5_module, name, None)
+    elif MT5_LIBRARY == "fake":
+        return getattr(fake_mt5.FakeMetaTrader5, name, None)
     return None
 
 
-def _require_account(user_id: str, account_id: Optional[str] = None) -> AccountResponse:
+@request_timing.timed("account")
+@tracing.traced("require_account")
+async def _require_account(user_id: str, account_id: Optional[str] = None) -> AccountResponse:
     """
     Fetch the requested account for a user, defaulting to the cached
     active account or the user's default account.
     """
     if account_id:
-        return account_manager.get_account(user_id, account_id)
+        return await account_manager.get_account(user_id, account_id)
 
     cached_id = account_switcher.get_active_account_id(user_id)
     if cached_id:
-        return account_manager.get_account(user_id, cached_id)
+        return await account_manager.get_account(user_id, cached_id)
 
-    default_account = account_manager.get_default_account(user_id)
+    default_account = await account_manager.get_default_account(user_id)
     if default_account:
         return default_account
 
@@ -374,6 +552,36 @@ def _ensure_account_session(user_id: str, account: AccountResponse, mt5_instance
     mt5_instance = mt5_instance or get_mt5()
     account_switcher.ensure_account_session(user_id, account.dict(), mt5_instance)
 
+
+async def _in_session(user_id: str, account: AccountResponse, mt5, function, *args):
+    """
+    Run terminal work ``function(*args)`` in a worker thread, with the
+    terminal held on ``account`` from the session check to the last call
+    (account_switcher.run_as). Another user's login waits for it to finish.
+    """
+    return await asyncio.to_thread(account_switcher.run_as, user_id, account.dict(), mt5, function, *args)
+
+
+async def _shared_read(method: str, key: tuple, user_id: Optional[str], account: Optional[AccountResponse], mt5, function, *args):
+    """
+    Run the terminal read ``function(*args)`` off the event loop, shared
+    with identical concurrent reads (services.single_flight). ``key`` holds
+    whatever else the result depends on. With an account, the session is
+    ensured and the read made in the same worker call, so another user's
+    login can't slip in between, and only reads of the same account (server
+    and login) are shared. Without one (service-role requests), the read
+    runs on whichever account the terminal is on.
+    """
+    account_key = (account.server, account.login) if account is not None else (None, None)
+    result = await single_flight.run(
+        method, (mt5_connection.identity(mt5),) + account_key + key,
+        account_switcher.run_as, user_id, account.dict() if account is not None else None, mt5, function, *args,
+    )
+    if account is not None:
+        account_switcher.set_active_account_id(user_id, account.id)
+    return result
+
+
 # ============ HEALTH & INFO ============
 
 @app.get("/")
@@ -390,37 +598,107 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint.
+    Served from the background prober's cached snapshot - never calls MT5.
+    """
+    checks = health_monitor.get_checks()
+    terminal = checks.get("terminal", {})
+    mt5_connected = bool(terminal.get("ok")) and checks["login"]["ok"]
+
+    if health_monitor.is_stale():
+        overall = "starting" if health_monitor.last_cycle() is None else "unhealthy"
+    else:
+        overall = "healthy" if mt5_connected else "degraded"
+
+    return {
+        "status": overall,
+        "mt5_available": MT5_AVAILABLE,
+        "mt5_connected": mt5_connected,
+        "mt5_library": MT5_LIBRARY,
+        "supabase_available": SUPABASE_AVAILABLE,
+        "account": checks["login"]["account"],
+        "checks": checks,
+        "trade_journal": journal_writer.get_status(),
+        "mt5_lanes": mt5_lanes.get_status(),
+        "checked_at": health_monitor.last_cycle(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/livez")
+async def liveness_check():
+    """Liveness probe - the process and event loop are responsive"""
+    return {
+        "status": "alive",
+        "health_monitor_running": health_monitor.is_running(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe - 200 only when the terminal can serve trading requests"""
+    ready = health_monitor.is_ready()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "checks": health_monitor.get_checks(),
+            "checked_at": health_monitor.last_cycle(),
+        },
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint"""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ============ ADMIN DIAGNOSTICS ============
+
+def verify_admin_key(request: Request):
+    """Require X-Admin-Key to match MT5_ADMIN_KEY"""
+    if not ADMIN_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.is_admin_key(ADMIN_KEY, request.headers.get("X-Admin-Key")):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin key")
+
+@app.get("/admin/profile", include_in_schema=False, dependencies=[Depends(verify_admin_key)])
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=profiler.MAX_PROCESS_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    idle: bool = Query(False, description="Include parked threads"),
+):
+    """
+    Sample all thread stacks for `seconds` and return collapsed stacks
+    (feed to flamegraph.pl, speedscope or inferno).
+    """
+    loop = asyncio.get_running_loop()
     try:
-        mt5_connected = False
-        account_info = None
-        
-        if MT5_AVAILABLE and MT5_INSTANCE:
-            try:
-                account_info = MT5_INSTANCE.account_info()
-                mt5_connected = account_info is not None
-            except:
-                mt5_connected = False
-                account_info = None
-        else:
-            mt5_connected = False
-            account_info = None
-        
-        return {
-            "status": "healthy" if mt5_connected else "degraded",
-            "mt5_available": MT5_AVAILABLE,
-            "mt5_connected": mt5_connected,
-            "mt5_library": MT5_LIBRARY,
-            "supabase_available": SUPABASE_AVAILABLE,
-            "account": account_info.login if account_info else None,
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+        sampler = await loop.run_in_executor(None, profiler.profile_process, seconds, interval_ms / 1000, idle)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return Response(
+        content=sampler.collapsed(),
+        media_type="text/plain",
+        headers={
+            "X-Profile-Samples": str(sampler.samples),
+            "Content-Disposition": 'attachment; filename="mt5-bridge.collapsed"',
+        },
+    )
+
+@app.get("/admin/profile/requests", include_in_schema=False, dependencies=[Depends(verify_admin_key)])
+async def list_request_profiles():
+    """Recent per-request profiles (requests sent with X-Profile: 1)"""
+    return {"profiles": profiler.request_profiles()}
+
+@app.get("/admin/profile/requests/{profile_id}", include_in_schema=False, dependencies=[Depends(verify_admin_key)])
+async def get_request_profile(profile_id: int):
+    """Collapsed stacks of one per-request profile"""
+    collapsed = profiler.request_profile(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found (only the most recent ones are kept)")
+    return Response(content=collapsed, media_type="text/plain")
 
 # ============ ACCOUNT ENDPOINTS ============
 
@@ -428,7 +706,8 @@ class MT5LoginTimeout(Exception):
     """Custom exception for MT5 login timeouts from RPyC"""
     pass
 
-@app.post("/api/v1/accounts/connect", response_model=AccountResponse)
+@app.post("/api/v1/accounts/connect", response_model=AccountResponse, dependencies=[rate_limit(mt5_lanes.ACCOUNT)])
+@mt5_lanes.lane(mt5_lanes.ACCOUNT)
 async def connect_account(
     request: AccountConnectRequest,
     user: dict = Depends(verify_token),
@@ -480,27 +759,32 @@ async def connect_account(
             logger.info(f"Executing mt5.login() in thread for login={login_id}, server={request.server}")
             logger.info(f"⚠️  External broker login may take 60-90 seconds - please be patient...")
             try:
-                # For external brokers, the login can take a long time
-                # The MT5 terminal needs to establish connection, authenticate, and sync
-                result = mt5.login(
-                    login_id,
-                    password=request.password,
-                    server=request.server,
-                )
-                logger.info(f"mt5.login() returned: {result}")
-                if result:
-                    # Give it a moment to fully complete the login process
-                    import time
-                    time.sleep(2)
-                    # Verify login by checking account info
-                    try:
-                        account_info = mt5.account_info()
-                        if account_info:
-                            logger.info(f"✅ Login verified - Account: {account_info.login}, Server: {account_info.server}")
-                        else:
-                            logger.warning("⚠️  Login returned True but account_info() is None - login may still be completing")
-                    except Exception as verify_error:
-                        logger.warning(f"⚠️  Could not verify login immediately: {verify_error}")
+                # No request may run on the old account while the terminal switches
+                with account_switcher.exclusive_login():
+                    # The terminal leaves whatever account it was on as soon as login() starts
+                    account_switcher.invalidate_current_login()
+                    # For external brokers, the login can take a long time
+                    # The MT5 terminal needs to establish connection, authenticate, and sync
+                    result = mt5.login(
+                        login_id,
+                        password=request.password,
+                        server=request.server,
+                    )
+                    logger.info(f"mt5.login() returned: {result}")
+                    if result:
+                        account_switcher.set_current_login(login_id)
+                        # Give it a moment to fully complete the login process
+                        import time
+                        time.sleep(2)
+                        # Verify login by checking account info
+                        try:
+                            account_info = mt5_remote.account_info(mt5)
+                            if account_info:
+                                logger.info(f"✅ Login verified - Account: {account_info.login}, Server: {account_info.server}")
+                            else:
+                                logger.warning("⚠️  Login returned True but account_info() is None - login may still be completing")
+                        except Exception as verify_error:
+                            logger.warning(f"⚠️  Could not verify login immediately: {verify_error}")
                 return result
             except TimeoutError as e:
                 logger.error(f"RPyC TimeoutError in mt5.login() thread: {e}")
@@ -565,6 +849,7 @@ async def connect_account(
                 pass
         
         if not authorized:
+            account_switcher.invalidate_current_login()
             error = mt5.last_error() if hasattr(mt5, "last_error") else "Login failed"
             error_msg = f"Login failed: {error}"
             # Provide more helpful error messages
@@ -572,16 +857,18 @@ async def connect_account(
                 error_msg += f" Please verify login ({login_id}), password, and server name ('{request.server}') are correct."
             raise HTTPException(status_code=400, detail=error_msg)
 
-        account_info = mt5.account_info()
+        account_info = await asyncio.to_thread(mt5_remote.account_info, mt5)
         if not account_info:
+            account_switcher.invalidate_current_login()
             raise HTTPException(
                 status_code=503,
                 detail="Connected to MT5 but account information is unavailable",
             )
+        account_switcher.set_current_login(account_info.login)
 
-        account = account_manager.create_or_update_account(user_id, request)
+        account = await account_manager.create_or_update_account(user_id, request)
         # refresh session cache
-        _ensure_account_session(user_id, account, mt5_instance=mt5)
+        await asyncio.to_thread(_ensure_account_session, user_id, account, mt5)
 
         # enrich response with latest balances
         enriched = account.copy(
@@ -804,23 +1091,29 @@ async def verify_server(
     executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5-verify")
     
     def verify_connectivity():
-        try:
-            # Try login with invalid credentials - this will fail quickly if server is reachable
-            # or timeout if server is unreachable
-            result = mt5.login(
-                99999999,  # Invalid login
-                password="test",
-                server=server,
-            )
-            # If we get here, server is reachable (even if login failed)
-            return True
-        except Exception as e:
-            # Check if it's a timeout/connection error vs auth error
-            error_str = str(e).lower()
-            if "timeout" in error_str or "connection" in error_str or "network" in error_str:
-                return False
-            # Auth errors mean server is reachable
-            return True
+        # The probe login logs the terminal out of its current account: hold
+        # off session work for its duration and forget the login afterwards,
+        # so nothing can re-cache the old account while the probe runs
+        with account_switcher.exclusive_login():
+            try:
+                # Try login with invalid credentials - this will fail quickly if server is reachable
+                # or timeout if server is unreachable
+                mt5.login(
+                    99999999,  # Invalid login
+                    password="test",
+                    server=server,
+                )
+                # If we get here, server is reachable (even if login failed)
+                return True
+            except Exception as e:
+                # Check if it's a timeout/connection error vs auth error
+                error_str = str(e).lower()
+                if "timeout" in error_str or "connection" in error_str or "network" in error_str:
+                    return False
+                # Auth errors mean server is reachable
+                return True
+            finally:
+                account_switcher.invalidate_current_login()
     
     try:
         try:
@@ -862,50 +1155,54 @@ async def verify_server(
         except Exception:
             pass
 
-@app.get("/api/v1/account/info")
+def _read_account_info(mt5) -> Dict[str, Any]:
+    account_info = mt5_remote.account_info(mt5)
+    if account_info is None:
+        account_switcher.invalidate_current_login()
+        raise HTTPException(status_code=404, detail="Not connected to MT5")
+    
+    return {
+        "login": account_info.login,
+        "balance": float(account_info.balance),
+        "equity": float(account_info.equity),
+        "margin": float(account_info.margin),
+        "free_margin": float(account_info.margin_free),
+        "margin_level": float(account_info.margin_level or 0),
+        "profit": float(account_info.profit),
+        "server": account_info.server,
+        "currency": account_info.currency,
+        "leverage": account_info.leverage,
+        "company": account_info.company
+    }
+
+@app.get("/api/v1/account/info", dependencies=[rate_limit(mt5_lanes.ACCOUNT)])
+@mt5_lanes.lane(mt5_lanes.ACCOUNT)
 async def get_account_info(user: dict = Depends(verify_token)):
     """Get account information"""
     mt5 = get_mt5()
-    account = _require_account(user["user_id"])
-    _ensure_account_session(user["user_id"], account, mt5)
+    account = await _require_account(user["user_id"])
     
     try:
-        account_info = mt5.account_info()
-        if account_info is None:
-            raise HTTPException(status_code=404, detail="Not connected to MT5")
-        
-        return {
-            "login": account_info.login,
-            "balance": float(account_info.balance),
-            "equity": float(account_info.equity),
-            "margin": float(account_info.margin),
-            "free_margin": float(account_info.margin_free),
-            "margin_level": float(account_info.margin_level or 0),
-            "profit": float(account_info.profit),
-            "server": account_info.server,
-            "currency": account_info.currency,
-            "leverage": account_info.leverage,
-            "company": account_info.company
-        }
+        return await _shared_read("account_info", (), user["user_id"], account, mt5, _read_account_info, mt5)
     except HTTPException:
         raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/v1/accounts", response_model=AccountListResponse)
 async def list_accounts_endpoint(user: dict = Depends(verify_token)):
-    accounts = account_manager.list_accounts(user["user_id"])
+    accounts = await account_manager.list_accounts(user["user_id"])
     return AccountListResponse(accounts=accounts)
 
 
 @app.get("/api/v1/accounts/current", response_model=AccountResponse)
 async def get_current_account(user: dict = Depends(verify_token)):
-    account = _require_account(user["user_id"])
+    account = await _require_account(user["user_id"])
     mt5 = get_mt5()
-    _ensure_account_session(user["user_id"], account, mt5)
-    info = mt5.account_info()
+    info = await _in_session(user["user_id"], account, mt5, mt5_remote.account_info, mt5)
     if info:
         account = account.copy(
             update={
@@ -916,12 +1213,12 @@ async def get_current_account(user: dict = Depends(verify_token)):
     return account
 
 
-@app.post("/api/v1/accounts/{account_id}/switch", response_model=SwitchAccountResponse)
+@app.post("/api/v1/accounts/{account_id}/switch", response_model=SwitchAccountResponse, dependencies=[rate_limit(mt5_lanes.ACCOUNT)])
+@mt5_lanes.lane(mt5_lanes.ACCOUNT)
 async def switch_account(account_id: str, user: dict = Depends(verify_token)):
-    account = account_manager.get_account(user["user_id"], account_id)
+    account = await account_manager.get_account(user["user_id"], account_id)
     mt5 = get_mt5()
-    _ensure_account_session(user["user_id"], account, mt5)
-    info = mt5.account_info()
+    info = await _in_session(user["user_id"], account, mt5, mt5_remote.account_info, mt5)
     if info:
         account = account.copy(
             update={
@@ -938,19 +1235,33 @@ async def update_account_endpoint(
     request: AccountUpdateRequest,
     user: dict = Depends(verify_token),
 ):
-    account = account_manager.update_account(user["user_id"], account_id, request)
+    account = await account_manager.update_account(user["user_id"], account_id, request)
     return account
 
 
 @app.delete("/api/v1/accounts/{account_id}")
 async def delete_account_endpoint(account_id: str, user: dict = Depends(verify_token)):
-    account_manager.delete_account(user["user_id"], account_id)
+    await account_manager.delete_account(user["user_id"], account_id)
     account_switcher.clear_account_cache(account_id)
     return {"success": True}
 
 # ============ MARKET DATA ENDPOINTS ============
 
-@app.get("/api/v1/market-data/{symbol}")
+def _read_rates(mt5, function: str, *args) -> List[Dict[str, Any]]:
+    rates = getattr(mt5, function)(*args)
+    if rates is None:
+        return []
+    return [{
+        "time": int(rate[0]),
+        "open": float(rate[1]),
+        "high": float(rate[2]),
+        "low": float(rate[3]),
+        "close": float(rate[4]),
+        "volume": int(rate[5])
+    } for rate in rates]
+
+@app.get("/api/v1/market-data/{symbol}", dependencies=[rate_limit(mt5_lanes.MARKET_DATA, verify_token_or_service_role)])
+@mt5_lanes.lane(mt5_lanes.MARKET_DATA)
 async def get_historical_data(
     symbol: str,
     timeframe: str = Query("H1", description="M1, M5, M15, M30, H1, H4, D1, W1, MN1"),
@@ -968,6 +1279,7 @@ async def get_historical_data(
     Market data is public/shared, so service role access is safe for read-only operations.
     """
     mt5 = get_mt5()
+    account = None
     
     # If service role, skip account requirement (market data is public)
     if auth.get("service_role"):
@@ -975,12 +1287,11 @@ async def get_historical_data(
         if not MT5_AVAILABLE:
             raise HTTPException(status_code=503, detail="MT5 not available")
         # Try to initialize if not already done (for service role requests)
-        if not mt5.initialize():
+        if not await asyncio.to_thread(mt5.initialize):
             logger.warning("MT5 initialize() returned False for service role request")
     else:
-        # Normal user request - require account
-        account = _require_account(auth["user_id"])
-        _ensure_account_session(auth["user_id"], account, mt5)
+        # Normal user request - require account (the read runs in its session)
+        account = await _require_account(auth["user_id"])
     
     try:
         # Map timeframe - get constants from MT5
@@ -1000,22 +1311,14 @@ async def get_historical_data(
         if not mt5_timeframe:
             raise HTTPException(status_code=400, detail=f"Invalid timeframe: {timeframe}")
         
-        # Get data
-        rates = mt5.copy_rates_from_pos(symbol, mt5_timeframe, 0, bars)
-        
-        if rates is None or len(rates) == 0:
+        # Share concurrent identical reads of the same account's bars
+        data = await _shared_read(
+            "copy_rates_from_pos", (symbol, mt5_timeframe, bars), auth.get("user_id"), account, mt5,
+            _read_rates, mt5, "copy_rates_from_pos", symbol, mt5_timeframe, 0, bars,
+        )
+        if not data:
             raise HTTPException(status_code=404, detail=f"No data for {symbol}")
         
-        # Convert to JSON
-        data = [{
-            "time": int(rate[0]),
-            "open": float(rate[1]),
-            "high": float(rate[2]),
-            "low": float(rate[3]),
-            "close": float(rate[4]),
-            "volume": int(rate[5])
-        } for rate in rates]
-        
         return {
             "symbol": symbol,
             "timeframe": timeframe,
@@ -1025,10 +1328,12 @@ async def get_historical_data(
     except HTTPException:
         raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/market-data/{symbol}/range")
+@app.get("/api/v1/market-data/{symbol}/range", dependencies=[rate_limit(mt5_lanes.MARKET_DATA, verify_token_or_service_role)])
+@mt5_lanes.lane(mt5_lanes.MARKET_DATA)
 async def get_data_range(
     symbol: str,
     timeframe: str = Query("H1"),
@@ -1045,17 +1350,17 @@ async def get_data_range(
     - Service role key via X-Service-Key header (backend auto-resume) - no user account needed
     """
     mt5 = get_mt5()
+    account = None
     
     # If service role, skip account requirement (market data is public)
     if auth.get("service_role"):
         if not MT5_AVAILABLE:
             raise HTTPException(status_code=503, detail="MT5 not available")
-        if not mt5.initialize():
+        if not await asyncio.to_thread(mt5.initialize):
             logger.warning("MT5 initialize() returned False for service role request")
     else:
-        # Normal user request - require account
-        account = _require_account(auth["user_id"])
-        _ensure_account_session(auth["user_id"], account, mt5)
+        # Normal user request - require account (the read runs in its session)
+        account = await _require_account(auth["user_id"])
     
     try:
         timeframe_map = {
@@ -1087,20 +1392,10 @@ async def get_data_range(
         else:
             end_ts = int(datetime.now().timestamp())
         
-        # Get data
-        rates = mt5.copy_rates_range(symbol, mt5_timeframe, start_ts, end_ts)
-        
-        if rates is None:
-            return {"symbol": symbol, "timeframe": timeframe, "count": 0, "data": []}
-        
-        data = [{
-            "time": int(rate[0]),
-            "open": float(rate[1]),
-            "high": float(rate[2]),
-            "low": float(rate[3]),
-            "close": float(rate[4]),
-            "volume": int(rate[5])
-        } for rate in rates]
+        data = await _shared_read(
+            "copy_rates_range", (symbol, mt5_timeframe, start_ts, end_ts), auth.get("user_id"), account, mt5,
+            _read_rates, mt5, "copy_rates_range", symbol, mt5_timeframe, start_ts, end_ts,
+        )
         
         return {
             "symbol": symbol,
@@ -1111,29 +1406,29 @@ async def get_data_range(
     except HTTPException:
         raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============ TRADING ENDPOINTS ============
 
-@app.post("/api/v1/trades")
+@app.post("/api/v1/trades", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
 async def place_order(
     request: TradeRequest,
     user: dict = Depends(verify_token)
 ):
     """Place a market order"""
     mt5 = get_mt5()
-    account = _require_account(user["user_id"])
-    _ensure_account_session(user["user_id"], account, mt5)
+    account = await _require_account(user["user_id"])
     
-    try:
-        # Get symbol info
-        symbol_info = mt5.symbol_info(request.symbol)
+    def place():
+        # Get symbol info and current tick in a single terminal round trip
+        symbol_info, tick = mt5_remote.symbol_snapshot(mt5, request.symbol)
         if symbol_info is None:
             raise HTTPException(status_code=404, detail=f"Symbol {request.symbol} not found")
+        order_pipeline.remember_symbol(mt5, symbol_info)
         
-        # Get current tick (like working examples do)
-        tick = mt5.symbol_info_tick(request.symbol)
         if tick is None:
             raise HTTPException(status_code=404, detail=f"Failed to get tick for {request.symbol}")
         
@@ -1147,121 +1442,27 @@ async def place_order(
         else:
             raise HTTPException(status_code=400, detail="Invalid order_type")
         
-        # Get filling mode constants - use numeric values directly for RPyC compatibility
-        ORDER_FILLING_FOK = 0
-        ORDER_FILLING_IOC = 1
-        ORDER_FILLING_RETURN = 2
-        TRADE_RETCODE_DONE = 10009
-        TRADE_RETCODE_AUTOTRADING_DISABLED = 10027
-        
-        # Determine filling mode from symbol info
-        # filling_mode is a bitmask - check which modes are supported
-        filling_mode = None
-        try:
-            if hasattr(symbol_info, 'filling_mode'):
-                filling_modes = symbol_info.filling_mode
-                logger.info(f"Symbol {request.symbol} filling_mode: {filling_modes}")
-                
-                # Check which modes are supported (bitwise AND)
-                if (filling_modes & ORDER_FILLING_IOC):
-                    filling_mode = ORDER_FILLING_IOC
-                    logger.info(f"Using ORDER_FILLING_IOC (value: {ORDER_FILLING_IOC})")
-                elif (filling_modes & ORDER_FILLING_FOK):
-                    filling_mode = ORDER_FILLING_FOK
-                    logger.info(f"Using ORDER_FILLING_FOK (value: {ORDER_FILLING_FOK})")
-                elif (filling_modes & ORDER_FILLING_RETURN):
-                    filling_mode = ORDER_FILLING_RETURN
-                    logger.info(f"Using ORDER_FILLING_RETURN (value: {ORDER_FILLING_RETURN})")
-        except Exception as e:
-            logger.warning(f"Error reading filling_mode: {e}")
-        
-        # Try detected filling mode first, then fallbacks
-        # Always try multiple modes in case the detected one doesn't work
-        filling_modes_to_try = []
-        if filling_mode is not None:
-            # Start with detected mode
-            filling_modes_to_try.append(filling_mode)
-        
-        # Always try without type_filling (some brokers handle it automatically)
-        if None not in filling_modes_to_try:
-            filling_modes_to_try.append(None)
+        trade_request = {
+            "action": get_mt5_const("TRADE_ACTION_DEAL"),
+            "symbol": request.symbol,
+            "volume": float(request.volume),
+            "type": order_type_mt5,
+            "price": float(price_exec),
+            "deviation": 10,
+            "magic": 123456,
+            "comment": "API Trade",
+            "type_time": get_mt5_const("ORDER_TIME_GTC"),
+        }
         
-        # Try other standard modes as fallbacks
-        for mode in [ORDER_FILLING_RETURN, ORDER_FILLING_IOC, ORDER_FILLING_FOK]:
-            if mode not in filling_modes_to_try:
-                filling_modes_to_try.append(mode)
+        # Add SL/TP if provided
+        if request.stop_loss:
+            trade_request["sl"] = float(request.stop_loss)
+        if request.take_profit:
+            trade_request["tp"] = float(request.take_profit)
         
-        # Try each filling mode until one works
-        result = None
-        last_error = None
-        
-        for try_filling_mode in filling_modes_to_try:
-            try:
-                # Build request dict exactly like working examples
-                trade_request = {
-                    "action": get_mt5_const("TRADE_ACTION_DEAL"),
-                    "symbol": request.symbol,
-                    "volume": float(request.volume),
-                    "type": order_type_mt5,
-                    "price": float(price_exec),
-                    "deviation": 10,
-                    "magic": 123456,
-                    "comment": "API Trade",
-                    "type_time": get_mt5_const("ORDER_TIME_GTC"),
-                }
-                
-                # Add SL/TP if provided
-                if request.stop_loss:
-                    trade_request["sl"] = float(request.stop_loss)
-                if request.take_profit:
-                    trade_request["tp"] = float(request.take_profit)
-                
-                # Only add type_filling if we have a value
-                if try_filling_mode is not None:
-                    trade_request["type_filling"] = try_filling_mode
-                
-                logger.info(f"Trying order: symbol={request.symbol}, type={request.order_type}, volume={request.volume}, price={price_exec}, filling_mode={try_filling_mode or 'auto'}")
-                
-                # Send order
-                result = mt5.order_send(trade_request)
-                
-                if result is None:
-                    last_error = "Order send returned None"
-                    logger.warning(f"Order send returned None with filling_mode={try_filling_mode or 'auto'}, trying next...")
-                    continue
-                
-                if result.retcode == TRADE_RETCODE_DONE:
-                    logger.info(f"Order succeeded with filling_mode={try_filling_mode or 'auto'}")
-                    break
-                else:
-                    # Special handling for AutoTrading disabled (10027)
-                    if result.retcode == TRADE_RETCODE_AUTOTRADING_DISABLED:
-                        error_msg = "AutoTrading is disabled in MT5 Terminal. Please enable AutoTrading in MT5 Terminal (Tools → Options → Expert Advisors → Allow automated trading) to place trades via API."
-                        raise HTTPException(
-                            status_code=400,
-                            detail=error_msg
-                        )
-                    # If it's not a filling mode error (10030), fail immediately
-                    if result.retcode != 10030:
-                        error_msg = result.comment if hasattr(result, 'comment') else f"Error code: {result.retcode}"
-                        raise HTTPException(
-                            status_code=400,
-                            detail=f"Order failed: {error_msg} (code: {result.retcode})"
-                        )
-                    last_error = result.comment if hasattr(result, 'comment') else f"Error code: {result.retcode}"
-                    logger.warning(f"Filling mode {try_filling_mode or 'auto'} failed: {last_error}, trying next...")
-            except HTTPException:
-                raise
-            except Exception as e:
-                last_error = str(e)
-                logger.warning(f"Error with filling_mode={try_filling_mode or 'auto'}: {e}, trying next...")
-        
-        if result is None or result.retcode != TRADE_RETCODE_DONE:
-            error_msg = last_error or "All filling modes failed"
-            raise HTTPException(
-                status_code=400,
-                detail=f"Order failed: {error_msg} (code: {result.retcode if result else 'unknown'})"
-            )
+        # Detected filling mode first, then fallbacks (services/order_pipeline.py)
+        result, filling_mode = order_pipeline.send(mt5, trade_request, symbol_info)
+        logger.info("Order %s filled: %s %s %s @ %s (filling_mode=%s)", result.order, request.order_type, request.volume, request.symbol, result.price, filling_mode)
         
         return {
             "success": True,
@@ -1271,56 +1472,179 @@ async def place_order(
             "symbol": request.symbol,
             "type": request.order_type
         }
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, place)
     except HTTPException:
         raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/v1/positions")
+@app.post("/api/v1/trades/batch", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def place_orders_batch(
+    batch: BatchTradeRequest,
+    user: dict = Depends(verify_token)
+):
+    """
+    Place several market orders (a basket) at once. Every leg is validated
+    before anything is sent; symbol info and ticks for all symbols are
+    fetched in one terminal round trip and the orders are sent back to back
+    in another. Legs succeed or fail independently.
+    """
+    if not batch.orders:
+        raise HTTPException(status_code=400, detail="No orders given")
+    if len(batch.orders) > MT5_BATCH_MAX_ORDERS:
+        raise HTTPException(status_code=400, detail=f"At most {MT5_BATCH_MAX_ORDERS} orders per batch")
+    for index, leg in enumerate(batch.orders):
+        if leg.order_type.upper() not in ("BUY", "SELL"):
+            raise HTTPException(status_code=400, detail=f"orders[{index}]: Invalid order_type")
+        if leg.volume <= 0:
+            raise HTTPException(status_code=400, detail=f"orders[{index}]: Invalid volume")
+    
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    def submit():
+        started = time.perf_counter()
+        symbols = list(dict.fromkeys(leg.symbol for leg in batch.orders))
+        snapshots = mt5_remote.symbol_snapshots(mt5, symbols)
+        prefetched = time.perf_counter()
+        for symbol_info, _ in snapshots.values():
+            order_pipeline.remember_symbol(mt5, symbol_info)
+        
+        ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
+        ORDER_TYPE_SELL = get_mt5_const("ORDER_TYPE_SELL")
+        orders = []
+        for index, leg in enumerate(batch.orders):
+            symbol_info, tick = snapshots.get(leg.symbol, (None, None))
+            if symbol_info is None:
+                raise HTTPException(status_code=404, detail=f"orders[{index}]: Symbol {leg.symbol} not found")
+            if tick is None:
+                raise HTTPException(status_code=404, detail=f"orders[{index}]: Failed to get tick for {leg.symbol}")
+            is_buy = leg.order_type.upper() == "BUY"
+            trade_request = {
+                "action": get_mt5_const("TRADE_ACTION_DEAL"),
+                "symbol": leg.symbol,
+                "volume": float(leg.volume),
+                "type": ORDER_TYPE_BUY if is_buy else ORDER_TYPE_SELL,
+                "price": float(leg.price if leg.price is not None else (tick.ask if is_buy else tick.bid)),
+                "deviation": 10,
+                "magic": 123456,
+                "comment": "API Trade",
+                "type_time": get_mt5_const("ORDER_TIME_GTC"),
+            }
+            if leg.stop_loss:
+                trade_request["sl"] = float(leg.stop_loss)
+            if leg.take_profit:
+                trade_request["tp"] = float(leg.take_profit)
+            orders.append((trade_request, symbol_info))
+        
+        outcomes = order_pipeline.send_batch(mt5, orders, failure="Batch order failed")
+        return outcomes, started, prefetched, time.perf_counter()
+    
+    try:
+        outcomes, started, prefetched, finished = await _in_session(user["user_id"], account, mt5, submit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error("Batch order error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    results = []
+    for index, (leg, outcome) in enumerate(zip(batch.orders, outcomes)):
+        leg_result = {
+            "index": index,
+            "symbol": leg.symbol,
+            "type": leg.order_type,
+            "filling_mode": outcome.filling_mode,
+            "elapsed_ms": round(outcome.seconds * 1000, 2),
+        }
+        result = outcome.result
+        if result is not None and result.retcode == order_pipeline.TRADE_RETCODE_DONE:
+            leg_result.update(success=True, ticket=result.order, price=float(result.price), volume=float(result.volume))
+        else:
+            leg_result.update(
+                success=False,
+                retcode=result.retcode if result is not None else None,
+                error=order_pipeline.describe_failure(result) if result is not None else (outcome.error or "All filling modes failed"),
+            )
+        results.append(leg_result)
+    
+    filled = sum(1 for leg_result in results if leg_result["success"])
+    logger.info(
+        "Batch of %s orders: %s filled, %s failed in %.1f ms",
+        len(results), filled, len(results) - filled, (finished - started) * 1000,
+    )
+    return {
+        "success": filled == len(results),
+        "filled": filled,
+        "failed": len(results) - filled,
+        "results": results,
+        "timing_ms": {
+            "prefetch": round((prefetched - started) * 1000, 2),
+            "submit": round((finished - prefetched) * 1000, 2),
+        },
+    }
+
+def _read_positions(mt5) -> Dict[str, Any]:
+    positions = mt5_remote.positions(mt5)
+    
+    if positions is None:
+        return {"positions": []}
+    
+    ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
+    result = [{
+        "ticket": pos.ticket,
+        "symbol": pos.symbol,
+        "type": "buy" if pos.type == ORDER_TYPE_BUY else "sell",
+        "volume": float(pos.volume),
+        "price_open": float(pos.price_open),
+        "price_current": float(pos.price_current),
+        "profit": float(pos.profit),
+        "sl": float(pos.sl) if pos.sl > 0 else None,
+        "tp": float(pos.tp) if pos.tp > 0 else None,
+        "magic": pos.magic
+    } for pos in positions]
+    
+    return {"positions": result}
+
+@app.get("/api/v1/positions", dependencies=[rate_limit(mt5_lanes.ACCOUNT)])
+@mt5_lanes.lane(mt5_lanes.ACCOUNT)
 async def get_positions(user: dict = Depends(verify_token)):
     """Get all open positions"""
     mt5 = get_mt5()
-    account = _require_account(user["user_id"])
-    _ensure_account_session(user["user_id"], account, mt5)
+    account = await _require_account(user["user_id"])
     
     try:
-        positions = mt5.positions_get()
-        
-        if positions is None:
-            return {"positions": []}
-        
-        ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
-        result = [{
-            "ticket": pos.ticket,
-            "symbol": pos.symbol,
-            "type": "buy" if pos.type == ORDER_TYPE_BUY else "sell",
-            "volume": float(pos.volume),
-            "price_open": float(pos.price_open),
-            "price_current": float(pos.price_current),
-            "profit": float(pos.profit),
-            "sl": float(pos.sl) if pos.sl > 0 else None,
-            "tp": float(pos.tp) if pos.tp > 0 else None,
-            "magic": pos.magic
-        } for pos in positions]
-        
-        return {"positions": result}
+        return await _shared_read("positions_get", (), user["user_id"], account, mt5, _read_positions, mt5)
+    except HTTPException:
+        raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/v1/trades/history")
+@app.get("/api/v1/trades/history", dependencies=[rate_limit(mt5_lanes.BULK)])
+@mt5_lanes.lane(mt5_lanes.BULK)
 async def get_trade_history(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = None,
     limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = Query(None, description="Cursor (next_cursor), ISO time or ticket: return older trades"),
+    after: Optional[str] = Query(None, description="Cursor (prev_cursor), ISO time or ticket: return newer trades"),
     user: dict = Depends(verify_token)
 ):
-    """Get trade history (closed deals) from MT5"""
+    """
+    Get trade history (closed deals) from MT5, newest first.
+    Page with ``before=<next_cursor>`` (older) or ``after=<prev_cursor>`` (newer).
+    """
     mt5 = get_mt5()
-    account = _require_account(user["user_id"])
-    _ensure_account_session(user["user_id"], account, mt5)
+    account = await _require_account(user["user_id"])
     
     try:
         # Parse dates
@@ -1337,86 +1661,52 @@ async def get_trade_history(
         else:
             end_ts = int(datetime.now().timestamp())
         
-        # Get deals from MT5 history
-        # DEAL_ENTRY_IN = 0 (entry deal)
-        # DEAL_ENTRY_OUT = 1 (exit deal)
-        DEAL_ENTRY_OUT = 1
-        deals = mt5.history_deals_get(start_ts, end_ts)
-        
-        if deals is None or len(deals) == 0:
-            return {"trades": [], "count": 0}
-        
-        # Group deals by position_id to match entry/exit pairs
-        position_deals = {}
-        for deal in deals:
-            pos_id = deal.position_id
-            if pos_id not in position_deals:
-                position_deals[pos_id] = {"entry": None, "exit": None}
-            
-            if deal.entry == 0:  # Entry deal
-                position_deals[pos_id]["entry"] = deal
-            elif deal.entry == DEAL_ENTRY_OUT:  # Exit deal
-                position_deals[pos_id]["exit"] = deal
-        
-        # Build trades from complete entry/exit pairs
-        trades = []
-        ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
-        
-        for pos_id, deals_pair in position_deals.items():
-            entry_deal = deals_pair.get("entry")
-            exit_deal = deals_pair.get("exit")
-            
-            # Only include trades with both entry and exit
-            if entry_deal and exit_deal:
-                trade_type = "buy" if entry_deal.type == ORDER_TYPE_BUY else "sell"
-                
-                # Calculate P&L percentage
-                entry_price = float(entry_deal.price)
-                exit_price = float(exit_deal.price)
-                pnl_percent = 0.0
-                if entry_price > 0:
-                    if trade_type == "buy":
-                        pnl_percent = ((exit_price - entry_price) / entry_price) * 100
-                    else:
-                        pnl_percent = ((entry_price - exit_price) / entry_price) * 100
-                
-                trades.append({
-                    "ticket": pos_id,
-                    "symbol": exit_deal.symbol,
-                    "type": trade_type,
-                    "volume": float(exit_deal.volume),
-                    "entry_price": entry_price,
-                    "exit_price": exit_price,
-                    "pnl": float(exit_deal.profit),
-                    "pnl_percent": pnl_percent,
-                    "entry_time": datetime.fromtimestamp(entry_deal.time).isoformat(),
-                    "exit_time": datetime.fromtimestamp(exit_deal.time).isoformat(),
-                    "commission": float(exit_deal.commission) if hasattr(exit_deal, 'commission') else 0,
-                    "swap": float(exit_deal.swap) if hasattr(exit_deal, 'swap') else 0
-                })
-        
-        # Sort by exit time (most recent first) and limit
-        trades.sort(key=lambda x: x["exit_time"], reverse=True)
-        trades = trades[:limit]
-        
-        return {
-            "trades": trades,
-            "count": len(trades)
-        }
+        # Served from the per-account deal cache: only deals newer than the
+        # last one seen are fetched, and pages are cut from a sorted index
+        return await _shared_read(
+            "history_deals_get", (start_ts, end_ts, limit, before, after), user["user_id"], account, mt5,
+            deal_cache.trade_page, mt5, account.server, account.login, start_ts, end_ts, limit, before, after,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error fetching trade history: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.delete("/api/v1/positions/{ticket}")
-async def close_position(ticket: int, background_tasks: BackgroundTasks, user: dict = Depends(verify_token)):
+def _closed_from_deals(deals, position_ids) -> List[Dict[str, Any]]:
+    """Positions among ``position_ids`` that ``deals`` show closed, folded from all of their deals."""
+    wanted = sorted((deal for deal in deals if deal.position_id in position_ids), key=lambda deal: deal.ticket)
+    closed, _ = deal_reconciler.fold_deals(wanted, {})
+    return closed
+
+
+def _journal_from_deals(mt5, user_id: str, account: AccountResponse, position_id: int):
+    """
+    Journal a position closed here from its deal history, so earlier partial
+    closes count towards its volume and P&L. Left to the deal reconciler when
+    the history doesn't show it closed (yet).
+    """
+    try:
+        closed = _closed_from_deals(mt5_remote.position_deals(mt5, position_id) or [], {position_id})
+        if not closed:
+            logger.info("Position %s not closed in deal history yet; leaving it to the deal reconciler", position_id)
+            return
+        journal_writer.enqueue(build_deal_journal_entry(user_id, str(account.id), closed[-1]))
+    except Exception as journal_error:
+        logger.warning(f"Failed to log closed position to trade journal: {journal_error}")
+
+
+@app.delete("/api/v1/positions/{ticket}", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def close_position(ticket: int, user: dict = Depends(verify_token)):
     """Close a position"""
     mt5 = get_mt5()
-    account = _require_account(user["user_id"])
-    _ensure_account_session(user["user_id"], account, mt5)
+    account = await _require_account(user["user_id"])
     
-    try:
-        position = mt5.positions_get(ticket=ticket)
+    def close():
+        position = mt5_remote.positions(mt5, ticket=ticket)
         if position is None or len(position) == 0:
             raise HTTPException(status_code=404, detail="Position not found")
         
@@ -1425,166 +1715,532 @@ async def close_position(ticket: int, background_tasks: BackgroundTasks, user: d
         ORDER_TYPE_SELL = get_mt5_const("ORDER_TYPE_SELL")
         close_type = ORDER_TYPE_SELL if pos.type == ORDER_TYPE_BUY else ORDER_TYPE_BUY
         
-        symbol_info = mt5.symbol_info(pos.symbol)
+        # Symbol info (price + filling mode) in one terminal round trip
+        symbol_info, _ = mt5_remote.symbol_snapshot(mt5, pos.symbol)
         if symbol_info is None:
             raise HTTPException(status_code=404, detail="Symbol info not available")
         
         close_price = symbol_info.bid if close_type == ORDER_TYPE_SELL else symbol_info.ask
         
-        # Get symbol info to determine filling mode
-        symbol_info = mt5.symbol_info(pos.symbol)
-        ORDER_FILLING_FOK = 0
-        ORDER_FILLING_IOC = 1
-        ORDER_FILLING_RETURN = 2
-        TRADE_RETCODE_DONE = 10009
-        TRADE_RETCODE_AUTOTRADING_DISABLED = 10027
-        
-        # Determine filling mode from symbol info
-        filling_mode = None
-        try:
-            if symbol_info and hasattr(symbol_info, 'filling_mode'):
-                filling_modes = symbol_info.filling_mode
-                logger.info(f"Symbol {pos.symbol} filling_mode: {filling_modes}")
-                
-                # Check which modes are supported (bitwise AND)
-                if (filling_modes & ORDER_FILLING_IOC):
-                    filling_mode = ORDER_FILLING_IOC
-                elif (filling_modes & ORDER_FILLING_FOK):
-                    filling_mode = ORDER_FILLING_FOK
-                elif (filling_modes & ORDER_FILLING_RETURN):
-                    filling_mode = ORDER_FILLING_RETURN
-        except Exception as e:
-            logger.warning(f"Error reading filling_mode: {e}")
+        request = {
+            "action": get_mt5_const("TRADE_ACTION_DEAL"),
+            "symbol": pos.symbol,
+            "volume": float(pos.volume),
+            "type": close_type,
+            "position": pos.ticket,
+            "price": float(close_price),
+            "deviation": 10,
+            "magic": pos.magic,
+            "comment": "Close Position",
+            "type_time": get_mt5_const("ORDER_TIME_GTC"),
+        }
+        result, filling_mode = order_pipeline.send(mt5, request, symbol_info, purpose="close positions", failure="Close failed")
+        logger.info("Position %s closed @ %s (filling_mode=%s)", pos.ticket, result.price, filling_mode)
         
-        # Try detected filling mode first, then fallbacks
-        filling_modes_to_try = []
-        if filling_mode is not None:
-            filling_modes_to_try.append(filling_mode)
+        # Journal from the deal history, so earlier partial closes count
+        # (never fails the close; queued to the local outbox)
+        _journal_from_deals(mt5, user["user_id"], account, pos.ticket)
         
-        # Always try without type_filling (some brokers handle it automatically)
-        if None not in filling_modes_to_try:
-            filling_modes_to_try.append(None)
+        return {
+            "success": True,
+            "closed_ticket": pos.ticket,
+            "price": float(result.price),
+            "volume": float(result.volume)
+        }
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, close)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _check_close_volume(symbol_info, volume: float, position_volume: float):
+    """400 unless ``volume`` is a valid partial close of a position of ``position_volume``."""
+    if volume <= 0 or volume > position_volume + 1e-9:
+        raise HTTPException(status_code=400, detail=f"volume must be > 0 and at most the position volume ({position_volume})")
+    if symbol_info is None or abs(volume - position_volume) < 1e-9:
+        return
+    step = float(symbol_info.volume_step or 0)
+    if step > 0 and abs(round(volume / step) * step - volume) > 1e-9:
+        raise HTTPException(status_code=400, detail=f"volume must be a multiple of {step}")
+    volume_min = float(symbol_info.volume_min or 0)
+    if volume < volume_min - 1e-9 or position_volume - volume < volume_min - 1e-9:
+        raise HTTPException(status_code=400, detail=f"Closed and remaining volume must both be at least {volume_min}")
+
+
+@app.patch("/api/v1/positions/{ticket}", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def modify_position(ticket: int, request: PositionModifyRequest, user: dict = Depends(verify_token)):
+    """
+    Close part of a position and/or move SL/TP (TRADE_ACTION_SLTP), in that
+    order: a rejected close changes nothing, while an SL/TP change that
+    fails after a close reports the close in its error. Symbol metadata
+    comes from the order pipeline's cache and the close uses the symbol's
+    learned filling mode, so each change is normally one order_send.
+    """
+    if request.stop_loss is None and request.take_profit is None and request.volume is None:
+        raise HTTPException(status_code=400, detail="Nothing to modify: give stop_loss, take_profit and/or volume")
+    
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    def modify():
+        position = mt5_remote.positions(mt5, ticket=ticket)
+        if position is None or len(position) == 0:
+            raise HTTPException(status_code=404, detail="Position not found")
+        pos = position[0]
         
-        # Try other standard modes as fallbacks
-        for mode in [ORDER_FILLING_RETURN, ORDER_FILLING_IOC, ORDER_FILLING_FOK]:
-            if mode not in filling_modes_to_try:
-                filling_modes_to_try.append(mode)
+        symbol_info = None
+        if request.volume is not None:
+            symbol_info = order_pipeline.symbol_info(mt5, pos.symbol)
+            _check_close_volume(symbol_info, float(request.volume), float(pos.volume))
         
-        # Try each filling mode until one works
-        result = None
-        last_error = None
+        response = {
+            "success": True,
+            "ticket": pos.ticket,
+            "volume": float(pos.volume),
+        }
+        if request.volume is not None:
+            ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
+            ORDER_TYPE_SELL = get_mt5_const("ORDER_TYPE_SELL")
+            close_type = ORDER_TYPE_SELL if pos.type == ORDER_TYPE_BUY else ORDER_TYPE_BUY
+            # price None: filled in with the current quote next to the terminal
+            outcome = order_pipeline.send_batch(mt5, [({
+                "action": get_mt5_const("TRADE_ACTION_DEAL"),
+                "symbol": pos.symbol,
+                "volume": float(request.volume),
+                "type": close_type,
+                "position": pos.ticket,
+                "price": None,
+                "deviation": 10,
+                "magic": pos.magic,
+                "comment": "Partial Close",
+                "type_time": get_mt5_const("ORDER_TIME_GTC"),
+            }, symbol_info)], failure="Close failed")[0]
+            result = outcome.result
+            if result is None or result.retcode != order_pipeline.TRADE_RETCODE_DONE:
+                if result is None:
+                    account_switcher.invalidate_current_login()
+                detail = order_pipeline.describe_failure(result, "close positions") if result is not None else (outcome.error or "All filling modes failed")
+                raise HTTPException(status_code=400, detail=f"Close failed: {detail}")
+            logger.info("Position %s: closed %s of %s @ %s (filling_mode=%s)", pos.ticket, result.volume, pos.volume, result.price, outcome.filling_mode)
+            
+            remaining = round(float(pos.volume) - float(result.volume), 8)
+            if remaining <= 0:
+                # Fully closed. Partial closes are not journaled on their
+                # own, so the entry is built from the position's deals.
+                _journal_from_deals(mt5, user["user_id"], account, pos.ticket)
+            response.update(
+                closed_volume=float(result.volume),
+                volume=max(remaining, 0.0),
+                price=float(result.price),
+            )
         
-        for try_filling_mode in filling_modes_to_try:
+        sl = float(pos.sl or 0)
+        tp = float(pos.tp or 0)
+        if (request.stop_loss is not None or request.take_profit is not None) and response["volume"] > 0:
+            sl = float(request.stop_loss) if request.stop_loss is not None else sl
+            tp = float(request.take_profit) if request.take_profit is not None else tp
             try:
-                request = {
-                    "action": get_mt5_const("TRADE_ACTION_DEAL"),
+                order_pipeline.send(mt5, {
+                    "action": get_mt5_const("TRADE_ACTION_SLTP"),
                     "symbol": pos.symbol,
-                    "volume": float(pos.volume),
-                    "type": close_type,
                     "position": pos.ticket,
-                    "price": float(close_price),
-                    "deviation": 10,
+                    "sl": sl,
+                    "tp": tp,
                     "magic": pos.magic,
-                    "comment": "Close Position",
-                    "type_time": get_mt5_const("ORDER_TIME_GTC"),
-                }
-                
-                # Only add type_filling if we have a value
-                if try_filling_mode is not None:
-                    request["type_filling"] = try_filling_mode
-                
-                logger.info(f"Trying to close position {pos.ticket}: symbol={pos.symbol}, filling_mode={try_filling_mode or 'auto'}")
-                
-                result = mt5.order_send(request)
-                
-                if result is None:
-                    last_error = "Order send returned None"
-                    logger.warning(f"Close returned None with filling_mode={try_filling_mode or 'auto'}, trying next...")
-                    continue
-                
-                if result.retcode == TRADE_RETCODE_DONE:
-                    logger.info(f"Position closed with filling_mode={try_filling_mode or 'auto'}")
-                    break
-                else:
-                    # Special handling for AutoTrading disabled (10027)
-                    if result.retcode == TRADE_RETCODE_AUTOTRADING_DISABLED:
-                        error_msg = "AutoTrading is disabled in MT5 Terminal. Please enable AutoTrading in MT5 Terminal (Tools → Options → Expert Advisors → Allow automated trading) to close positions via API."
-                        raise HTTPException(
-                            status_code=400,
-                            detail=error_msg
-                        )
-                    # If it's not a filling mode error (10030), fail immediately
-                    if result.retcode != 10030:
-                        error_msg = result.comment if hasattr(result, 'comment') else f"Error code: {result.retcode}"
-                        raise HTTPException(
-                            status_code=400,
-                            detail=f"Close failed: {error_msg} (code: {result.retcode})"
-                        )
-                    last_error = result.comment if hasattr(result, 'comment') else f"Error code: {result.retcode}"
-                    logger.warning(f"Filling mode {try_filling_mode or 'auto'} failed: {last_error}, trying next...")
-            except HTTPException:
+                }, None, purpose="modify positions", failure="Modify failed")
+            except HTTPException as exc:
+                if "closed_volume" in response:
+                    exc.detail = f"{exc.detail} (the close of {response['closed_volume']} went through)"
                 raise
-            except Exception as e:
-                last_error = str(e)
-                logger.warning(f"Error with filling_mode={try_filling_mode or 'auto'}: {e}, trying next...")
+            logger.info("Position %s SL/TP set to %s/%s", pos.ticket, sl, tp)
+        response.update(stop_loss=sl or None, take_profit=tp or None)
+        return response
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, modify)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _close_by_pairs(positions) -> List[tuple]:
+    """
+    Greedy pairing of opposite positions per symbol for TRADE_ACTION_CLOSE_BY.
+    Returns (position, position_by) pairs; a position can appear in several
+    pairs while it still has volume left.
+    """
+    pairs = []
+    by_symbol: Dict[str, List[Any]] = {}
+    for pos in positions:
+        by_symbol.setdefault(pos.symbol, []).append(pos)
+    ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
+    for symbol_positions in by_symbol.values():
+        buys = [[pos, float(pos.volume)] for pos in symbol_positions if pos.type == ORDER_TYPE_BUY]
+        sells = [[pos, float(pos.volume)] for pos in symbol_positions if pos.type != ORDER_TYPE_BUY]
+        while buys and sells:
+            buy, sell = buys[0], sells[0]
+            pairs.append((buy[0], sell[0]))
+            netted = min(buy[1], sell[1])
+            for side, queue in ((buy, buys), (sell, sells)):
+                side[1] = round(side[1] - netted, 8)
+                if side[1] <= 0:
+                    queue.pop(0)
+    return pairs
+
+
+@app.post("/api/v1/positions/close", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def close_positions_bulk(request: BulkCloseRequest, user: dict = Depends(verify_token)):
+    """
+    Close every open position matching the filters (symbol, magic, side), or
+    all of them with ``all: true``. Positions are read once, prices for all
+    symbols in one round trip, and the closes are sent back to back in one
+    more. Journal entries are queued in a single outbox transaction.
+    """
+    side = request.side.upper() if request.side else None
+    if side not in (None, "BUY", "SELL"):
+        raise HTTPException(status_code=400, detail="Invalid side")
+    if not request.all and request.symbol is None and request.magic is None and side is None:
+        raise HTTPException(status_code=400, detail="Give a filter (symbol, magic, side) or all=true")
+    
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    ORDER_TYPE_BUY = get_mt5_const("ORDER_TYPE_BUY")
+    ORDER_TYPE_SELL = get_mt5_const("ORDER_TYPE_SELL")
+    results: Dict[int, Dict[str, Any]] = {}
+    
+    def submit():
+        started = time.perf_counter()
+        positions = [
+            pos for pos in (mt5_remote.positions(mt5) or [])
+            if (request.symbol is None or pos.symbol == request.symbol)
+            and (request.magic is None or pos.magic == request.magic)
+            and (side is None or (pos.type == ORDER_TYPE_BUY) == (side == "BUY"))
+        ]
+        if not positions:
+            return None
+        originals = {pos.ticket: pos for pos in positions}
         
-        if result is None or result.retcode != TRADE_RETCODE_DONE:
-            error_msg = last_error or "All filling modes failed"
-            raise HTTPException(
-                status_code=400,
-                detail=f"Close failed: {error_msg} (code: {result.retcode if result else 'unknown'})"
-            )
+        if request.close_by:
+            pairs = _close_by_pairs(positions)
+            if pairs:
+                outcomes = order_pipeline.send_batch(mt5, [({
+                    "action": get_mt5_const("TRADE_ACTION_CLOSE_BY"),
+                    "position": pos.ticket,
+                    "position_by": pos_by.ticket,
+                    "magic": pos.magic,
+                    "comment": "Close By",
+                }, None) for pos, pos_by in pairs], failure="Close by failed")
+                for (pos, pos_by), outcome in zip(pairs, outcomes):
+                    result = outcome.result
+                    if result is None or result.retcode != order_pipeline.TRADE_RETCODE_DONE:
+                        detail = order_pipeline.describe_failure(result, "close positions") if result is not None else (outcome.error or "Order send returned None")
+                        logger.warning("Close by %s/%s failed: %s", pos.ticket, pos_by.ticket, detail)
+                        continue
+                    # Both sides are closed at the opening price of position_by
+                    for closed in (pos, pos_by):
+                        results[closed.ticket] = {"price": float(pos_by.price_open), "closed_by": True}
+                # Netting may leave part of a position open: close what is left at market
+                positions = [pos for pos in (mt5_remote.positions(mt5) or []) if pos.ticket in originals]
+        
+        snapshots = mt5_remote.symbol_snapshots(mt5, list(dict.fromkeys(pos.symbol for pos in positions)))
+        prefetched = time.perf_counter()
+        closes = []
+        for pos in positions:
+            symbol_info, tick = snapshots.get(pos.symbol, (None, None))
+            close_type = ORDER_TYPE_SELL if pos.type == ORDER_TYPE_BUY else ORDER_TYPE_BUY
+            quote = tick if tick is not None else symbol_info
+            price = 0.0
+            if quote is not None:
+                price = quote.bid if close_type == ORDER_TYPE_SELL else quote.ask
+            closes.append((pos, ({
+                "action": get_mt5_const("TRADE_ACTION_DEAL"),
+                "symbol": pos.symbol,
+                "volume": float(pos.volume),
+                "type": close_type,
+                "position": pos.ticket,
+                "price": float(price),
+                "deviation": 10,
+                "magic": pos.magic,
+                "comment": "Close Position",
+                "type_time": get_mt5_const("ORDER_TIME_GTC"),
+            }, symbol_info)))
+        outcomes = order_pipeline.send_batch(mt5, [order for _, order in closes], failure="Bulk close failed") if closes else []
+        finished = time.perf_counter()
         
-        # Log to trade journal (non-blocking - don't fail if this fails)
+        # Deals of every position involved, in one round trip, so the journal
+        # counts earlier partial closes; on failure the reconciler journals them
         try:
-            position_dict = {
-                'ticket': pos.ticket,
-                'symbol': pos.symbol,
-                'type': pos.type,
-                'volume': float(pos.volume),
-                'price_open': float(pos.price_open),
-                'price_current': float(pos.price_current),
-                'profit': float(pos.profit),
-                'sl': float(pos.sl) if pos.sl > 0 else 0,
-                'tp': float(pos.tp) if pos.tp > 0 else 0,
-                'time_open': pos.time_open
-            }
-            close_result_dict = {
-                'price': float(result.price),
-                'volume': float(result.volume),
-                'ticket': result.order
+            deals = mt5_remote.deals_range(
+                mt5, min(pos.time for pos in originals.values()), int(time.time()) + deal_reconciler.FUTURE_SLACK_SECONDS
+            ) or []
+        except Exception as exc:
+            logger.warning("Bulk close: deal history for the journal not available: %s", exc)
+            deals = []
+        return originals, closes, outcomes, deals, started, prefetched, finished
+    
+    try:
+        submitted = await _in_session(user["user_id"], account, mt5, submit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error("Bulk close error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if submitted is None:
+        return {"success": True, "requested": 0, "closed": 0, "failed": 0, "results": []}
+    originals, closes, outcomes, deals, started, prefetched, finished = submitted
+    
+    # Volume still open per position whose market close failed (after any close_by netting)
+    left_open: Dict[int, float] = {}
+    for (pos, _), outcome in zip(closes, outcomes):
+        result = outcome.result
+        if result is not None and result.retcode == order_pipeline.TRADE_RETCODE_DONE:
+            results[pos.ticket] = {"price": float(result.price), "closed_by": results.get(pos.ticket, {}).get("closed_by", False)}
+        else:
+            left_open[pos.ticket] = float(pos.volume)
+            results[pos.ticket] = {
+                "error": order_pipeline.describe_failure(result, "close positions") if result is not None else (outcome.error or "All filling modes failed"),
+                "retcode": result.retcode if result is not None else None,
             }
-            
-            # Get account ID for trade journal
-            account_id = str(account.id) if hasattr(account, 'id') else account.get('id', '')
-            
-            # Log to trade journal in background (non-blocking)
-            background_tasks.add_task(
-                log_closed_position_to_journal,
-                user_id=user["user_id"],
-                account_id=account_id,
-                position_data=position_dict,
-                close_result=close_result_dict
-            )
-        except Exception as journal_error:
-            logger.warning(f"Failed to log closed position to trade journal: {journal_error}")
-            # Don't fail the close operation if journal logging fails
+    
+    response = []
+    succeeded = set()
+    for ticket, pos in originals.items():
+        outcome = results.get(ticket, {"error": "Position no longer open"})
+        item = {"ticket": ticket, "symbol": pos.symbol, "volume": float(pos.volume), "success": "error" not in outcome}
+        item.update(outcome)
+        # A failed market close may follow a close_by that netted part of the position
+        if ticket in left_open:
+            item["closed_volume"] = round(float(pos.volume) - left_open[ticket], 8)
+        else:
+            item["closed_volume"] = float(pos.volume) if item["success"] else 0.0
+        response.append(item)
+        if item["success"]:
+            succeeded.add(ticket)
+    
+    # Journal what closed, from the deals (local outbox, one transaction,
+    # flushed to Supabase in the background). Positions the history doesn't
+    # show closed yet are left to the deal reconciler.
+    if succeeded:
+        log_deal_positions_to_journal(user["user_id"], str(account.id), _closed_from_deals(deals, succeeded))
+    
+    closed = len(succeeded)
+    logger.info(
+        "Bulk close: %s of %s positions closed in %.1f ms",
+        closed, len(response), (finished - started) * 1000,
+    )
+    return {
+        "success": closed == len(response),
+        "requested": len(response),
+        "closed": closed,
+        "failed": len(response) - closed,
+        "results": response,
+        "timing_ms": {
+            "prefetch": round((prefetched - started) * 1000, 2),
+            "submit": round((finished - prefetched) * 1000, 2),
+        },
+    }
+
+
+# ============ PENDING ORDERS ============
+
+def _expiration_fields(expiration: Optional[datetime]) -> Dict[str, Any]:
+    if expiration is None:
+        return {"type_time": get_mt5_const("ORDER_TIME_GTC")}
+    return {"type_time": get_mt5_const("ORDER_TIME_SPECIFIED"), "expiration": int(expiration.timestamp())}
+
+
+@app.post("/api/v1/orders", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def place_pending_order(request: PendingOrderRequest, user: dict = Depends(verify_token)):
+    """Place a pending order (limit, stop or stop-limit); the terminal triggers it"""
+    order_type = request.order_type.lower()
+    if order_type not in order_book.ORDER_TYPES.values():
+        raise HTTPException(status_code=400, detail="Invalid order_type")
+    if order_type.endswith("stop_limit") and request.stop_limit_price is None:
+        raise HTTPException(status_code=400, detail="stop_limit_price is required for stop-limit orders")
+    if request.volume <= 0 or request.price <= 0:
+        raise HTTPException(status_code=400, detail="volume and price must be positive")
+    
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    def place():
+        symbol_info = order_pipeline.symbol_info(mt5, request.symbol)
+        if symbol_info is None:
+            raise HTTPException(status_code=404, detail=f"Symbol {request.symbol} not found")
+        
+        trade_request = {
+            "action": get_mt5_const("TRADE_ACTION_PENDING"),
+            "symbol": request.symbol,
+            "volume": float(request.volume),
+            "type": get_mt5_const("ORDER_TYPE_" + order_type.upper()),
+            "price": float(request.price),
+            "magic": 123456,
+            "comment": "API Order",
+            **_expiration_fields(request.expiration),
+        }
+        if request.stop_limit_price is not None:
+            trade_request["stoplimit"] = float(request.stop_limit_price)
+        if request.stop_loss:
+            trade_request["sl"] = float(request.stop_loss)
+        if request.take_profit:
+            trade_request["tp"] = float(request.take_profit)
+        
+        result, filling_mode = order_pipeline.send(mt5, trade_request, symbol_info, purpose="place orders")
+        order_book.invalidate(mt5, account.login)
+        logger.info("Pending order %s placed: %s %s %s @ %s (filling_mode=%s)", result.order, order_type, request.volume, request.symbol, request.price, filling_mode)
         
         return {
             "success": True,
-            "closed_ticket": pos.ticket,
-            "price": float(result.price),
-            "volume": float(result.volume)
+            "ticket": result.order,
+            "symbol": request.symbol,
+            "type": order_type,
+            "volume": float(request.volume),
+            "price": float(request.price),
+            "stop_limit_price": request.stop_limit_price,
+        }
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, place)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/orders", dependencies=[rate_limit(mt5_lanes.ACCOUNT)])
+@mt5_lanes.lane(mt5_lanes.ACCOUNT)
+async def get_pending_orders(symbol: Optional[str] = Query(None), user: dict = Depends(verify_token)):
+    """Pending orders of the active account (a snapshot at most MT5_ORDERS_CACHE_SECONDS old)"""
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    try:
+        orders = await _shared_read("orders_get", (), user["user_id"], account, mt5, order_book.snapshot, mt5, account.login)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if symbol is not None:
+        orders = [order for order in orders if order["symbol"] == symbol]
+    return {"orders": orders}
+
+
+@app.patch("/api/v1/orders/{ticket}", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def modify_pending_order(ticket: int, request: PendingOrderModifyRequest, user: dict = Depends(verify_token)):
+    """Change price, stop-limit price, SL/TP or expiration of a pending order (TRADE_ACTION_MODIFY)"""
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    def modify():
+        orders = mt5_remote.orders(mt5, ticket=ticket)
+        if not orders:
+            raise HTTPException(status_code=404, detail="Order not found")
+        order = orders[0]
+        
+        # MODIFY replaces every field, so unchanged ones are sent as they are
+        trade_request = {
+            "action": get_mt5_const("TRADE_ACTION_MODIFY"),
+            "order": order.ticket,
+            "symbol": order.symbol,
+            "price": float(request.price if request.price is not None else order.price_open),
+            "stoplimit": float(request.stop_limit_price if request.stop_limit_price is not None else order.price_stoplimit or 0),
+            "sl": float(request.stop_loss if request.stop_loss is not None else order.sl or 0),
+            "tp": float(request.take_profit if request.take_profit is not None else order.tp or 0),
+        }
+        if request.expiration is not None:
+            trade_request.update(_expiration_fields(request.expiration))
+        elif order.time_expiration:
+            trade_request.update(type_time=order.type_time, expiration=int(order.time_expiration))
+        else:
+            trade_request.update(_expiration_fields(None))
+        
+        order_pipeline.send(mt5, trade_request, None, purpose="modify orders", failure="Modify failed")
+        order_book.invalidate(mt5, account.login)
+        logger.info("Pending order %s modified: price=%s sl=%s tp=%s", order.ticket, trade_request["price"], trade_request["sl"], trade_request["tp"])
+        
+        return {
+            "success": True,
+            "ticket": order.ticket,
+            "price": trade_request["price"],
+            "stop_limit_price": trade_request["stoplimit"] or None,
+            "stop_loss": trade_request["sl"] or None,
+            "take_profit": trade_request["tp"] or None,
+            "expiration": trade_request.get("expiration"),
         }
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, modify)
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/api/v1/orders/{ticket}", dependencies=[Depends(idempotency_key), rate_limit(mt5_lanes.TRADING)])
+@mt5_lanes.lane(mt5_lanes.TRADING)
+async def cancel_pending_order(ticket: int, user: dict = Depends(verify_token)):
+    """Cancel a pending order (TRADE_ACTION_REMOVE)"""
+    mt5 = get_mt5()
+    account = await _require_account(user["user_id"])
+    
+    def cancel():
+        order_pipeline.send(mt5, {
+            "action": get_mt5_const("TRADE_ACTION_REMOVE"),
+            "order": ticket,
+        }, None, purpose="cancel orders", failure="Cancel failed")
+        order_book.invalidate(mt5, account.login)
+        logger.info("Pending order %s cancelled", ticket)
+        return {"success": True, "cancelled_ticket": ticket}
+    
+    try:
+        return await _in_session(user["user_id"], account, mt5, cancel)
     except HTTPException:
         raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
 # ============ SYMBOLS ============
 
-@app.get("/api/v1/symbols")
+def _read_symbols(mt5) -> List[Dict[str, Any]]:
+    symbols = mt5_remote.symbols(mt5)
+    if symbols is None:
+        return []
+    return [{
+        "name": s.name,
+        "description": s.description,
+        "currency_base": s.currency_base,
+        "currency_profit": s.currency_profit,
+        "digits": s.digits,
+        "spread": s.spread,
+        "volume_min": float(s.volume_min),
+        "volume_max": float(s.volume_max)
+    } for s in symbols]
+
+
+@app.get("/api/v1/symbols", dependencies=[rate_limit(mt5_lanes.BULK, verify_token_or_service_role)])
+@mt5_lanes.lane(mt5_lanes.BULK)
 async def get_symbols(
     request: Request = None,
     auth: dict = Depends(verify_token_or_service_role)
@@ -1597,37 +2253,25 @@ async def get_symbols(
     - Service role key via X-Service-Key header (backend auto-resume) - no user account needed
     """
     mt5 = get_mt5()
+    account = None
     
     # If service role, skip account requirement (symbols list is public)
     if auth.get("service_role"):
         if not MT5_AVAILABLE:
             raise HTTPException(status_code=503, detail="MT5 not available")
-        if not mt5.initialize():
+        if not await asyncio.to_thread(mt5.initialize):
             logger.warning("MT5 initialize() returned False for service role request")
     else:
         # Normal user request - require account
-        account = _require_account(auth["user_id"])
-        _ensure_account_session(auth["user_id"], account, mt5)
+        account = await _require_account(auth["user_id"])
     
     try:
-        symbols = mt5.symbols_get()
-        
-        if symbols is None:
-            return {"symbols": []}
-        
-        result = [{
-            "name": s.name,
-            "description": s.description,
-            "currency_base": s.currency_base,
-            "currency_profit": s.currency_profit,
-            "digits": s.digits,
-            "spread": s.spread,
-            "volume_min": float(s.volume_min),
-            "volume_max": float(s.volume_max)
-        } for s in symbols]
-        
-        return {"symbols": result}
+        symbols = await _shared_read("symbols_get", (), auth.get("user_id"), account, mt5, _read_symbols, mt5)
+        return {"symbols": symbols}
+    except HTTPException:
+        raise
     except Exception as e:
+        account_switcher.invalidate_current_login()
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,19 +1,24 @@
 """
 Supabase-backed MT5 account storage utilities.
 
+Account rows are read and written with the async PostgREST client, so the
+endpoints await them instead of blocking the event loop. Writes return
+the affected row (``return=representation``) rather than reading it back.
+
 Passwords are encrypted/decrypted via Supabase RPC functions that already
 exist in the backend (handled outside this service). This module simply
 invokes those RPCs and never implements crypto locally.
 """
 
+import asyncio
 import logging
-import os
 from typing import Any, Dict, Optional
 
-import httpx
 from fastapi import HTTPException, status
+from postgrest.types import ReturnMethod
 
-from database.supabase_client import get_supabase_client
+from database.supabase_client import get_async_postgrest_client, get_supabase_client
+from services import encryption_client, metrics, request_timing
 from models.account_models import (
     AccountConnectRequest,
     AccountResponse,
@@ -27,8 +32,8 @@ MT5_ACCOUNTS_TABLE = "mt5_accounts"
 ENCRYPT_RPC = "encrypt_password"
 DECRYPT_RPC = "decrypt_password"
 
-BACKEND_API_BASE = os.getenv("TRAINFLOW_BACKEND_URL", "").rstrip("/")
-ENCRYPTION_SERVICE_KEY = os.getenv("TRAINFLOW_SERVICE_KEY")
+BACKEND_API_BASE = encryption_client.BACKEND_API_BASE
+ENCRYPTION_SERVICE_KEY = encryption_client.SERVICE_KEY
 
 
 def _require_supabase():
@@ -41,6 +46,7 @@ def _require_supabase():
     return client
 
 
+@metrics.observe_dependency("supabase", "rpc")
 def _run_rpc(function: str, payload: Dict[str, Any]) -> Optional[str]:
     client = _require_supabase()
     try:
@@ -61,88 +67,17 @@ def _run_rpc(function: str, payload: Dict[str, Any]) -> Optional[str]:
         return None
 
 
-def _call_encryption_service(path: str, payload: Dict[str, Any], retries: int = 2) -> Optional[str]:
-    if not BACKEND_API_BASE or not ENCRYPTION_SERVICE_KEY:
-        logger.debug("Encryption service not configured: BACKEND_API_BASE=%s, ENCRYPTION_SERVICE_KEY=%s", 
-                    bool(BACKEND_API_BASE), bool(ENCRYPTION_SERVICE_KEY))
-        return None
-    url = f"{BACKEND_API_BASE}/api/v1/accounts/{path}"
-    
-    # Render free tier can take 30-60s to cold start, so use longer timeout
-    timeout = 60.0
-    
-    for attempt in range(retries + 1):
-        try:
-            if attempt > 0:
-                logger.info(f"Retrying encryption service call (attempt {attempt + 1}/{retries + 1}): {url}")
-            else:
-                logger.debug("Calling encryption service: %s", url)
-            
-            response = httpx.post(
-                url,
-                json=payload,
-                headers={"X-Service-Key": ENCRYPTION_SERVICE_KEY},
-                timeout=timeout,
-            )
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get("encrypted") if path == "encrypt" else data.get("password")
-                if result:
-                    logger.debug("Encryption service returned result")
-                    return result
-                else:
-                    logger.warning("Encryption service returned 200 but no result in response: %s", data)
-            elif response.status_code == 503:
-                # Backend might be starting up, wait and retry
-                if attempt < retries:
-                    wait_time = (attempt + 1) * 5
-                    logger.info(f"Backend service unavailable (503), waiting {wait_time}s before retry...")
-                    import time
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    logger.error("Encryption service unavailable after retries: %s", url)
-            else:
-                logger.warning("Encryption service responded with %s: %s", response.status_code, response.text[:500])
-        except httpx.TimeoutException:
-            if attempt < retries:
-                wait_time = (attempt + 1) * 5
-                logger.warning(f"Encryption service request timed out after {timeout}s, waiting {wait_time}s before retry...")
-                import time
-                time.sleep(wait_time)
-                continue
-            else:
-                logger.error(f"Encryption service request timed out after {timeout}s (final attempt): {url}")
-        except httpx.ConnectError as exc:
-            if attempt < retries:
-                wait_time = (attempt + 1) * 5
-                logger.warning(f"Encryption service connection failed, waiting {wait_time}s before retry: {exc}")
-                import time
-                time.sleep(wait_time)
-                continue
-            else:
-                logger.error("Encryption service connection failed: %s - Is the backend running at %s?", exc, BACKEND_API_BASE)
-        except Exception as exc:
-            logger.error("Encryption service request failed: %s", exc, exc_info=True)
-            if attempt < retries:
-                import time
-                time.sleep((attempt + 1) * 2)
-                continue
-    
-    return None
-
-
-def encrypt_password(password: str) -> str:
+async def encrypt_password(password: str) -> str:
     if not password:
         raise HTTPException(status_code=400, detail="Password is required")
 
     # Try backend encryption service first
-    encrypted = _call_encryption_service("encrypt", {"password": password})
+    encrypted = await encryption_client.acall("encrypt", {"password": password})
     if encrypted:
         return encrypted
 
     # Try Supabase RPC
-    encrypted = _run_rpc(ENCRYPT_RPC, {"password": password})
+    encrypted = await asyncio.to_thread(_run_rpc, ENCRYPT_RPC, {"password": password})
     if encrypted:
         return encrypted
 
@@ -162,16 +97,20 @@ def encrypt_password(password: str) -> str:
     )
 
 
+@request_timing.timed("decrypt")
 def decrypt_password(encrypted: str) -> str:
+    """Blocking (network calls with retries): call it from a worker thread, never the event loop."""
     if not encrypted:
         raise HTTPException(status_code=400, detail="Encrypted value is required")
 
     # Try backend encryption service first
-    if BACKEND_API_BASE and ENCRYPTION_SERVICE_KEY:
-        logger.info(f"Attempting to decrypt via backend service: {BACKEND_API_BASE}")
-        decrypted = _call_encryption_service("decrypt", {"encrypted": encrypted})
+    if encryption_client.is_open():
+        logger.info("Backend encryption service is failing, skipped until its cooldown ends")
+    elif BACKEND_API_BASE and ENCRYPTION_SERVICE_KEY:
+        logger.debug("Attempting to decrypt via backend service: %s", BACKEND_API_BASE)
+        decrypted = encryption_client.call("decrypt", {"encrypted": encrypted})
         if decrypted:
-            logger.info("Successfully decrypted via backend service")
+            logger.debug("Successfully decrypted via backend service")
             return decrypted
         logger.warning("Backend encryption service failed or returned no result")
     else:
@@ -210,13 +149,39 @@ def _map_account(row: Dict[str, Any]) -> AccountResponse:
     return AccountResponse(**row)
 
 
-def create_or_update_account(user_id: str, payload: AccountConnectRequest) -> AccountResponse:
+def _require_async_supabase():
+    client = get_async_postgrest_client()
+    if not client:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Supabase client not configured on MT5 bridge",
+        )
+    return client
+
+
+async def _reset_other_defaults(client, user_id: str, account_id: str):
+    """Ensure only one default account per user."""
+    try:
+        await (
+            client.table(MT5_ACCOUNTS_TABLE)
+            .update({"is_default": False}, returning=ReturnMethod.minimal)
+            .eq("user_id", user_id)
+            .neq("id", account_id)
+            .execute()
+        )
+    except Exception as exc:
+        logger.warning("Failed to reset default flag on other accounts: %s", exc)
+
+
+@metrics.observe_dependency("supabase")
+async def create_or_update_account(user_id: str, payload: AccountConnectRequest) -> AccountResponse:
     """
     Upsert account for the user. If account with same login/server exists,
-    update metadata and password; otherwise insert new record.
+    update metadata and password; otherwise insert new record. The upsert
+    returns the stored row (``return=representation``), so no read-back.
     """
-    client = _require_supabase()
-    encrypted_password = encrypt_password(payload.password)
+    client = _require_async_supabase()
+    encrypted_password = await encrypt_password(payload.password)
 
     data = {
         "user_id": user_id,
@@ -234,46 +199,27 @@ def create_or_update_account(user_id: str, payload: AccountConnectRequest) -> Ac
         data["risk_limits"] = payload.risk_limits
 
     try:
-        (
+        response = await (
             client.table(MT5_ACCOUNTS_TABLE)
-            .upsert(data, on_conflict="user_id,login,server")
-            .execute()
-        )
-
-        response = (
-            client.table(MT5_ACCOUNTS_TABLE)
-            .select("*")
-            .eq("user_id", user_id)
-            .eq("login", payload.login)
-            .eq("server", payload.server)
-            .single()
+            .upsert(data, on_conflict="user_id,login,server", returning=ReturnMethod.representation)
             .execute()
         )
-        row = response.data
+        row = response.data[0]
     except Exception as exc:
         logger.error("Failed to store MT5 account: %s", exc)
         raise HTTPException(status_code=500, detail="Failed to store MT5 account")
 
-    # Ensure only one default account per user
     if payload.set_as_default:
-        try:
-            (
-                client.table(MT5_ACCOUNTS_TABLE)
-                .update({"is_default": False})
-                .eq("user_id", user_id)
-                .neq("id", row["id"])
-                .execute()
-            )
-        except Exception as exc:
-            logger.warning("Failed to reset other default accounts: %s", exc)
+        await _reset_other_defaults(client, user_id, row["id"])
 
     return _map_account(row)
 
 
-def list_accounts(user_id: str):
-    client = _require_supabase()
+@metrics.observe_dependency("supabase")
+async def list_accounts(user_id: str):
+    client = _require_async_supabase()
     try:
-        response = (
+        response = await (
             client.table(MT5_ACCOUNTS_TABLE)
             .select("*")
             .eq("user_id", user_id)
@@ -287,10 +233,11 @@ def list_accounts(user_id: str):
         raise HTTPException(status_code=500, detail="Failed to list accounts")
 
 
-def get_account(user_id: str, account_id: str) -> AccountResponse:
-    client = _require_supabase()
+@metrics.observe_dependency("supabase")
+async def get_account(user_id: str, account_id: str) -> AccountResponse:
+    client = _require_async_supabase()
     try:
-        response = (
+        response = await (
             client.table(MT5_ACCOUNTS_TABLE)
             .select("*")
             .eq("user_id", user_id)
@@ -308,8 +255,9 @@ def get_account(user_id: str, account_id: str) -> AccountResponse:
         raise HTTPException(status_code=500, detail="Failed to fetch account")
 
 
-def update_account(user_id: str, account_id: str, payload: AccountUpdateRequest) -> AccountResponse:
-    client = _require_supabase()
+@metrics.observe_dependency("supabase")
+async def update_account(user_id: str, account_id: str, payload: AccountUpdateRequest) -> AccountResponse:
+    client = _require_async_supabase()
     updates: Dict[str, Any] = {}
     if payload.account_name is not None:
         updates["account_name"] = payload.account_name
@@ -325,44 +273,37 @@ def update_account(user_id: str, account_id: str, payload: AccountUpdateRequest)
         updates["is_default"] = payload.is_default
 
     if not updates:
-        return get_account(user_id, account_id)
+        return await get_account(user_id, account_id)
 
     try:
-        response = (
+        # The updated row comes back in the same round trip (return=representation)
+        response = await (
             client.table(MT5_ACCOUNTS_TABLE)
-            .update(updates)
+            .update(updates, returning=ReturnMethod.representation)
             .eq("user_id", user_id)
             .eq("id", account_id)
-            .select("*")
-            .single()
             .execute()
         )
-        row = response.data
     except Exception as exc:
         logger.error("Failed to update account: %s", exc)
         raise HTTPException(status_code=500, detail="Failed to update account")
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Account not found")
+    row = response.data[0]
 
     if payload.is_default:
-        try:
-            (
-                client.table(MT5_ACCOUNTS_TABLE)
-                .update({"is_default": False})
-                .eq("user_id", user_id)
-                .neq("id", account_id)
-                .execute()
-            )
-        except Exception as exc:
-            logger.warning("Failed to reset default flag on other accounts: %s", exc)
+        await _reset_other_defaults(client, user_id, account_id)
 
     return _map_account(row)
 
 
-def delete_account(user_id: str, account_id: str):
-    client = _require_supabase()
+@metrics.observe_dependency("supabase")
+async def delete_account(user_id: str, account_id: str):
+    client = _require_async_supabase()
     try:
-        (
+        await (
             client.table(MT5_ACCOUNTS_TABLE)
-            .update({"is_active": False, "is_default": False})
+            .update({"is_active": False, "is_default": False}, returning=ReturnMethod.minimal)
             .eq("user_id", user_id)
             .eq("id", account_id)
             .execute()
@@ -372,10 +313,11 @@ def delete_account(user_id: str, account_id: str):
         raise HTTPException(status_code=500, detail="Failed to delete account")
 
 
-def get_default_account(user_id: str) -> Optional[AccountResponse]:
-    client = _require_supabase()
+@metrics.observe_dependency("supabase")
+async def get_default_account(user_id: str) -> Optional[AccountResponse]:
+    client = _require_async_supabase()
     try:
-        response = (
+        response = await (
             client.table(MT5_ACCOUNTS_TABLE)
             .select("*")
             .eq("user_id", user_id)
@@ -389,4 +331,3 @@ def get_default_account(user_id: str) -> Optional[AccountResponse]:
         return _map_account(response.data)
     except Exception:
         return None
-
@@ -1,16 +1,88 @@
 import logging
 import threading
-from typing import Dict, Optional
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TypeVar
 
 from fastapi import HTTPException, status
 
+from services import metrics, mt5_remote, request_timing, tracing
 from services.account_manager import decrypt_password
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+class _SessionGate:
+    """
+    Shared while terminal work for the logged-in account runs (in worker
+    threads), exclusive for logins, so work never straddles an account
+    switch. Waiting logins block new shared holders, so a steady stream of
+    requests can't starve them. A login is downgraded to shared when it is
+    done, so the request that switched accounts gets its work in before
+    anyone can switch away again.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_shared(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_shared(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_exclusive(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def release_exclusive(self, downgrade: bool = False):
+        """Release the exclusive hold; with ``downgrade``, keep a shared one."""
+        with self._cond:
+            self._writing = False
+            if downgrade:
+                self._readers += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+
+
+_GATE = _SessionGate()
+
+# Guards the state below. Held only for bookkeeping, never across a
+# terminal or network call, so taking it from the event loop is cheap.
 _LOCK = threading.Lock()
 _ACTIVE_ACCOUNT_BY_USER: Dict[str, str] = {}
+# Login the terminal is believed to be on. Trusted by session() so the
+# common case (same account as the last request) needs no RPyC call.
+# Changes only under the gate's exclusive hold, except for being cleared
+# on MT5 errors; re-verified by the background heartbeat.
 _CURRENT_LOGIN: Optional[str] = None
+# Last account successfully logged in, replayed after a terminal reconnect.
+_LAST_ACCOUNT: Optional[dict] = None
+# Bumped whenever _CURRENT_LOGIN changes or is cleared, so lock-free work
+# (run_for_current_account) can tell whether the account moved under it.
+_SESSION_EPOCH = 0
 
 
 def get_active_account_id(user_id: str) -> Optional[str]:
@@ -23,67 +95,253 @@ def set_active_account_id(user_id: str, account_id: str):
         _ACTIVE_ACCOUNT_BY_USER[user_id] = account_id
 
 
-def ensure_account_session(
-    user_id: str,
-    account: dict,
-    mt5_module,
-):
+def get_current_login() -> Optional[str]:
+    return _CURRENT_LOGIN
+
+
+def set_current_login(login) -> None:
+    """Record a login performed outside session() (e.g. /accounts/connect)."""
+    with _LOCK:
+        _set_login_locked(str(login) if login is not None else None)
+
+
+def _set_login_locked(login: Optional[str]) -> None:
+    global _CURRENT_LOGIN, _SESSION_EPOCH
+    if login != _CURRENT_LOGIN or login is None:
+        _SESSION_EPOCH += 1
+    _CURRENT_LOGIN = login
+
+
+def invalidate_current_login() -> None:
     """
-    Ensure the MT5 terminal is logged into the desired account.
-    Performs a login if necessary and caches the active account per user.
+    Forget the cached terminal login. Called whenever an MT5 call fails so
+    the next request probes the terminal instead of trusting stale state.
     """
-    global _CURRENT_LOGIN
+    if _CURRENT_LOGIN is not None:
+        logger.debug("Invalidating cached MT5 login %s", _CURRENT_LOGIN)
+    with _LOCK:
+        _set_login_locked(None)
 
+
+def verify_current_login(mt5_module) -> Optional[str]:
+    """
+    Heartbeat probe: ask the terminal which account is logged in and
+    reconcile the cached login with it. Returns the verified login.
+    """
+    # Probe under the gate so a concurrent login can't be overwritten
+    # with the account the terminal was on before it switched.
+    with _GATE.shared():
+        try:
+            info = mt5_remote.account_info(mt5_module)
+        except Exception as exc:
+            logger.warning("MT5 login heartbeat failed: %s", exc)
+            invalidate_current_login()
+            return None
+
+        actual = str(info.login) if info else None
+        with _LOCK:
+            if _CURRENT_LOGIN is not None and _CURRENT_LOGIN != actual:
+                logger.warning(
+                    "MT5 terminal login changed underneath the bridge (cached=%s, actual=%s)",
+                    _CURRENT_LOGIN,
+                    actual,
+                )
+            _set_login_locked(actual)
+    return actual
+
+
+def run_for_current_account(function: Callable[[dict], T]) -> Optional[T]:
+    """
+    Call ``function(account)`` for the account the terminal is logged into,
+    without holding any lock across it (background work waits in the BULK
+    lane and must not stall logins). Returns None, discarding the result,
+    if the current account isn't known or the login changed (or was
+    invalidated) while the function ran.
+    """
+    with _LOCK:
+        account = _LAST_ACCOUNT
+        epoch = _SESSION_EPOCH
+        if account is None or _CURRENT_LOGIN != str(account["login"]):
+            return None
+    result = function(account)
+    with _LOCK:
+        if _SESSION_EPOCH != epoch:
+            return None
+    return result
+
+
+@contextmanager
+def session(user_id: str, account: dict, mt5_module):
+    """
+    Hold the terminal on ``account`` for the block, logging in first if
+    necessary. Meant for worker threads: it blocks while another account's
+    work drains. Work for the same account runs concurrently; a login for a
+    different account waits until every holder has left.
+    """
     if not mt5_module:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="MT5 module not initialized",
         )
 
-    desired_login = str(account["login"])
-    server = account["server"]
-    encrypted_password = account.get("encrypted_password")
-    password = decrypt_password(encrypted_password) if encrypted_password else None
+    with request_timing.span("session"), tracing.span("ensure_account_session"):
+        _GATE.acquire_shared()
+        if _CURRENT_LOGIN == str(account["login"]):
+            metrics.cache_hit("login_session")
+        else:
+            _GATE.release_shared()
+            metrics.cache_miss("login_session")
+            _switch(mt5_module, account)
+    try:
+        set_active_account_id(user_id, account["id"])
+        yield
+    finally:
+        _GATE.release_shared()
 
-    with _LOCK:
-        info = None
+
+def run_as(user_id: str, account: Optional[dict], mt5_module, function: Callable[..., T], *args) -> T:
+    """
+    ``function(*args)`` with the terminal on ``account`` for the whole call
+    (see session); with no account, just while no login is in progress.
+    """
+    if account is None:
+        with _GATE.shared():
+            return function(*args)
+    with session(user_id, account, mt5_module):
+        return function(*args)
+
+
+def ensure_account_session(user_id: str, account: dict, mt5_module):
+    """
+    Ensure the MT5 terminal is logged into the desired account and cache it
+    as the user's active account. Nothing stops another request from
+    switching away right after; use session() to keep the account.
+    """
+    with session(user_id, account, mt5_module):
+        pass
+
+
+@contextmanager
+def exclusive_login():
+    """Hold off all session work during a login made outside session() (e.g. /accounts/connect)."""
+    _GATE.acquire_exclusive()
+    try:
+        yield
+    finally:
+        _GATE.release_exclusive()
+
+
+def _switch(mt5_module, account: dict):
+    """
+    Put the terminal on ``account``; returns holding the gate shared. The
+    password is decrypted only once a login turns out to be needed, and
+    without holding the gate (the encryption service can be slow).
+    """
+    password = None
+    while True:
+        _GATE.acquire_exclusive()
         try:
-            info = mt5_module.account_info()
+            ready = _switch_locked(mt5_module, account, password)
+        except BaseException:
+            _GATE.release_exclusive()
+            raise
+        if ready:
+            _GATE.release_exclusive(downgrade=True)
+            return
+        _GATE.release_exclusive()
+        password = _password(account)
+
+
+def _switch_locked(mt5_module, account: dict, password: Optional[str]) -> bool:
+    """
+    With the gate held exclusively: True once the terminal is on
+    ``account``, False if that needs a login and ``password`` is missing.
+    """
+    global _LAST_ACCOUNT
+
+    desired_login = str(account["login"])
+    if _CURRENT_LOGIN is None:
+        # Cold start or invalidated: confirm with the terminal before
+        # paying for a full login.
+        try:
+            info = mt5_remote.account_info(mt5_module)
         except Exception as exc:
             logger.warning("Failed to fetch MT5 account info: %s", exc)
+            info = None
+        set_current_login(info.login if info else None)
+
+    if _CURRENT_LOGIN != desired_login:
+        if password is None:
+            return False
+        _login_locked(mt5_module, account, password)
+    with _LOCK:
+        _LAST_ACCOUNT = account
+    return True
 
-        if info and str(info.login) == desired_login:
-            _CURRENT_LOGIN = desired_login
-            _ACTIVE_ACCOUNT_BY_USER[user_id] = account["id"]
-            return
 
-        if not hasattr(mt5_module, "login"):
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="MT5 library does not support programmatic login on this platform",
-            )
+def _password(account: dict) -> str:
+    encrypted_password = account.get("encrypted_password")
+    password = decrypt_password(encrypted_password) if encrypted_password else None
+    if not password:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Stored account is missing credentials",
+        )
+    return password
 
-        if not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Stored account is missing credentials",
-            )
 
-        logger.info("Switching MT5 session to account %s (%s)", desired_login, server)
+def _login_locked(mt5_module, account: dict, password: str):
+    """Log the terminal into ``account``. Caller must hold the gate exclusively."""
+    desired_login = str(account["login"])
+    server = account["server"]
+
+    if not hasattr(mt5_module, "login"):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="MT5 library does not support programmatic login on this platform",
+        )
+
+    logger.info("Switching MT5 session to account %s (%s)", desired_login, server)
+    # The terminal's state is unknown until login() returns successfully
+    invalidate_current_login()
+    started = time.perf_counter()
+    try:
         authorized = mt5_module.login(
             login=int(desired_login),
             password=password,
             server=server,
         )
-        if not authorized:
-            error = getattr(mt5_module, "last_error", lambda: "Unknown error")()
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"MT5 login failed: {error}",
-            )
+    except Exception:
+        metrics.LOGINS.inc("error")
+        raise
+    finally:
+        metrics.LOGIN_SECONDS.observe(time.perf_counter() - started)
+    metrics.LOGINS.inc("success" if authorized else "rejected")
+    if not authorized:
+        error = getattr(mt5_module, "last_error", lambda: "Unknown error")()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"MT5 login failed: {error}",
+        )
+    set_current_login(desired_login)
+
 
-        _CURRENT_LOGIN = desired_login
-        _ACTIVE_ACCOUNT_BY_USER[user_id] = account["id"]
+def restore_last_session(mt5_module):
+    """
+    Re-login the last used account on a freshly (re)connected terminal.
+    Falls back to asking the terminal which account it is on.
+    """
+    with _LOCK:
+        account = _LAST_ACCOUNT
+    if account is None:
+        verify_current_login(mt5_module)
+        return
+
+    # The old connection's login says nothing about the new one
+    invalidate_current_login()
+    _switch(mt5_module, account)
+    _GATE.release_shared()
+    logger.info("Restored MT5 session for account %s after reconnect", account["login"])
 
 
 def clear_account_cache(account_id: str):
@@ -91,4 +349,3 @@ def clear_account_cache(account_id: str):
         to_remove = [user for user, acct in _ACTIVE_ACCOUNT_BY_USER.items() if acct == account_id]
         for user in to_remove:
             _ACTIVE_ACCOUNT_BY_USER.pop(user, None)
-
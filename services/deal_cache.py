@@ -0,0 +1,250 @@
+"""
+Incremental per-account cache of closed trades built from MT5 deal history.
+
+``GET /api/v1/trades/history`` used to download every deal in the requested
+window on each call. Here each account (trade server + login) keeps:
+
+- the deals seen so far, paired into trades by position (entry + last exit);
+- the trades in a list sorted by ``(exit_time, ticket)``;
+- the time range already downloaded.
+
+A request only fetches deals newer than the newest one seen (plus a short
+overlap, deduplicated by deal ticket), and older history only when the
+requested range reaches further back than what is cached. Pages are then
+cut from the sorted list with bisect, so a page costs O(log n + page size)
+no matter how much history the account has.
+
+Cursors are ``"<exit_time>:<ticket>"`` strings as returned in
+``next_cursor``/``prev_cursor``; ISO datetimes and bare position tickets
+are accepted too.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from services import metrics, mt5_remote
+
+MAX_ACCOUNTS = int(os.getenv("MT5_HISTORY_CACHE_ACCOUNTS", "32"))
+# Re-read this much history before the newest cached deal on each refresh
+OVERLAP_SECONDS = 60
+# Deal times are trade-server time, which can run hours ahead of UTC
+FUTURE_SLACK_SECONDS = 86400
+
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_OUT_BY = 3
+ORDER_TYPE_BUY = 0
+
+_MAX_TICKET = 2 ** 63
+
+Key = Tuple[int, int]
+
+
+class AccountHistory:
+    """Deals and paired trades of one account."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deal_tickets = set()
+        self.entries: Dict[int, Any] = {}
+        self.exits: Dict[int, Any] = {}
+        self.trades: Dict[int, Dict[str, Any]] = {}
+        self.keys: List[Key] = []
+        self.covered_from: Optional[int] = None
+        self.newest_deal_time: Optional[int] = None
+
+    def add(self, deals):
+        for deal in deals:
+            if deal.ticket in self.deal_tickets:
+                continue
+            self.deal_tickets.add(deal.ticket)
+            if self.newest_deal_time is None or deal.time > self.newest_deal_time:
+                self.newest_deal_time = deal.time
+            position_id = deal.position_id
+            if deal.entry == DEAL_ENTRY_IN:
+                self.entries[position_id] = deal
+            elif deal.entry in (DEAL_ENTRY_OUT, DEAL_ENTRY_OUT_BY):
+                previous = self.exits.get(position_id)
+                if previous is not None and previous.ticket > deal.ticket:
+                    continue  # backfill found an earlier partial close
+                self.exits[position_id] = deal
+            else:
+                continue
+            if position_id in self.entries and position_id in self.exits:
+                self._set_trade(position_id)
+
+    def _set_trade(self, position_id: int):
+        old = self.trades.get(position_id)
+        if old is not None:
+            index = bisect_left(self.keys, (old["_exit_ts"], position_id))
+            if index < len(self.keys) and self.keys[index] == (old["_exit_ts"], position_id):
+                del self.keys[index]
+        trade = _build_trade(position_id, self.entries[position_id], self.exits[position_id])
+        self.trades[position_id] = trade
+        insort(self.keys, (trade["_exit_ts"], position_id))
+
+    def key_of(self, position_id: int) -> Optional[Key]:
+        trade = self.trades.get(position_id)
+        return (trade["_exit_ts"], position_id) if trade else None
+
+
+def _build_trade(position_id: int, entry_deal, exit_deal) -> Dict[str, Any]:
+    trade_type = "buy" if entry_deal.type == ORDER_TYPE_BUY else "sell"
+    entry_price = float(entry_deal.price)
+    exit_price = float(exit_deal.price)
+    pnl_percent = 0.0
+    if entry_price > 0:
+        if trade_type == "buy":
+            pnl_percent = ((exit_price - entry_price) / entry_price) * 100
+        else:
+            pnl_percent = ((entry_price - exit_price) / entry_price) * 100
+    return {
+        "ticket": position_id,
+        "symbol": exit_deal.symbol,
+        "type": trade_type,
+        "volume": float(exit_deal.volume),
+        "entry_price": entry_price,
+        "exit_price": exit_price,
+        "pnl": float(exit_deal.profit),
+        "pnl_percent": pnl_percent,
+        "entry_time": datetime.fromtimestamp(entry_deal.time).isoformat(),
+        "exit_time": datetime.fromtimestamp(exit_deal.time).isoformat(),
+        "commission": float(exit_deal.commission or 0),
+        "swap": float(exit_deal.swap or 0),
+        "_exit_ts": int(exit_deal.time),
+    }
+
+
+_LOCK = threading.Lock()
+# Keyed by (server, login): the same login number can exist on two servers
+_ACCOUNTS: "OrderedDict[Tuple[str, str], AccountHistory]" = OrderedDict()
+
+
+def _history(server: str, login: str) -> AccountHistory:
+    key = (str(server), str(login))
+    with _LOCK:
+        history = _ACCOUNTS.get(key)
+        if history is None:
+            history = _ACCOUNTS[key] = AccountHistory()
+            while len(_ACCOUNTS) > MAX_ACCOUNTS:
+                _ACCOUNTS.popitem(last=False)
+        else:
+            _ACCOUNTS.move_to_end(key)
+        return history
+
+
+def _fetch(terminal, date_from: int, date_to: int) -> List[Any]:
+    deals = mt5_remote.deals_range(terminal, date_from, date_to)
+    if deals is None:
+        # An error, not an empty range: the window must not count as covered
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Deal history not available from MT5")
+    return deals
+
+
+def _sync(terminal, history: AccountHistory, start_ts: int):
+    """
+    Download what the cache is missing for a query starting at ``start_ts``.
+    The covered range only grows once the fetch for it has succeeded.
+    """
+    now = int(time.time())
+    if history.covered_from is None:
+        history.add(_fetch(terminal, start_ts, now + FUTURE_SLACK_SECONDS))
+        history.covered_from = start_ts
+        metrics.cache_miss("deal_history")
+        return
+    if start_ts < history.covered_from:
+        history.add(_fetch(terminal, start_ts, history.covered_from + OVERLAP_SECONDS))
+        history.covered_from = start_ts
+    newest = history.newest_deal_time if history.newest_deal_time is not None else history.covered_from
+    history.add(_fetch(terminal, newest - OVERLAP_SECONDS, now + FUTURE_SLACK_SECONDS))
+    metrics.cache_hit("deal_history")
+
+
+def parse_cursor(history: AccountHistory, cursor: Optional[str], upper: bool) -> Optional[Key]:
+    """
+    Resolve a cursor to a sort key. ``upper`` picks the bound a bare time
+    maps to (after the last trade at that second, or before the first).
+    """
+    if not cursor:
+        return None
+    timestamp, sep, ticket = cursor.partition(":")
+    try:
+        if sep and timestamp.isdigit():
+            return int(timestamp), int(ticket)
+        if cursor.isdigit():
+            key = history.key_of(int(cursor))
+            if key is None:
+                raise ValueError(f"Unknown trade ticket {cursor}")
+            return key
+        moment = int(datetime.fromisoformat(cursor.replace("Z", "+00:00")).timestamp())
+        return (moment, _MAX_TICKET) if upper else (moment, -1)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor {cursor!r}: {exc}")
+
+
+def _cursor(key: Key) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def trade_page(
+    terminal,
+    server: str,
+    login: str,
+    start_ts: int,
+    end_ts: int,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Closed trades with ``start_ts <= exit_time <= end_ts``, newest first,
+    at most ``limit``. ``before`` pages towards older trades, ``after``
+    towards newer ones.
+    """
+    history = _history(server, login)
+    with history.lock:
+        _sync(terminal, history, start_ts)
+        keys = history.keys
+        range_low = low = bisect_left(keys, (start_ts, -1))
+        range_high = high = bisect_right(keys, (end_ts, _MAX_TICKET))
+        before_key = parse_cursor(history, before, upper=False)
+        after_key = parse_cursor(history, after, upper=True)
+        if before_key is not None:
+            high = min(high, bisect_left(keys, before_key))
+        if after_key is not None:
+            low = max(low, bisect_right(keys, after_key))
+
+        if after_key is not None and before_key is None:
+            # Walking forward in time: the page nearest the cursor
+            page_keys = keys[low:min(high, low + limit)]
+            has_older, has_newer = low > range_low, low + limit < high
+        else:
+            page_keys = keys[max(low, high - limit):high]
+            has_older, has_newer = high - limit > low, high < range_high
+        page = [
+            {k: v for k, v in history.trades[position_id].items() if k != "_exit_ts"}
+            for _, position_id in reversed(page_keys)
+        ]
+
+    return {
+        "trades": page,
+        "count": len(page),
+        "next_cursor": _cursor(page_keys[0]) if page_keys and has_older else None,
+        "prev_cursor": _cursor(page_keys[-1]) if page_keys and has_newer else None,
+    }
+
+
+def invalidate(server: Optional[str] = None, login: Optional[str] = None):
+    """Drop the cached history of one account, or of all of them."""
+    with _LOCK:
+        if login is None:
+            _ACCOUNTS.clear()
+        else:
+            _ACCOUNTS.pop((str(server), str(login)), None)
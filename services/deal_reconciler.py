@@ -0,0 +1,270 @@
+"""
+Journals positions closed outside the bridge (SL/TP hits, stop-outs,
+manual closes in the terminal) by reading the terminal's deal history.
+
+Every ``MT5_DEAL_RECONCILE_SECONDS`` the reconciler pulls deals newer than a
+persisted high-water mark for the account the terminal is logged into,
+folds them into per-position state in one pass (entries add volume, exits
+take it away; partial closes accumulate) and queues a journal entry for
+each position whose volume reaches zero. Entries, the remaining open
+state and the new mark are written in one transaction on the journal
+outbox, so a crash can neither lose nor repeat a close. Positions closed
+through ``DELETE /api/v1/positions/{ticket}`` were journaled already and are
+skipped by the outbox's journaled-position check.
+
+The terminal only exposes the history of the logged-in account, so each
+account is reconciled while it is active; closes on other accounts are
+picked up the next time a request switches to them. State is kept per
+trade server and login, and a pass only runs when the terminal reports
+the server and login of the account row it will journal under (user and
+account ids come from that row). No session lock is held across the
+terminal calls: a pass that sees the login change under it is dropped
+without writing anything and simply runs again later.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services import account_switcher, journal_writer, metrics, mt5_lanes, mt5_remote
+from services.trade_journal_logger import build_deal_journal_entry
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_SECONDS = float(os.getenv("MT5_DEAL_RECONCILE_SECONDS", "60"))
+# First run for an account: look back this far for entries of still-open
+# positions, without journaling closes that predate the reconciler
+BOOTSTRAP_SECONDS = 7 * 86400
+# Re-read this much history before the mark; deals at or below the mark
+# ticket are ignored, so the overlap only guards against same-second deals
+OVERLAP_SECONDS = 60
+# Deal times are trade-server time, which can run hours ahead of UTC
+FUTURE_SLACK_SECONDS = 86400
+
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_INOUT = 2
+DEAL_ENTRY_OUT_BY = 3
+VOLUME_EPSILON = 1e-9
+
+RECONCILE_RUNS = metrics.counter(
+    "mt5_bridge_deal_reconciler_runs_total",
+    "Deal-history reconciliation passes, by result.",
+    ("result",),
+)
+RECONCILED_CLOSES = metrics.counter(
+    "mt5_bridge_deal_reconciler_closes_total",
+    "Closed positions found in deal history, by outcome (queued/already_journaled).",
+    ("outcome",),
+)
+
+_STOP = threading.Event()
+_thread: Optional[threading.Thread] = None
+_schema_ready = False
+
+
+def _ensure_schema(db):
+    global _schema_ready
+    if _schema_ready:
+        return
+    columns = [row[1] for row in db.execute("PRAGMA table_info(reconciler_marks)")]
+    if columns and "server" not in columns:
+        # Keyed by login alone before: start over, the next pass bootstraps
+        db.execute("DROP TABLE reconciler_marks")
+        db.execute("DROP TABLE IF EXISTS reconciler_positions")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS reconciler_marks ("
+        " server TEXT NOT NULL,"
+        " login TEXT NOT NULL,"
+        " last_time INTEGER NOT NULL,"
+        " last_ticket INTEGER NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " PRIMARY KEY (server, login))"
+    )
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS reconciler_positions ("
+        " server TEXT NOT NULL,"
+        " login TEXT NOT NULL,"
+        " position_id INTEGER NOT NULL,"
+        " state TEXT NOT NULL,"
+        " PRIMARY KEY (server, login, position_id))"
+    )
+    _schema_ready = True
+
+
+def _load(server: str, login: str) -> Tuple[Optional[Tuple[int, int]], Dict[int, Dict[str, Any]]]:
+    with journal_writer.transaction() as db:
+        _ensure_schema(db)
+        mark = db.execute(
+            "SELECT last_time, last_ticket FROM reconciler_marks WHERE server = ? AND login = ?", (server, login)
+        ).fetchone()
+        rows = db.execute(
+            "SELECT position_id, state FROM reconciler_positions WHERE server = ? AND login = ?", (server, login)
+        ).fetchall()
+    return mark, {position_id: json.loads(state) for position_id, state in rows}
+
+
+def _new_state(deal) -> Dict[str, Any]:
+    return {
+        "position_id": deal.position_id, "symbol": deal.symbol, "type": None,
+        "in_volume": 0.0, "in_value": 0.0, "out_volume": 0.0, "out_value": 0.0,
+        "profit": 0.0, "entry_time": deal.time, "exit_time": None, "exit_reason": None,
+    }
+
+
+def _apply(state: Dict[str, Any], deal):
+    volume = float(deal.volume)
+    if deal.entry == DEAL_ENTRY_IN:
+        if state["type"] is None:
+            state["type"] = deal.type
+            state["entry_time"] = deal.time
+        state["in_volume"] += volume
+        state["in_value"] += volume * float(deal.price)
+    else:
+        state["out_volume"] += volume
+        state["out_value"] += volume * float(deal.price)
+        state["profit"] += float(deal.profit)
+        state["exit_time"] = deal.time
+        state["exit_reason"] = getattr(deal, "reason", None)
+
+
+def _is_closed(state: Dict[str, Any]) -> bool:
+    return state["in_volume"] > 0 and state["out_volume"] >= state["in_volume"] - VOLUME_EPSILON
+
+
+def fold_deals(deals: List[Any], open_positions: Dict[int, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Apply ``deals`` (ascending tickets) to ``open_positions`` in place.
+    Returns the positions that closed, and ids of positions whose exits
+    arrived without any known entry.
+    """
+    closed = []
+    orphans = []
+    for deal in deals:
+        if not deal.position_id or deal.type not in (0, 1):
+            continue  # balance, credit, commission rows
+        state = open_positions.get(deal.position_id)
+        if state is None:
+            if deal.entry != DEAL_ENTRY_IN:
+                orphans.append(deal.position_id)
+                continue
+            state = open_positions[deal.position_id] = _new_state(deal)
+        _apply(state, deal)
+        if deal.entry != DEAL_ENTRY_IN and _is_closed(state):
+            closed.append(open_positions.pop(deal.position_id))
+    return closed, orphans
+
+
+def _fetch(terminal, account: dict):
+    """
+    State and new deals for ``account``, or None unless the terminal reports
+    being on that account's server and login (a login made outside a
+    session, e.g. /accounts/connect, leaves a stale account row behind).
+    """
+    server, login = str(account["server"]), str(account["login"])
+    info = mt5_remote.account_info(terminal)
+    if info is None or (str(info.server), str(info.login)) != (server, login):
+        return None
+    mark, open_positions = _load(server, login)
+    since = (mark[0] - OVERLAP_SECONDS) if mark else int(time.time()) - BOOTSTRAP_SECONDS
+    deals = mt5_remote.deals_range(terminal, since, int(time.time()) + FUTURE_SLACK_SECONDS) or []
+    return account, mark, open_positions, deals
+
+
+def reconcile(terminal) -> Optional[int]:
+    """
+    One pass for the account the terminal is on. Returns the number of
+    closes queued, or None if no known account is logged in.
+    """
+    fetched = account_switcher.run_for_current_account(lambda account: _fetch(terminal, account))
+    if fetched is None:
+        return None  # unknown account, or switched while fetching; next pass
+    account, mark, open_positions, deals = fetched
+    server, login = str(account["server"]), str(account["login"])
+
+    last_ticket = mark[1] if mark else 0
+    deals = sorted((deal for deal in deals if deal.ticket > last_ticket), key=lambda deal: deal.ticket)
+    if not deals and mark:
+        return 0
+
+    closed, orphans = fold_deals(deals, open_positions)
+    if orphans and mark:
+        # Entry predates what we have seen (bridge restarted with a fresh
+        # outbox, or position opened before the first pass): one lookup each
+        for position_id in dict.fromkeys(orphans):
+            history = account_switcher.run_for_current_account(
+                lambda _: mt5_remote.position_deals(terminal, position_id) or []
+            )
+            if history is None:
+                return None  # switched accounts mid-pass; nothing written, next pass
+            history = sorted((deal for deal in history if deal.ticket <= (deals[-1].ticket if deals else last_ticket)), key=lambda deal: deal.ticket)
+            state: Dict[int, Dict[str, Any]] = {}
+            done, _ = fold_deals(history, state)
+            closed.extend(done)
+            open_positions.update(state)
+
+    queued = 0
+    with journal_writer.transaction() as db:
+        _ensure_schema(db)
+        if mark:  # the first pass only learns open positions and sets the mark
+            for position in closed:
+                entry = build_deal_journal_entry(str(account["user_id"]), str(account["id"]), position)
+                if journal_writer.enqueue_in(db, entry) is None:
+                    RECONCILED_CLOSES.inc("already_journaled")
+                else:
+                    RECONCILED_CLOSES.inc("queued")
+                    queued += 1
+        db.execute("DELETE FROM reconciler_positions WHERE server = ? AND login = ?", (server, login))
+        db.executemany(
+            "INSERT INTO reconciler_positions (server, login, position_id, state) VALUES (?, ?, ?, ?)",
+            [(server, login, position_id, json.dumps(state)) for position_id, state in open_positions.items()],
+        )
+        if deals:
+            db.execute(
+                "INSERT OR REPLACE INTO reconciler_marks (server, login, last_time, last_ticket, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (server, login, max(deal.time for deal in deals), deals[-1].ticket, time.time()),
+            )
+        elif not mark:
+            db.execute(
+                "INSERT OR REPLACE INTO reconciler_marks (server, login, last_time, last_ticket, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (server, login, int(time.time()), 0, time.time()),
+            )
+    if queued:
+        logger.info("Journaled %s position(s) closed outside the bridge for account %s on %s", queued, login, server)
+    return queued
+
+
+def _run(get_terminal: Callable[[], Any]):
+    while not _STOP.wait(RECONCILE_SECONDS):
+        terminal = get_terminal()
+        if terminal is None:
+            continue
+        try:
+            # Background work: never ahead of a client request for a terminal slot
+            with mt5_lanes.use_lane(mt5_lanes.BULK):
+                result = reconcile(terminal)
+            RECONCILE_RUNS.inc("skipped" if result is None else "ok")
+        except Exception as exc:
+            RECONCILE_RUNS.inc("error")
+            logger.warning("Deal reconciliation failed: %s", exc)
+
+
+def start(get_terminal: Callable[[], Any]):
+    global _thread
+    if RECONCILE_SECONDS <= 0:
+        return
+    if _thread is None or not _thread.is_alive():
+        _STOP.clear()
+        _thread = threading.Thread(target=_run, args=(get_terminal,), name="deal-reconciler", daemon=True)
+        _thread.start()
+
+
+def stop():
+    global _thread
+    _STOP.set()
+    if _thread is not None:
+        _thread.join(5)
+        _thread = None
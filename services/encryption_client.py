@@ -0,0 +1,246 @@
+"""
+Client for the Trainflow backend's encryption service
+(``POST {TRAINFLOW_BACKEND_URL}/api/v1/accounts/{encrypt,decrypt}``).
+
+One ``httpx.AsyncClient`` with keep-alive (and HTTP/2 when the optional
+``h2`` package is installed) serves every call, so a warm call costs a
+request on an open connection instead of a TCP + TLS handshake. The
+client lives on a private event loop in a background thread. That way the
+same pool serves coroutines (``acall``) and the synchronous login path in
+services.account_switcher (``call``), which runs in worker threads and
+blocks until the answer arrives. Never use ``call`` on an event loop.
+
+Failed attempts are retried with jittered exponential backoff
+(``asyncio.sleep``, never blocking a caller's thread). After
+``MT5_ENCRYPTION_BREAKER_THRESHOLD`` consecutive failed calls the backend
+is skipped for ``MT5_ENCRYPTION_BREAKER_COOLDOWN`` seconds: calls return
+None at once and callers move on to their fallbacks. A whole call,
+retries included, is cut off after ``MT5_ENCRYPTION_CALL_TIMEOUT``
+seconds and counts as a failure. So does a 200 whose body is not the
+expected JSON object.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import importlib.util
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Coroutine, Dict, Optional
+
+import httpx
+
+from services import metrics, request_timing, tracing
+
+# httpx speaks HTTP/2 when the optional h2 package can be imported
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_API_BASE = os.getenv("TRAINFLOW_BACKEND_URL", "").rstrip("/")
+SERVICE_KEY = os.getenv("TRAINFLOW_SERVICE_KEY")
+
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("MT5_ENCRYPTION_CONNECT_TIMEOUT", "5"))
+# Render free tier can take 30-60s to cold start
+READ_TIMEOUT_SECONDS = float(os.getenv("MT5_ENCRYPTION_READ_TIMEOUT", "60"))
+RETRIES = int(os.getenv("MT5_ENCRYPTION_RETRIES", "2"))
+BACKOFF_INITIAL_SECONDS = float(os.getenv("MT5_ENCRYPTION_BACKOFF_INITIAL", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("MT5_ENCRYPTION_BACKOFF_MAX", "10"))
+BREAKER_THRESHOLD = int(os.getenv("MT5_ENCRYPTION_BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("MT5_ENCRYPTION_BREAKER_COOLDOWN", "60"))
+# Upper bound for a call including retries; past it callers fall back
+CALL_TIMEOUT_SECONDS = float(os.getenv("MT5_ENCRYPTION_CALL_TIMEOUT", "90"))
+USE_HTTP2 = HTTP2_AVAILABLE and os.getenv("MT5_ENCRYPTION_HTTP2", "1").lower() in ("1", "true", "yes")
+
+ENCRYPTION_BREAKER_OPEN = metrics.gauge(
+    "mt5_bridge_encryption_breaker_open",
+    "1 while the encryption service is skipped after repeated failures.",
+)
+
+_LOCK = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_client: Optional[httpx.AsyncClient] = None
+_consecutive_failures = 0
+_open_until = 0.0
+
+
+def is_configured() -> bool:
+    return bool(BACKEND_API_BASE and SERVICE_KEY)
+
+
+def is_open() -> bool:
+    """True while the breaker skips the backend."""
+    return _open_until > time.monotonic()
+
+
+def _record(ok: bool):
+    global _consecutive_failures, _open_until
+    with _LOCK:
+        if ok:
+            _consecutive_failures = 0
+            _open_until = 0.0
+            return
+        _consecutive_failures += 1
+        if _consecutive_failures >= BREAKER_THRESHOLD:
+            if not is_open():
+                logger.warning(
+                    "Encryption service failed %s times in a row; skipping it for %ss",
+                    _consecutive_failures, BREAKER_COOLDOWN_SECONDS,
+                )
+            _open_until = time.monotonic() + BREAKER_COOLDOWN_SECONDS
+
+
+def _backoff(attempt: int) -> float:
+    """Full jitter: uniform in [0, min(max, initial * 2**attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_INITIAL_SECONDS * (2 ** attempt)))
+
+
+def _ensure_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread, _client
+    with _LOCK:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="encryption-client", daemon=True)
+            thread.start()
+            _client = httpx.AsyncClient(
+                http2=USE_HTTP2,
+                timeout=httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                headers={"X-Service-Key": SERVICE_KEY or ""},
+            )
+            _loop, _thread = loop, thread
+        return _loop
+
+
+async def _post(path: str, payload: Dict[str, Any]) -> Optional[str]:
+    url = f"{BACKEND_API_BASE}/api/v1/accounts/{path}"
+    result_field = "encrypted" if path == "encrypt" else "password"
+
+    for attempt in range(RETRIES + 1):
+        if attempt:
+            delay = _backoff(attempt - 1)
+            logger.info("Retrying encryption service call in %.2fs (attempt %s/%s): %s", delay, attempt + 1, RETRIES + 1, url)
+            await asyncio.sleep(delay)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"encryption_service.{path}", {"http.url": url, "retry.attempt": attempt}) as span:
+                response = await _client.post(url, json=payload, headers=tracing.inject_headers({}))
+                if span is not None:
+                    span.set_attribute("http.status_code", response.status_code)
+            outcome = "ok" if response.status_code == 200 else "error"
+        except httpx.TimeoutException:
+            logger.warning("Encryption service request timed out (attempt %s/%s): %s", attempt + 1, RETRIES + 1, url)
+            continue
+        except httpx.TransportError as exc:
+            logger.warning("Encryption service connection failed (attempt %s/%s): %s - Is the backend running at %s?",
+                           attempt + 1, RETRIES + 1, exc, BACKEND_API_BASE)
+            continue
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.DEPENDENCY_SECONDS.observe(elapsed, "encryption_service", path, outcome)
+            request_timing.record(f"encryption_service.{path}", elapsed)
+
+        if response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                # A proxy or error page answering for the backend: retry
+                logger.warning("Encryption service returned 200 without a JSON object (attempt %s/%s): %s",
+                               attempt + 1, RETRIES + 1, response.text[:200])
+                continue
+            _record(True)
+            result = data.get(result_field)
+            if not result:
+                logger.warning("Encryption service returned 200 but no result in response: %s", data)
+            return result
+        if response.status_code < 500:
+            # The backend is up and refused this request: retrying won't help
+            _record(True)
+            logger.warning("Encryption service responded with %s: %s", response.status_code, response.text[:500])
+            return None
+        # 5xx (503 while the backend starts up): retry
+        logger.info("Encryption service responded with %s (attempt %s/%s)", response.status_code, attempt + 1, RETRIES + 1)
+
+    logger.error("Encryption service unavailable after %s attempts: %s", RETRIES + 1, url)
+    _record(False)
+    return None
+
+
+def _submit(coro: Coroutine) -> concurrent.futures.Future:
+    """Run ``coro`` on the client's loop, in a copy of the caller's context (request timing, trace)."""
+    loop = _ensure_loop()
+    context = contextvars.copy_context()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    async def run():
+        try:
+            future.set_result(await asyncio.wait_for(coro, CALL_TIMEOUT_SECONDS))
+        except asyncio.TimeoutError:
+            logger.error("Encryption service call gave up after %ss", CALL_TIMEOUT_SECONDS)
+            _record(False)
+            future.set_result(None)
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    loop.call_soon_threadsafe(context.run, loop.create_task, run())
+    return future
+
+
+def call(path: str, payload: Dict[str, Any]) -> Optional[str]:
+    """
+    ``encrypt``/``decrypt`` through the backend, from synchronous code.
+    Returns None when the backend is not configured, skipped by the
+    breaker, or did not answer with a result.
+    """
+    if not is_configured() or is_open():
+        return None
+    try:
+        # The client's loop enforces the timeout; this only guards against a stalled loop
+        return _submit(_post(path, payload)).result(CALL_TIMEOUT_SECONDS + 5)
+    except concurrent.futures.TimeoutError:
+        logger.error("Encryption client loop did not answer within %ss", CALL_TIMEOUT_SECONDS + 5)
+        _record(False)
+        return None
+
+
+async def acall(path: str, payload: Dict[str, Any]) -> Optional[str]:
+    """``call`` for coroutines: awaits without blocking the caller's loop."""
+    if not is_configured() or is_open():
+        return None
+    return await asyncio.wrap_future(_submit(_post(path, payload)))
+
+
+def stop(timeout: float = 5.0):
+    """Close the pooled connections and stop the client's loop."""
+    global _loop, _thread, _client
+    with _LOCK:
+        loop, thread, client = _loop, _thread, _client
+        _loop = _thread = _client = None
+    if loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout)
+    except Exception as exc:
+        logger.debug("Closing the encryption client failed: %s", exc)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    loop.close()
+
+
+def get_status() -> Dict[str, Any]:
+    return {
+        "configured": is_configured(),
+        "http2": USE_HTTP2,
+        "breaker_open": is_open(),
+        "consecutive_failures": _consecutive_failures,
+    }
+
+
+ENCRYPTION_BREAKER_OPEN.add_callback(lambda: [((), 1 if is_open() else 0)])
@@ -0,0 +1,875 @@
+"""
+Deterministic stand-in for the mt5linux ``MetaTrader5`` API.
+
+Lets the bridge run, be load-tested and be benchmarked on a plain Linux box
+without Wine, a terminal or a broker. Two ways to use it:
+
+- In-process: start the bridge with ``MT5_FAKE_TERMINAL=1``. Each call on
+  the fake counts as one terminal round trip and pays the configured
+  latency; like mt5linux it also offers ``eval``/``execute``, so the
+  terminal-side helpers in services.mt5_remote behave exactly as they do
+  against a real RPyC server (one round trip per helper call).
+- Over real RPyC: ``python -m services.fake_mt5 --serve --port 18812``
+  starts a classic RPyC server whose ``import MetaTrader5`` resolves to the
+  fake; point the bridge at it with MT5_RPC_HOST / MT5_RPC_PORT as usual.
+
+Prices are synthetic but deterministic: a bar or tick at a given time is a
+pure function of (seed, symbol, time), so runs are reproducible.
+
+Behaviour is configured with environment variables (see ``FakeConfig``):
+latency and jitter per call, login latency, and failure injection for
+filling-mode rejections (10030), AutoTrading disabled (10027), timeouts
+and dropped connections.
+"""
+
+import argparse
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, namedtuple
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TradePosition = namedtuple("TradePosition", (
+    "ticket", "time", "time_msc", "time_update", "time_update_msc", "type", "magic", "identifier",
+    "reason", "volume", "price_open", "sl", "tp", "price_current", "swap", "profit", "symbol",
+    "comment", "external_id",
+))
+TradeDeal = namedtuple("TradeDeal", (
+    "ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id", "reason",
+    "volume", "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id",
+))
+SymbolInfo = namedtuple("SymbolInfo", (
+    "name", "description", "path", "currency_base", "currency_profit", "currency_margin", "digits",
+    "spread", "point", "trade_contract_size", "trade_stops_level", "filling_mode", "visible",
+    "select", "bid", "ask", "volume_min", "volume_max", "volume_step",
+))
+Tick = namedtuple("Tick", ("time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"))
+AccountInfo = namedtuple("AccountInfo", (
+    "login", "trade_mode", "leverage", "trade_allowed", "balance", "credit", "profit", "equity",
+    "margin", "margin_free", "margin_level", "name", "server", "currency", "company",
+))
+TerminalInfo = namedtuple("TerminalInfo", (
+    "connected", "trade_allowed", "ping_last", "build", "name", "company",
+))
+TradeOrder = namedtuple("TradeOrder", (
+    "ticket", "time_setup", "time_setup_msc", "time_done", "time_done_msc", "time_expiration", "type",
+    "type_time", "type_filling", "state", "magic", "position_id", "position_by_id", "reason",
+    "volume_initial", "volume_current", "price_open", "sl", "tp", "price_current", "price_stoplimit",
+    "symbol", "comment", "external_id",
+))
+TradeRequest = namedtuple("TradeRequest", (
+    "action", "magic", "order", "symbol", "volume", "price", "stoplimit", "sl", "tp", "deviation",
+    "type", "type_filling", "type_time", "expiration", "comment", "position", "position_by",
+))
+OrderSendResult = namedtuple("OrderSendResult", (
+    "retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id",
+    "retcode_external", "request",
+))
+
+# (base price, digits, contract size, description)
+DEFAULT_SYMBOLS: Dict[str, Tuple[float, int, float, str]] = {
+    "EURUSD": (1.0850, 5, 100000, "Euro vs US Dollar"),
+    "GBPUSD": (1.2700, 5, 100000, "Great Britain Pound vs US Dollar"),
+    "USDJPY": (150.00, 3, 100000, "US Dollar vs Japanese Yen"),
+    "USDCHF": (0.8800, 5, 100000, "US Dollar vs Swiss Franc"),
+    "AUDUSD": (0.6600, 5, 100000, "Australian Dollar vs US Dollar"),
+    "USDCAD": (1.3600, 5, 100000, "US Dollar vs Canadian Dollar"),
+    "NZDUSD": (0.6100, 5, 100000, "New Zealand Dollar vs US Dollar"),
+    "XAUUSD": (2000.0, 2, 100, "Gold vs US Dollar"),
+}
+
+
+class FakeConfig:
+    """Knobs for latency and failure injection, read from MT5_FAKE_* env vars."""
+
+    def __init__(
+        self,
+        seed: int = 42,
+        latency_ms: float = 2.0,
+        jitter_ms: float = 0.0,
+        login_latency_ms: float = 250.0,
+        serialize: bool = True,
+        filling_reject_rate: float = 0.0,
+        autotrading_disabled_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 5.0,
+        disconnect_rate: float = 0.0,
+        symbol_filling_mode: int = 2,
+        symbols: Optional[List[str]] = None,
+        extra_symbols: int = 0,
+    ):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.login_latency_ms = login_latency_ms
+        # A real terminal answers one RPyC request at a time
+        self.serialize = serialize
+        self.filling_reject_rate = filling_reject_rate
+        self.autotrading_disabled_rate = autotrading_disabled_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.disconnect_rate = disconnect_rate
+        # SYMBOL_FILLING_FOK = 1, SYMBOL_FILLING_IOC = 2 (bitmask)
+        self.symbol_filling_mode = symbol_filling_mode
+        self.symbols = symbols or list(DEFAULT_SYMBOLS)
+        # Synthetic "SYMnnnn" instruments to make symbols_get() realistically large
+        self.extra_symbols = extra_symbols
+
+    @classmethod
+    def from_env(cls) -> "FakeConfig":
+        symbols = os.getenv("MT5_FAKE_SYMBOLS")
+        return cls(
+            seed=int(os.getenv("MT5_FAKE_SEED", "42")),
+            latency_ms=float(os.getenv("MT5_FAKE_LATENCY_MS", "2")),
+            jitter_ms=float(os.getenv("MT5_FAKE_JITTER_MS", "0")),
+            login_latency_ms=float(os.getenv("MT5_FAKE_LOGIN_LATENCY_MS", "250")),
+            serialize=os.getenv("MT5_FAKE_SERIALIZE", "1").lower() in ("1", "true", "yes"),
+            filling_reject_rate=float(os.getenv("MT5_FAKE_FILLING_REJECT_RATE", "0")),
+            autotrading_disabled_rate=float(os.getenv("MT5_FAKE_AUTOTRADING_DISABLED_RATE", "0")),
+            timeout_rate=float(os.getenv("MT5_FAKE_TIMEOUT_RATE", "0")),
+            timeout_seconds=float(os.getenv("MT5_FAKE_TIMEOUT_SECONDS", "5")),
+            disconnect_rate=float(os.getenv("MT5_FAKE_DISCONNECT_RATE", "0")),
+            symbol_filling_mode=int(os.getenv("MT5_FAKE_SYMBOL_FILLING_MODE", "2")),
+            symbols=[s.strip() for s in symbols.split(",") if s.strip()] if symbols else None,
+            extra_symbols=int(os.getenv("MT5_FAKE_EXTRA_SYMBOLS", "0")),
+        )
+
+
+class _Account:
+    def __init__(self, login: int, server: str):
+        self.login = login
+        self.server = server
+        self.balance = 10000.0
+        self.positions: Dict[int, Dict[str, Any]] = {}
+        self.orders: Dict[int, Dict[str, Any]] = {}
+        self.deals: List[TradeDeal] = []
+
+
+class FakeTerminal:
+    """
+    Shared terminal state: accounts, positions, deals and price model.
+    Survives "reconnects" so failure injection behaves like a real restart
+    of the RPyC link rather than of the broker account.
+    """
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.lock = threading.RLock()
+        self.rng = random.Random(self.config.seed)
+        self.accounts: Dict[int, _Account] = {}
+        self.current: Optional[_Account] = None
+        self.next_ticket = 100000
+        self.calls: Counter = Counter()
+        self.round_trips = 0
+        self.symbols: Dict[str, Tuple[float, int, float, str]] = {}
+        for name in self.config.symbols:
+            self.symbols[name] = DEFAULT_SYMBOLS.get(name, (1.0 + (zlib.crc32(name.encode()) % 1000) / 1000, 5, 100000, name))
+        for i in range(self.config.extra_symbols):
+            name = f"SYM{i:04d}"
+            self.symbols[name] = (10.0 + (zlib.crc32(name.encode()) % 9000) / 100, 2, 100, f"Synthetic instrument {i}")
+
+    # ---------- price model ----------
+
+    def _noise(self, symbol: str, bucket: int) -> float:
+        # crc32 instead of hash(): str hashes are salted per process
+        return (zlib.crc32(f"{self.config.seed}:{symbol}:{bucket}".encode()) / 0xFFFFFFFF) - 0.5
+
+    def mid(self, symbol: str, ts: float) -> float:
+        base, digits, _, _ = self.symbols[symbol]
+        phase = zlib.crc32(symbol.encode()) % 1000
+        drift = 0.004 * math.sin(2 * math.pi * (ts + phase * 97) / 86400.0)
+        wave = 0.0015 * math.sin(2 * math.pi * (ts + phase) / 3600.0)
+        noise = 0.0004 * self._noise(symbol, int(ts))
+        return round(base * (1 + drift + wave + noise), digits)
+
+    def spread_points(self, symbol: str) -> int:
+        return 10 if self.symbols[symbol][1] >= 3 else 30
+
+    def tick(self, symbol: str, ts: Optional[float] = None) -> Tick:
+        ts = time.time() if ts is None else ts
+        _, digits, _, _ = self.symbols[symbol]
+        point = 10 ** -digits
+        mid = self.mid(symbol, ts)
+        half = self.spread_points(symbol) * point / 2
+        return Tick(int(ts), round(mid - half, digits), round(mid + half, digits), 0.0, 0, int(ts * 1000), 6, 0.0)
+
+    def bar(self, symbol: str, start: int, seconds: int) -> Tuple:
+        _, digits, _, _ = self.symbols[symbol]
+        o = self.mid(symbol, start)
+        c = self.mid(symbol, start + seconds - 1)
+        wick = abs(self._noise(symbol, start // seconds + 7)) * 0.0006 * o
+        h = round(max(o, c) + wick, digits)
+        low = round(min(o, c) - wick, digits)
+        volume = 100 + int(abs(self._noise(symbol, start)) * 2000)
+        return (start, o, h, low, c, volume, self.spread_points(symbol), 0)
+
+
+    # ---------- broker-side events ----------
+
+    def broker_close(self, login: int, ticket: int, reason: int = 4) -> Optional[int]:
+        """
+        Close a position the way the broker does on an SL hit (reason 4),
+        TP hit (5) or stop-out (6): an exit deal appears without any
+        order_send from the bridge. Returns the deal ticket, or None if the
+        position doesn't exist.
+        """
+        with self.lock:
+            account = self.accounts.get(int(login))
+            position = account.positions.pop(int(ticket), None) if account else None
+            if position is None:
+                return None
+            symbol = position["symbol"]
+            tick = self.tick(symbol)
+            closing_buy = position["type"] == 0
+            price = tick.bid if closing_buy else tick.ask
+            diff = price - position["price_open"] if closing_buy else position["price_open"] - price
+            profit = round(diff * position["volume"] * self.symbols[symbol][2], 2)
+            account.balance += profit
+            self.next_ticket += 1
+            now = int(time.time())
+            tag = {4: "sl", 5: "tp", 6: "so"}.get(reason, "broker")
+            account.deals.append(TradeDeal(
+                self.next_ticket, 0, now, now * 1000, 1 if closing_buy else 0, 1, position["magic"], position["ticket"], reason,
+                position["volume"], price, 0.0, 0.0, profit, 0.0, symbol, f"[{tag} {price}]", "",
+            ))
+            return self.next_ticket
+
+
+class FakeMetaTrader5:
+    """
+    One "connection" to a FakeTerminal, mirroring mt5linux's client object.
+    Create a new one to simulate reconnecting after a dropped link.
+    """
+
+    # Constants (same values as MetaTrader5 / mt5linux)
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 16385
+    TIMEFRAME_H4 = 16388
+    TIMEFRAME_D1 = 16408
+    TIMEFRAME_W1 = 32769
+    TIMEFRAME_MN1 = 49153
+
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    ORDER_TYPE_BUY_LIMIT = 2
+    ORDER_TYPE_SELL_LIMIT = 3
+    ORDER_TYPE_BUY_STOP = 4
+    ORDER_TYPE_SELL_STOP = 5
+    ORDER_TYPE_BUY_STOP_LIMIT = 6
+    ORDER_TYPE_SELL_STOP_LIMIT = 7
+
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_PENDING = 5
+    TRADE_ACTION_SLTP = 6
+    TRADE_ACTION_MODIFY = 7
+    TRADE_ACTION_REMOVE = 8
+    TRADE_ACTION_CLOSE_BY = 10
+
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+
+    ORDER_TIME_GTC = 0
+    ORDER_TIME_DAY = 1
+    ORDER_TIME_SPECIFIED = 2
+
+    ORDER_STATE_PLACED = 1
+
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    DEAL_ENTRY_OUT_BY = 3
+
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_INVALID_VOLUME = 10014
+    TRADE_RETCODE_INVALID_PRICE = 10015
+    TRADE_RETCODE_AUTOTRADING_DISABLED = 10027
+    TRADE_RETCODE_INVALID_FILL = 10030
+    TRADE_RETCODE_POSITION_CLOSED = 10036
+
+    TIMEFRAME_SECONDS = {
+        1: 60, 5: 300, 15: 900, 30: 1800, 16385: 3600, 16388: 14400,
+        16408: 86400, 32769: 604800, 49153: 2592000,
+    }
+
+    def __init__(self, terminal: Optional[FakeTerminal] = None):
+        self._fake = terminal or FakeTerminal()
+        self._initialized = False
+        self._disconnected = False
+        self._last_error: Tuple[int, str] = (1, "Success")
+        # Per-connection namespace for eval/execute, like rpyc's SlaveService
+        self._namespace: Dict[str, Any] = {"mt5": self}
+        self._local = threading.local()
+
+    # ---------- round-trip emulation ----------
+
+    def _round_trip(self, name: str, latency_ms: Optional[float] = None):
+        """Charge one terminal round trip unless already inside eval()."""
+        fake = self._fake
+        if getattr(self._local, "depth", 0):
+            return
+        if self._disconnected:
+            raise EOFError("[Errno 104] fake terminal connection closed")
+        config = fake.config
+        with fake.lock:
+            fake.calls[name] += 1
+            fake.round_trips += 1
+            roll = fake.rng.random()
+            jitter = fake.rng.uniform(0, config.jitter_ms) if config.jitter_ms else 0.0
+        if roll < config.disconnect_rate:
+            self._disconnected = True
+            raise EOFError("[Errno 104] fake terminal connection reset")
+        if roll < config.disconnect_rate + config.timeout_rate:
+            time.sleep(config.timeout_seconds)
+            raise TimeoutError("result expired")
+        delay = ((config.latency_ms if latency_ms is None else latency_ms) + jitter) / 1000.0
+        if delay > 0:
+            if config.serialize:
+                with fake.lock:
+                    time.sleep(delay)
+            else:
+                time.sleep(delay)
+
+    def eval(self, code: str):
+        self._round_trip("eval")
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            return self._by_reference(eval(code, self._namespace))
+        finally:
+            self._local.depth -= 1
+
+    def _by_reference(self, value):
+        """Functions come back as remote callables: one round trip per call, like an RPyC netref."""
+        if isinstance(value, tuple):
+            return tuple(self._by_reference(item) for item in value)
+        if not callable(value):
+            return value
+
+        def remote(*args, **kwargs):
+            self._round_trip("call")
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self._local.depth -= 1
+        return remote
+
+    def execute(self, code: str):
+        self._round_trip("execute")
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            exec(code, self._namespace)
+        finally:
+            self._local.depth -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"round_trips": self._fake.round_trips, "calls": dict(self._fake.calls)}
+
+    def reset_stats(self):
+        with self._fake.lock:
+            self._fake.calls.clear()
+            self._fake.round_trips = 0
+
+    # ---------- session ----------
+
+    def initialize(self, *args, **kwargs) -> bool:
+        self._round_trip("initialize")
+        self._initialized = True
+        return True
+
+    def shutdown(self, *args, **kwargs):
+        self._round_trip("shutdown")
+        self._initialized = False
+        return True
+
+    def last_error(self, *args, **kwargs):
+        self._round_trip("last_error")
+        return self._last_error
+
+    def version(self, *args, **kwargs):
+        self._round_trip("version")
+        return (500, 4000, "01 Jan 2024")
+
+    def login(self, login, password=None, server=None, timeout=60000, **kwargs) -> bool:
+        self._round_trip("login", self._fake.config.login_latency_ms)
+        if password == "invalid":
+            self._last_error = (-6, "Terminal: Authorization failed")
+            return False
+        fake = self._fake
+        with fake.lock:
+            login = int(login)
+            account = fake.accounts.get(login)
+            if account is None:
+                account = fake.accounts[login] = _Account(login, server or "Fake-Demo")
+            fake.current = account
+        self._last_error = (1, "Success")
+        return True
+
+    def terminal_info(self, *args, **kwargs) -> TerminalInfo:
+        self._round_trip("terminal_info")
+        return TerminalInfo(True, True, 1500, 4000, "Fake MetaTrader 5", "Fake Terminal Ltd.")
+
+    def account_info(self, *args, **kwargs) -> Optional[AccountInfo]:
+        self._round_trip("account_info")
+        fake = self._fake
+        with fake.lock:
+            account = fake.current
+            if account is None:
+                self._last_error = (-10001, "IPC send failed")
+                return None
+            profit = sum(self._position_profit(p) for p in account.positions.values())
+            margin = sum(
+                p["volume"] * fake.symbols[p["symbol"]][2] * p["price_open"] / 100
+                for p in account.positions.values()
+            )
+            equity = account.balance + profit
+            return AccountInfo(
+                account.login, 0, 100, True, round(account.balance, 2), 0.0, round(profit, 2),
+                round(equity, 2), round(margin, 2), round(equity - margin, 2),
+                round(equity / margin * 100, 2) if margin else 0.0,
+                f"Fake {account.login}", account.server, "USD", "Fake Broker Ltd.",
+            )
+
+    # ---------- market data ----------
+
+    def _require_symbol(self, symbol: str) -> bool:
+        if symbol not in self._fake.symbols:
+            self._last_error = (-4, "Terminal: Not found")
+            return False
+        return True
+
+    def _symbol_info(self, symbol: str) -> SymbolInfo:
+        fake = self._fake
+        base, digits, contract, description = fake.symbols[symbol]
+        tick = fake.tick(symbol)
+        return SymbolInfo(
+            symbol, description, f"Forex\\{symbol}", symbol[:3], symbol[3:6] or "USD", symbol[:3],
+            digits, fake.spread_points(symbol), 10 ** -digits, contract, 0,
+            fake.config.symbol_filling_mode, True, True, tick.bid, tick.ask, 0.01, 100.0, 0.01,
+        )
+
+    def symbol_info(self, symbol, *args, **kwargs) -> Optional[SymbolInfo]:
+        self._round_trip("symbol_info")
+        if not self._require_symbol(symbol):
+            return None
+        return self._symbol_info(symbol)
+
+    def symbol_info_tick(self, symbol, *args, **kwargs) -> Optional[Tick]:
+        self._round_trip("symbol_info_tick")
+        if not self._require_symbol(symbol):
+            return None
+        return self._fake.tick(symbol)
+
+    def symbol_select(self, symbol, enable=True, *args, **kwargs) -> bool:
+        self._round_trip("symbol_select")
+        return self._require_symbol(symbol)
+
+    def symbols_total(self, *args, **kwargs) -> int:
+        self._round_trip("symbols_total")
+        return len(self._fake.symbols)
+
+    def symbols_get(self, group=None, *args, **kwargs) -> Tuple[SymbolInfo, ...]:
+        self._round_trip("symbols_get")
+        names = self._fake.symbols
+        if group:
+            pattern = group.strip("*").upper()
+            names = [n for n in names if pattern in n]
+        return tuple(self._symbol_info(name) for name in names)
+
+    def _bars(self, symbol: str, timeframe: int, first: int, count: int) -> List[Tuple]:
+        seconds = self.TIMEFRAME_SECONDS[timeframe]
+        return [self._fake.bar(symbol, (first + i) * seconds, seconds) for i in range(count)]
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        self._round_trip("copy_rates_from_pos")
+        if not self._require_symbol(symbol) or timeframe not in self.TIMEFRAME_SECONDS:
+            return None
+        current = int(time.time()) // self.TIMEFRAME_SECONDS[timeframe]
+        last = current - int(start_pos)
+        return self._bars(symbol, timeframe, last - int(count) + 1, int(count))
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self._round_trip("copy_rates_range")
+        if not self._require_symbol(symbol) or timeframe not in self.TIMEFRAME_SECONDS:
+            return None
+        seconds = self.TIMEFRAME_SECONDS[timeframe]
+        start = _as_timestamp(date_from) // seconds
+        end = min(_as_timestamp(date_to), int(time.time())) // seconds
+        if end < start:
+            return []
+        return self._bars(symbol, timeframe, start, end - start + 1)
+
+    # ---------- trading ----------
+
+    def _position_profit(self, position: Dict[str, Any]) -> float:
+        fake = self._fake
+        tick = fake.tick(position["symbol"])
+        contract = fake.symbols[position["symbol"]][2]
+        if position["type"] == self.ORDER_TYPE_BUY:
+            diff = tick.bid - position["price_open"]
+        else:
+            diff = position["price_open"] - tick.ask
+        return round(diff * position["volume"] * contract, 2)
+
+    def _to_position(self, p: Dict[str, Any]) -> TradePosition:
+        tick = self._fake.tick(p["symbol"])
+        current = tick.bid if p["type"] == self.ORDER_TYPE_BUY else tick.ask
+        return TradePosition(
+            p["ticket"], p["time"], p["time"] * 1000, p["time_update"], p["time_update"] * 1000,
+            p["type"], p["magic"], p["ticket"], 3, p["volume"], p["price_open"], p["sl"], p["tp"],
+            current, 0.0, self._position_profit(p), p["symbol"], p["comment"], "",
+        )
+
+    def positions_total(self, *args, **kwargs) -> int:
+        self._round_trip("positions_total")
+        account = self._fake.current
+        return len(account.positions) if account else 0
+
+    def positions_get(self, symbol=None, group=None, ticket=None, **kwargs):
+        self._round_trip("positions_get")
+        fake = self._fake
+        with fake.lock:
+            account = fake.current
+            if account is None:
+                return None
+            self._trigger_pending(account)
+            positions = list(account.positions.values())
+            if ticket is not None:
+                positions = [p for p in positions if p["ticket"] == int(ticket)]
+            if symbol is not None:
+                positions = [p for p in positions if p["symbol"] == symbol]
+            if group:
+                pattern = group.strip("*").upper()
+                positions = [p for p in positions if pattern in p["symbol"]]
+            return tuple(self._to_position(p) for p in positions)
+
+    def _to_order(self, o: Dict[str, Any]) -> TradeOrder:
+        tick = self._fake.tick(o["symbol"])
+        current = tick.ask if o["type"] % 2 == 0 else tick.bid
+        return TradeOrder(
+            o["ticket"], o["time"], o["time"] * 1000, 0, 0, o["expiration"], o["type"], o["type_time"],
+            o["type_filling"], self.ORDER_STATE_PLACED, o["magic"], 0, 0, 3, o["volume"], o["volume"],
+            o["price"], o["sl"], o["tp"], current, o["stoplimit"], o["symbol"], o["comment"], "",
+        )
+
+    def orders_total(self, *args, **kwargs) -> int:
+        self._round_trip("orders_total")
+        account = self._fake.current
+        return len(account.orders) if account else 0
+
+    def orders_get(self, symbol=None, group=None, ticket=None, **kwargs):
+        self._round_trip("orders_get")
+        fake = self._fake
+        with fake.lock:
+            account = fake.current
+            if account is None:
+                return None
+            self._trigger_pending(account)
+            orders = list(account.orders.values())
+            if ticket is not None:
+                orders = [o for o in orders if o["ticket"] == int(ticket)]
+            if symbol is not None:
+                orders = [o for o in orders if o["symbol"] == symbol]
+            if group:
+                pattern = group.strip("*").upper()
+                orders = [o for o in orders if pattern in o["symbol"]]
+            return tuple(self._to_order(o) for o in orders)
+
+    def _trigger_pending(self, account: _Account):
+        """Fill, convert (stop-limit) or expire pending orders at the current tick."""
+        now = int(time.time())
+        for order in list(account.orders.values()):
+            if order["expiration"] and now >= order["expiration"]:
+                del account.orders[order["ticket"]]
+                continue
+            tick = self._fake.tick(order["symbol"])
+            order_type = order["type"]
+            is_buy = order_type % 2 == 0
+            quote = tick.ask if is_buy else tick.bid
+            if order_type in (self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_SELL_STOP):
+                triggered = quote <= order["price"]
+            elif order_type in (self.ORDER_TYPE_SELL_LIMIT, self.ORDER_TYPE_BUY_STOP):
+                triggered = quote >= order["price"]
+            elif order_type == self.ORDER_TYPE_BUY_STOP_LIMIT:
+                triggered = quote >= order["price"]
+            else:
+                triggered = quote <= order["price"]
+            if not triggered:
+                continue
+            if order_type >= self.ORDER_TYPE_BUY_STOP_LIMIT:
+                # Stop reached: becomes a limit order at the stop-limit price
+                order["type"] = order_type - 4
+                order["price"], order["stoplimit"] = order["stoplimit"], 0.0
+                continue
+            del account.orders[order["ticket"]]
+            self._open_position(
+                account, order["ticket"], order["symbol"], self.ORDER_TYPE_BUY if is_buy else self.ORDER_TYPE_SELL,
+                order["volume"], quote, order["magic"], order["sl"], order["tp"], order["comment"],
+            )
+
+    def history_deals_get(self, date_from=None, date_to=None, group=None, ticket=None, position=None, **kwargs):
+        self._round_trip("history_deals_get")
+        fake = self._fake
+        with fake.lock:
+            account = fake.current
+            if account is None:
+                return None
+            deals = account.deals
+            if ticket is not None:
+                return tuple(d for d in deals if d.ticket == int(ticket))
+            if position is not None:
+                return tuple(d for d in deals if d.position_id == int(position))
+            start = _as_timestamp(date_from) if date_from is not None else 0
+            end = _as_timestamp(date_to) if date_to is not None else int(time.time())
+            return tuple(d for d in deals if start <= d.time <= end)
+
+    def _result(self, retcode: int, request: Dict[str, Any], comment: str, deal=0, order=0, volume=0.0, price=0.0, tick=None):
+        return OrderSendResult(
+            retcode, deal, order, volume, price, tick.bid if tick else 0.0, tick.ask if tick else 0.0,
+            comment, 0, 0, TradeRequest(*(request.get(f, 0) for f in TradeRequest._fields)),
+        )
+
+    def _new_ticket(self) -> int:
+        self._fake.next_ticket += 1
+        return self._fake.next_ticket
+
+    def _add_deal(self, account: _Account, order: int, deal_type: int, entry: int, position: Dict[str, Any], volume: float, price: float, profit: float, comment: str) -> int:
+        ticket = self._new_ticket()
+        now = int(time.time())
+        account.deals.append(TradeDeal(
+            ticket, order, now, now * 1000, deal_type, entry, position["magic"], position["ticket"], 3,
+            volume, price, 0.0, 0.0, profit, 0.0, position["symbol"], comment, "",
+        ))
+        return ticket
+
+    def _filling_accepted(self, type_filling: Optional[int]) -> bool:
+        # Without type_filling the terminal assumes FOK
+        mode = self.ORDER_FILLING_FOK if type_filling is None else type_filling
+        mask = self._fake.config.symbol_filling_mode
+        if mode == self.ORDER_FILLING_FOK:
+            return bool(mask & 1)
+        if mode == self.ORDER_FILLING_IOC:
+            return bool(mask & 2)
+        return mode == self.ORDER_FILLING_RETURN and not (mask & 3)
+
+    def order_check(self, request, *args, **kwargs):
+        self._round_trip("order_check")
+        return self._result(0, request, "Done")
+
+    def order_send(self, request, *args, **kwargs) -> Optional[OrderSendResult]:
+        self._round_trip("order_send")
+        fake = self._fake
+        request = dict(request)
+        with fake.lock:
+            account = fake.current
+            if account is None:
+                self._last_error = (-10004, "No IPC connection")
+                return None
+            roll = fake.rng.random()
+            config = fake.config
+            if roll < config.autotrading_disabled_rate:
+                return self._result(self.TRADE_RETCODE_AUTOTRADING_DISABLED, request, "AutoTrading disabled by client")
+
+            self._trigger_pending(account)
+            action = request.get("action")
+            symbol = request.get("symbol")
+            if action in (self.TRADE_ACTION_PENDING, self.TRADE_ACTION_MODIFY, self.TRADE_ACTION_REMOVE):
+                return self._pending(account, request)
+            if action == self.TRADE_ACTION_SLTP:
+                return self._modify_position(account, request)
+            if action == self.TRADE_ACTION_CLOSE_BY:
+                return self._close_by(account, request)
+            if action != self.TRADE_ACTION_DEAL:
+                return self._result(self.TRADE_RETCODE_INVALID, request, "Unsupported trade action")
+            if symbol not in fake.symbols:
+                return self._result(self.TRADE_RETCODE_INVALID, request, "Invalid request")
+            if roll < config.autotrading_disabled_rate + config.filling_reject_rate or not self._filling_accepted(request.get("type_filling")):
+                return self._result(self.TRADE_RETCODE_INVALID_FILL, request, "Unsupported filling mode")
+            volume = float(request.get("volume", 0))
+            if volume <= 0:
+                return self._result(self.TRADE_RETCODE_INVALID_VOLUME, request, "Invalid volume")
+
+            tick = fake.tick(symbol)
+            order_type = request.get("type")
+            price = tick.ask if order_type == self.ORDER_TYPE_BUY else tick.bid
+            order = self._new_ticket()
+
+            if request.get("position"):
+                position = account.positions.get(int(request["position"]))
+                if position is None:
+                    return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, "Position doesn't exist")
+                volume = min(volume, position["volume"])
+                contract = fake.symbols[symbol][2]
+                diff = price - position["price_open"] if position["type"] == self.ORDER_TYPE_BUY else position["price_open"] - price
+                profit = round(diff * volume * contract, 2)
+                deal = self._add_deal(account, order, order_type, self.DEAL_ENTRY_OUT, position, volume, price, profit, request.get("comment", ""))
+                account.balance += profit
+                position["volume"] = round(position["volume"] - volume, 8)
+                if position["volume"] <= 0:
+                    del account.positions[position["ticket"]]
+                return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", deal, order, volume, price, tick)
+
+            deal = self._open_position(
+                account, order, symbol, order_type, volume, price, int(request.get("magic", 0)),
+                float(request.get("sl", 0.0)), float(request.get("tp", 0.0)), request.get("comment", ""),
+            )
+            return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", deal, order, volume, price, tick)
+
+    def _open_position(self, account: _Account, order: int, symbol: str, order_type: int, volume: float, price: float, magic: int, sl: float, tp: float, comment: str) -> int:
+        now = int(time.time())
+        position = {
+            "ticket": order, "time": now, "time_update": now, "type": order_type,
+            "magic": magic, "volume": volume, "price_open": price,
+            "sl": sl, "tp": tp, "symbol": symbol, "comment": comment,
+        }
+        account.positions[order] = position
+        return self._add_deal(account, order, order_type, self.DEAL_ENTRY_IN, position, volume, price, 0.0, comment)
+
+    def _pending(self, account: _Account, request: Dict[str, Any]) -> OrderSendResult:
+        """TRADE_ACTION_PENDING / MODIFY / REMOVE against the account's pending orders."""
+        fake = self._fake
+        action = request["action"]
+        if action != self.TRADE_ACTION_PENDING:
+            order = account.orders.get(int(request.get("order", 0)))
+            if order is None:
+                return self._result(self.TRADE_RETCODE_INVALID, request, "Invalid order")
+            if action == self.TRADE_ACTION_REMOVE:
+                del account.orders[order["ticket"]]
+                return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", order=order["ticket"])
+            candidate = dict(order, price=float(request.get("price", order["price"])),
+                             stoplimit=float(request.get("stoplimit", order["stoplimit"])),
+                             sl=float(request.get("sl", 0.0)), tp=float(request.get("tp", 0.0)),
+                             type_time=int(request.get("type_time", order["type_time"])),
+                             expiration=_as_timestamp(request["expiration"]) if request.get("expiration") else 0)
+        else:
+            symbol = request.get("symbol")
+            order_type = request.get("type")
+            if symbol not in fake.symbols or order_type not in range(self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_SELL_STOP_LIMIT + 1):
+                return self._result(self.TRADE_RETCODE_INVALID, request, "Invalid request")
+            volume = float(request.get("volume", 0))
+            if volume <= 0:
+                return self._result(self.TRADE_RETCODE_INVALID_VOLUME, request, "Invalid volume")
+            now = int(time.time())
+            candidate = {
+                "ticket": 0, "time": now, "type": order_type, "symbol": symbol, "volume": volume,
+                "price": float(request.get("price", 0)), "stoplimit": float(request.get("stoplimit", 0.0)),
+                "sl": float(request.get("sl", 0.0)), "tp": float(request.get("tp", 0.0)),
+                "magic": int(request.get("magic", 0)), "comment": request.get("comment", ""),
+                "type_time": int(request.get("type_time", self.ORDER_TIME_GTC)),
+                "type_filling": int(request.get("type_filling", self.ORDER_FILLING_RETURN)),
+                "expiration": _as_timestamp(request["expiration"]) if request.get("expiration") else 0,
+            }
+        # Limits must be placed below (buy) / above (sell) the market, stops the other way
+        tick = fake.tick(candidate["symbol"])
+        order_type = candidate["type"]
+        quote = tick.ask if order_type % 2 == 0 else tick.bid
+        below = order_type in (self.ORDER_TYPE_BUY_LIMIT, self.ORDER_TYPE_SELL_STOP, self.ORDER_TYPE_SELL_STOP_LIMIT)
+        if candidate["price"] <= 0 or (candidate["price"] >= quote if below else candidate["price"] <= quote):
+            return self._result(self.TRADE_RETCODE_INVALID_PRICE, request, "Invalid price")
+        if order_type >= self.ORDER_TYPE_BUY_STOP_LIMIT and candidate["stoplimit"] <= 0:
+            return self._result(self.TRADE_RETCODE_INVALID_PRICE, request, "Invalid price")
+        if not candidate["ticket"]:
+            candidate["ticket"] = self._new_ticket()
+        account.orders[candidate["ticket"]] = candidate
+        return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", order=candidate["ticket"],
+                            volume=candidate["volume"], price=candidate["price"], tick=tick)
+
+    def _modify_position(self, account: _Account, request: Dict[str, Any]) -> OrderSendResult:
+        position = account.positions.get(int(request.get("position", 0)))
+        if position is None:
+            return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, "Position doesn't exist")
+        position["sl"] = float(request.get("sl", 0.0))
+        position["tp"] = float(request.get("tp", 0.0))
+        position["time_update"] = int(time.time())
+        return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", order=position["ticket"])
+
+
+    def _close_by(self, account: _Account, request: Dict[str, Any]) -> OrderSendResult:
+        """Net two opposite positions of one symbol at the opening price of ``position_by``."""
+        fake = self._fake
+        position = account.positions.get(int(request.get("position", 0)))
+        opposite = account.positions.get(int(request.get("position_by", 0)))
+        if position is None or opposite is None:
+            return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, "Position doesn't exist")
+        if position["symbol"] != opposite["symbol"] or position["type"] == opposite["type"]:
+            return self._result(self.TRADE_RETCODE_INVALID, request, "Invalid close by")
+        volume = min(position["volume"], opposite["volume"])
+        price = opposite["price_open"]
+        contract = fake.symbols[position["symbol"]][2]
+        diff = price - position["price_open"] if position["type"] == self.ORDER_TYPE_BUY else position["price_open"] - price
+        profit = round(diff * volume * contract, 2)
+        order = self._new_ticket()
+        comment = request.get("comment", "")
+        deal = self._add_deal(account, order, opposite["type"], self.DEAL_ENTRY_OUT_BY, position, volume, price, profit, comment)
+        self._add_deal(account, order, position["type"], self.DEAL_ENTRY_OUT_BY, opposite, volume, price, 0.0, comment)
+        account.balance += profit
+        for closed in (position, opposite):
+            closed["volume"] = round(closed["volume"] - volume, 8)
+            if closed["volume"] <= 0:
+                del account.positions[closed["ticket"]]
+        return self._result(self.TRADE_RETCODE_DONE, request, "Request executed", deal, order, volume, price)
+
+
+def _as_timestamp(value) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+_SHARED_TERMINAL: Optional[FakeTerminal] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def connect() -> FakeMetaTrader5:
+    """
+    New fake connection to the process-wide fake terminal (configured from
+    the environment on first use). Used as the bridge's terminal factory.
+    """
+    global _SHARED_TERMINAL
+    with _SHARED_LOCK:
+        if _SHARED_TERMINAL is None:
+            _SHARED_TERMINAL = FakeTerminal(FakeConfig.from_env())
+            logger.info("🧪 Using fake MT5 terminal (seed=%s, latency=%sms)", _SHARED_TERMINAL.config.seed, _SHARED_TERMINAL.config.latency_ms)
+    return FakeMetaTrader5(_SHARED_TERMINAL)
+
+
+def shared_terminal() -> Optional[FakeTerminal]:
+    """The process-wide fake terminal behind ``connect()``, if created."""
+    return _SHARED_TERMINAL
+
+
+def serve(host: str = "0.0.0.0", port: int = 18812):
+    """
+    Run a classic RPyC server in which ``import MetaTrader5`` yields the
+    fake, so an unmodified mt5linux client (and the bridge) can connect.
+    """
+    from rpyc.core import SlaveService
+    from rpyc.utils.server import ThreadedServer
+
+    sys.modules["MetaTrader5"] = connect()
+    server = ThreadedServer(SlaveService, hostname=host, port=port, reuse_addr=True, protocol_config={"allow_all_attrs": True})
+    logger.info("🧪 Fake MT5 RPyC server listening on %s:%s", host, port)
+    server.start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake MT5 terminal for load testing and benchmarks")
+    parser.add_argument("--serve", action="store_true", help="run a classic RPyC server backed by the fake")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=18812)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not args.serve:
+        parser.error("nothing to do; pass --serve")
+    serve(args.host, args.port)
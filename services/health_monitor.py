@@ -0,0 +1,200 @@
+"""
+Background health prober for the MT5 bridge.
+
+Probes terminal connectivity, Supabase and the encryption backend on an
+interval and keeps the latest results in memory, so /health, /livez and
+/readyz answer from a cached snapshot instead of touching the terminal
+on every load-balancer poll.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from database.supabase_client import get_supabase_client
+from services import account_manager, account_switcher, encryption_client, metrics, mt5_connection, mt5_remote
+from services.local_encryption import is_available as local_encryption_available
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_PROBE_SECONDS = float(os.getenv("MT5_HEALTH_PROBE_SECONDS", "5"))
+DEPENDENCY_PROBE_SECONDS = float(os.getenv("MT5_HEALTH_DEPENDENCY_PROBE_SECONDS", "30"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("MT5_HEALTH_PROBE_TIMEOUT", "3"))
+
+# Probes run on their own small pool so a hung terminal can't starve the
+# default executor used by request handlers.
+_PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="health-probe")
+metrics.track_executor("health_probe", lambda: _PROBE_EXECUTOR)
+
+_CHECKS: Dict[str, Dict[str, Any]] = {}
+_INFLIGHT: Dict[str, Tuple[Future, float]] = {}
+_LAST_CYCLE: Optional[float] = None
+_task: Optional[asyncio.Task] = None
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+
+def _record(name: str, ok: bool, latency_ms: Optional[float], detail: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+    now = time.time()
+    previous = _CHECKS.get(name, {})
+    _CHECKS[name] = {
+        "ok": ok,
+        "latency_ms": round(latency_ms, 2) if latency_ms is not None else None,
+        "checked_at": now,
+        "last_success": now if ok else previous.get("last_success"),
+        "error": error,
+        **(detail or {}),
+    }
+    if previous.get("ok") is not None and previous.get("ok") != ok:
+        if ok:
+            logger.info("Health check %s recovered", name)
+        else:
+            logger.warning("Health check %s failing: %s", name, error)
+
+
+async def _run_probe(name: str, probe: Callable[[], Tuple[bool, Dict[str, Any]]]):
+    """Run a blocking probe on the probe pool with a hard timeout."""
+    inflight = _INFLIGHT.get(name)
+    if inflight and not inflight[0].done():
+        # A previous probe is still stuck in the terminal; don't pile up threads.
+        stuck_for = (time.perf_counter() - inflight[1]) * 1000
+        _record(name, False, stuck_for, error="previous probe still running")
+        return
+
+    started = time.perf_counter()
+    future = _PROBE_EXECUTOR.submit(probe)
+    _INFLIGHT[name] = (future, started)
+    try:
+        ok, detail = await asyncio.wait_for(asyncio.wrap_future(future), timeout=PROBE_TIMEOUT_SECONDS)
+        _record(name, ok, (time.perf_counter() - started) * 1000, detail, None if ok else detail.get("error"))
+    except asyncio.TimeoutError:
+        _record(name, False, PROBE_TIMEOUT_SECONDS * 1000, error=f"timed out after {PROBE_TIMEOUT_SECONDS}s")
+    except Exception as exc:
+        _record(name, False, (time.perf_counter() - started) * 1000, error=str(exc))
+
+
+def _probe_terminal(mt5) -> Tuple[bool, Dict[str, Any]]:
+    if mt5 is None:
+        return False, {"error": "MT5 not connected"}
+    info = mt5_remote.terminal_info(mt5)
+    if info is None:
+        error = mt5.last_error() if hasattr(mt5, "last_error") else "terminal_info() returned None"
+        return False, {"error": str(error)}
+    connected = bool(info.connected)
+    return connected, {
+        "connected": connected,
+        "trade_allowed": bool(info.trade_allowed),
+        "error": None if connected else "terminal not connected to broker",
+    }
+
+
+def _probe_supabase() -> Tuple[bool, Dict[str, Any]]:
+    client = get_supabase_client()
+    if not client:
+        return False, {"configured": False, "error": "Supabase client not configured"}
+    try:
+        client.table(account_manager.MT5_ACCOUNTS_TABLE).select("id").limit(1).execute()
+    except Exception as exc:
+        return False, {"configured": True, "error": str(exc)}
+    return True, {"configured": True, "error": None}
+
+
+def _probe_encryption() -> Tuple[bool, Dict[str, Any]]:
+    local_ok = local_encryption_available()
+    backend_ok = None
+    backend_error = None
+    if account_manager.BACKEND_API_BASE:
+        try:
+            response = httpx.get(f"{account_manager.BACKEND_API_BASE}/health", timeout=PROBE_TIMEOUT_SECONDS)
+            backend_ok = response.status_code < 500
+            if not backend_ok:
+                backend_error = f"backend responded with {response.status_code}"
+        except httpx.HTTPError as exc:
+            backend_ok = False
+            backend_error = str(exc)
+    ok = bool(backend_ok) or local_ok
+    return ok, {
+        "backend_reachable": backend_ok,
+        "backend_skipped": encryption_client.is_open(),
+        "local_fallback": local_ok,
+        "error": None if ok else (backend_error or "no encryption backend available"),
+    }
+
+
+async def run_forever(get_mt5: Callable[[], Any]):
+    """Probe loop started from the app's startup hook."""
+    global _LAST_CYCLE
+    last_dependency_probe = 0.0
+    while True:
+        probes = [_run_probe("terminal", lambda: _probe_terminal(get_mt5()))]
+        if time.monotonic() - last_dependency_probe >= DEPENDENCY_PROBE_SECONDS:
+            last_dependency_probe = time.monotonic()
+            probes.append(_run_probe("supabase", _probe_supabase))
+            probes.append(_run_probe("encryption", _probe_encryption))
+        await asyncio.gather(*probes)
+        _LAST_CYCLE = time.time()
+        await asyncio.sleep(TERMINAL_PROBE_SECONDS)
+
+
+def start(get_mt5: Callable[[], Any]):
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(run_forever(get_mt5))
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        _task = None
+
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+
+def is_stale() -> bool:
+    """True when the prober hasn't completed a cycle recently (or ever)."""
+    if _LAST_CYCLE is None:
+        return True
+    return time.time() - _LAST_CYCLE > max(TERMINAL_PROBE_SECONDS, PROBE_TIMEOUT_SECONDS) * 3
+
+
+def get_checks() -> Dict[str, Dict[str, Any]]:
+    checks = {}
+    for name, check in _CHECKS.items():
+        entry = dict(check)
+        entry["checked_at"] = _iso(entry["checked_at"])
+        entry["last_success"] = _iso(entry["last_success"])
+        checks[name] = entry
+    login = account_switcher.get_current_login()
+    checks["login"] = {"ok": login is not None, "account": login}
+    connection = mt5_connection.get_status()
+    connection["opened_at"] = _iso(connection["opened_at"])
+    checks["connection"] = {"ok": not mt5_connection.is_open(), **connection}
+    return checks
+
+
+def is_ready() -> bool:
+    """Breaker closed, terminal connected and logged in; Supabase reachable when configured."""
+    terminal = _CHECKS.get("terminal", {})
+    supabase = _CHECKS.get("supabase", {})
+    if mt5_connection.is_open():
+        return False
+    if not terminal.get("ok") or account_switcher.get_current_login() is None:
+        return False
+    if supabase.get("configured") and not supabase.get("ok"):
+        return False
+    return not is_stale()
+
+
+def last_cycle() -> Optional[str]:
+    return _iso(_LAST_CYCLE)
@@ -0,0 +1,268 @@
+"""
+``Idempotency-Key`` support for the trading endpoints.
+
+A client that times out on a slow order and retries must not open a second
+position. Requests carrying an ``Idempotency-Key`` header are handled once
+per (user, key); every retry gets the first response back, marked with
+``Idempotent-Replayed: true``. A retry arriving while the first request is
+still running waits for it, so hedged retries are safe too.
+
+How it fits together:
+- the ``reserve`` dependency runs after authentication (so a replay never
+  skips token checks), claims the key and parks a slot in
+  ``request.state``;
+- ``IdempotencyMiddleware`` captures the response of any request holding a
+  slot and stores it;
+- replays and key reuse are raised as ``Replay``/HTTPException from the
+  dependency, before the handler runs.
+
+Responses are kept for ``MT5_IDEMPOTENCY_TTL_SECONDS`` in a bounded LRU,
+and in SQLite as well when ``MT5_IDEMPOTENCY_STORE`` is set, so keys
+survive restarts. A 429 or 503 answered before anything was sent to the
+terminal (rate limit, open circuit breaker, lane admission) is not stored
+and can be retried with the same key. Whether an order went out is
+tracked explicitly: services.order_pipeline calls ``mark_dispatched``
+around every ``order_send``. Any other response is stored, 500s and
+post-dispatch 503s included, because then the order's fate is unknown and
+re-sending could double it.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+TTL_SECONDS = float(os.getenv("MT5_IDEMPOTENCY_TTL_SECONDS", "86400"))
+MAX_KEYS = int(os.getenv("MT5_IDEMPOTENCY_MAX_KEYS", "10000"))
+STORE_PATH = os.getenv("MT5_IDEMPOTENCY_STORE")
+MAX_KEY_LENGTH = 255
+# Released rather than stored, as long as no order was dispatched
+RETRYABLE_STATUSES = (429, 503)
+
+IDEMPOTENT_REQUESTS = metrics.counter(
+    "mt5_bridge_idempotent_requests_total",
+    "Requests with an Idempotency-Key, by result (new/replayed/waited/conflict).",
+    ("result",),
+)
+
+
+class Replay(Exception):
+    """Raised by ``reserve`` to answer with a stored response."""
+
+    def __init__(self, status_code: int, body: bytes, content_type: str):
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+
+
+class _Slot:
+    """A key claimed by the request currently executing it."""
+
+    __slots__ = ("key", "fingerprint", "done", "dispatched")
+
+    def __init__(self, key: str, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.done = asyncio.get_running_loop().create_future()
+        # Set once anything was sent to the terminal for this request
+        self.dispatched = False
+
+
+# Slot of the request being handled; follows asyncio.to_thread into workers
+_CURRENT: ContextVar[Optional[_Slot]] = ContextVar("idempotency_slot", default=None)
+
+
+_LOCK = threading.Lock()
+# key -> _Slot while running, or (fingerprint, expires_at, status, body, content_type) once done
+_ENTRIES: "OrderedDict[str, Any]" = OrderedDict()
+_db: Optional[sqlite3.Connection] = None
+
+
+def _connect() -> Optional[sqlite3.Connection]:
+    global _db
+    if STORE_PATH and _db is None:
+        db = sqlite3.connect(STORE_PATH, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " status INTEGER NOT NULL,"
+            " body BLOB NOT NULL,"
+            " content_type TEXT NOT NULL)"
+        )
+        db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        _db = db
+    return _db
+
+
+def _remember(key: str, entry: Tuple):
+    _ENTRIES[key] = entry
+    _ENTRIES.move_to_end(key)
+    while len(_ENTRIES) > MAX_KEYS:
+        oldest, value = next(iter(_ENTRIES.items()))
+        if isinstance(value, _Slot):
+            break  # never evict a running request
+        del _ENTRIES[oldest]
+
+
+def _lookup(key: str) -> Any:
+    entry = _ENTRIES.get(key)
+    if entry is None:
+        db = _connect()
+        if db is not None:
+            row = db.execute(
+                "SELECT fingerprint, expires_at, status, body, content_type FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = tuple(row)
+                _remember(key, entry)
+    if isinstance(entry, tuple) and entry[1] < time.time():
+        del _ENTRIES[key]
+        return None
+    return entry
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url.path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def reserve(request: Request, user_id: str):
+    """
+    Claim the request's ``Idempotency-Key`` for ``user_id``. Returns without
+    doing anything when there is no key. Raises ``Replay`` when the key
+    already has a response, and 422 when it was used for a different request.
+    """
+    raw_key = request.headers.get(HEADER)
+    if not raw_key:
+        return
+    if len(raw_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+    key = f"{user_id}:{raw_key}"
+    fingerprint = _fingerprint(request, await request.body())
+    waited = False
+
+    while True:
+        with _LOCK:
+            entry = _lookup(key)
+            if entry is None:
+                slot = _Slot(key, fingerprint)
+                _remember(key, slot)
+                break
+        if (entry.fingerprint if isinstance(entry, _Slot) else entry[0]) != fingerprint:
+            IDEMPOTENT_REQUESTS.inc("conflict")
+            raise HTTPException(status_code=422, detail=f"{HEADER} was already used for a different request")
+        if isinstance(entry, _Slot):
+            # Same request still running (client retried or hedged): wait for it
+            waited = True
+            await asyncio.shield(entry.done)
+            continue
+        IDEMPOTENT_REQUESTS.inc("waited" if waited else "replayed")
+        _, _, status_code, body, content_type = entry
+        raise Replay(status_code, body, content_type)
+
+    IDEMPOTENT_REQUESTS.inc("new")
+    request.state.idempotency = slot
+    _CURRENT.set(slot)
+
+
+def mark_dispatched():
+    """
+    Record that the current request sent an order to the terminal. From then
+    on its response is stored whatever the status, 503 included.
+    """
+    slot = _CURRENT.get()
+    if slot is not None:
+        slot.dispatched = True
+
+
+def _finish(slot: _Slot, status_code: int, body: bytes, content_type: str):
+    with _LOCK:
+        if status_code in RETRYABLE_STATUSES and not slot.dispatched:
+            _ENTRIES.pop(slot.key, None)
+        else:
+            entry = (slot.fingerprint, time.time() + TTL_SECONDS, status_code, body, content_type)
+            _remember(slot.key, entry)
+            db = _connect()
+            if db is not None:
+                try:
+                    db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (slot.key,) + entry)
+                except sqlite3.Error as exc:
+                    logger.warning("Could not persist idempotent response: %s", exc)
+    if not slot.done.done():
+        slot.done.set_result(None)
+
+
+def replay_response(request: Request, exc: Replay) -> Response:
+    """Exception handler for ``Replay``."""
+    return Response(
+        content=exc.body,
+        status_code=exc.status_code,
+        media_type=exc.content_type or None,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyMiddleware:
+    """
+    Pure ASGI middleware storing the response of requests that claimed an
+    idempotency key (see ``reserve``). Other requests pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        content_type = ""
+        body_parts: List[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type", b"").decode("latin-1")
+            elif message["type"] == "http.response.body" and scope.get("state", {}).get("idempotency") is not None:
+                body_parts.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            # The order may or may not have been sent: never run it twice
+            slot = scope.get("state", {}).get("idempotency")
+            if slot is not None:
+                _finish(slot, 500, b'{"detail":"Internal Server Error"}', "application/json")
+            raise
+        slot = scope.get("state", {}).get("idempotency")
+        if slot is not None:
+            _finish(slot, status_code, b"".join(body_parts), content_type)
+
+
+def get_status() -> Dict[str, Any]:
+    with _LOCK:
+        running = sum(1 for entry in _ENTRIES.values() if isinstance(entry, _Slot))
+        return {"keys": len(_ENTRIES) - running, "running": running, "persisted": bool(STORE_PATH)}
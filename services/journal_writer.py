@@ -0,0 +1,317 @@
+"""
+Durable, batched writer for trade-journal entries.
+
+``enqueue()`` appends an entry to a local SQLite outbox and returns at once
+(one small WAL commit, no network). A background thread drains the outbox
+into Supabase's ``trade_journal`` table with bulk inserts, so a close-all
+burst costs one insert per ``MT5_JOURNAL_BATCH_SIZE`` positions instead of
+one blocking insert per position on the event loop.
+
+Delivery is at-least-once and survives restarts and Supabase outages:
+- a failed batch stays in the outbox and is retried with exponential backoff;
+- entries that failed ``POISON_ATTEMPTS`` times are retried one at a time,
+  so a single rejected row cannot hold back the rest;
+- before re-sending entries that failed before, tickets already present in
+  the journal are skipped (the earlier insert may have landed even though
+  the response was lost).
+
+Backlog size and age are exported as metrics. They, and ``get_status()``,
+come from a snapshot the writer thread refreshes after each pass, so
+readers on the event loop never wait for the outbox lock.
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.supabase_client import get_supabase_client
+from services import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_TABLE = "trade_journal"
+# Runtime state lives under MT5_DATA_DIR (default: data/ next to the code),
+# never in whatever directory the process happens to be started from
+DATA_DIR = os.getenv("MT5_DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+OUTBOX_PATH = os.getenv("MT5_JOURNAL_OUTBOX") or os.path.join(DATA_DIR, "mt5_journal_outbox.sqlite3")
+BATCH_SIZE = int(os.getenv("MT5_JOURNAL_BATCH_SIZE", "100"))
+FLUSH_SECONDS = float(os.getenv("MT5_JOURNAL_FLUSH_SECONDS", "1"))
+BACKOFF_INITIAL_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = float(os.getenv("MT5_JOURNAL_BACKOFF_MAX", "300"))
+POISON_ATTEMPTS = 3
+JOURNALED_RETENTION_SECONDS = 90 * 86400
+
+JOURNAL_FLUSHED = metrics.counter(
+    "mt5_bridge_journal_entries_flushed_total",
+    "Trade-journal entries leaving the outbox, by outcome (inserted/duplicate/failed).",
+    ("outcome",),
+)
+JOURNAL_BACKLOG = metrics.gauge("mt5_bridge_journal_backlog", "Trade-journal entries waiting in the outbox.")
+JOURNAL_OLDEST_SECONDS = metrics.gauge(
+    "mt5_bridge_journal_oldest_entry_age_seconds",
+    "Age of the oldest trade-journal entry still in the outbox.",
+)
+
+_LOCK = threading.Lock()
+_WAKE = threading.Event()
+_STOP = threading.Event()
+
+_db: Optional[sqlite3.Connection] = None
+_thread: Optional[threading.Thread] = None
+# Outbox counts as of the writer's last pass: (backlog, oldest created_at,
+# entries being retried). /health and the metrics read this instead of
+# querying SQLite (and waiting for _LOCK) on the event loop.
+_snapshot: Tuple[int, Optional[float], int] = (0, None, 0)
+
+
+def _connect() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(OUTBOX_PATH)), exist_ok=True)
+        db = sqlite3.connect(OUTBOX_PATH, check_same_thread=False, isolation_level=None)
+        # WAL + NORMAL: commits survive a process crash without an fsync each
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0,"
+            " last_error TEXT)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at, id)")
+        # Positions already journaled, so the API close path and the deal
+        # reconciler never both write the same close
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS journaled ("
+            " account_id TEXT NOT NULL,"
+            " mt5_ticket INTEGER NOT NULL,"
+            " journaled_at REAL NOT NULL,"
+            " PRIMARY KEY (account_id, mt5_ticket))"
+        )
+        db.execute("DELETE FROM journaled WHERE journaled_at < ?", (time.time() - JOURNALED_RETENTION_SECONDS,))
+        _db = db
+    return _db
+
+
+@contextmanager
+def transaction():
+    """
+    The outbox connection inside one SQLite transaction, for callers that
+    keep their own state next to the outbox (services.deal_reconciler
+    advances its high-water mark atomically with the entries it queues).
+    """
+    with _LOCK:
+        db = _connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+    _WAKE.set()
+
+
+def enqueue_in(db: sqlite3.Connection, entry: Dict[str, Any]) -> Optional[int]:
+    """Queue ``entry`` inside ``transaction()``. Returns None if its position was already journaled."""
+    ticket = entry.get("mt5_ticket")
+    if ticket:
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO journaled (account_id, mt5_ticket, journaled_at) VALUES (?, ?, ?)",
+            (str(entry.get("account_id", "")), int(ticket), time.time()),
+        )
+        if cursor.rowcount == 0:
+            return None
+    cursor = db.execute(
+        "INSERT INTO outbox (payload, created_at) VALUES (?, ?)", (json.dumps(entry, default=str), time.time())
+    )
+    return cursor.lastrowid
+
+
+def enqueue(entry: Dict[str, Any]) -> Optional[int]:
+    """
+    Persist one journal row for delivery; returns its outbox id, or None if
+    the position was already journaled.
+    """
+    with transaction() as db:
+        return enqueue_in(db, entry)
+
+
+def _due_batch(now: float) -> List[Tuple[int, Dict[str, Any], int]]:
+    with _LOCK:
+        rows = _connect().execute(
+            "SELECT id, payload, attempts FROM outbox WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (now, BATCH_SIZE),
+        ).fetchall()
+    if rows and rows[0][2] >= POISON_ATTEMPTS:
+        rows = rows[:1]
+    else:
+        rows = [row for row in rows if row[2] < POISON_ATTEMPTS]
+    return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts in rows]
+
+
+def _delete(ids: List[int]):
+    if not ids:
+        return
+    with _LOCK:
+        _connect().execute(f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+
+def _defer(batch: List[Tuple[int, Dict[str, Any], int]], error: str):
+    now = time.time()
+    with _LOCK:
+        db = _connect()
+        for row_id, _, attempts in batch:
+            delay = min(BACKOFF_INITIAL_SECONDS * (2 ** attempts), BACKOFF_MAX_SECONDS)
+            db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (now + random.uniform(delay / 2, delay), error[:500], row_id),
+            )
+
+
+def _already_journaled(supabase, batch) -> set:
+    """(user_id, mt5_ticket) pairs of retried entries that are already in the table."""
+    tickets = sorted({entry.get("mt5_ticket") for _, entry, attempts in batch if attempts > 0})
+    if not tickets:
+        return set()
+    result = supabase.table(JOURNAL_TABLE).select("user_id, mt5_ticket").in_("mt5_ticket", tickets).execute()
+    return {(str(row.get("user_id")), str(row.get("mt5_ticket"))) for row in result.data or ()}
+
+
+@metrics.observe_dependency("supabase", "journal_insert")
+def _insert(supabase, entries: List[Dict[str, Any]]):
+    return supabase.table(JOURNAL_TABLE).insert(entries).execute()
+
+
+def flush_once() -> int:
+    """Deliver one due batch. Returns the number of entries that left the outbox."""
+    batch = _due_batch(time.time())
+    if not batch:
+        return 0
+    supabase = get_supabase_client()
+    if supabase is None:
+        _defer(batch, "Supabase client not available")
+        return 0
+    try:
+        with tracing.span("journal_writer.flush", {"journal.batch_size": len(batch)}):
+            existing = _already_journaled(supabase, batch)
+            pending = [
+                (row_id, entry) for row_id, entry, _ in batch
+                if (str(entry.get("user_id")), str(entry.get("mt5_ticket"))) not in existing
+            ]
+            if pending:
+                _insert(supabase, [entry for _, entry in pending])
+    except Exception as exc:
+        _defer(batch, str(exc))
+        JOURNAL_FLUSHED.inc("failed", amount=len(batch))
+        logger.warning("Trade journal flush of %s entries failed (will retry): %s", len(batch), exc)
+        return 0
+    _delete([row_id for row_id, _, _ in batch])
+    JOURNAL_FLUSHED.inc("inserted", amount=len(pending))
+    if len(batch) > len(pending):
+        JOURNAL_FLUSHED.inc("duplicate", amount=len(batch) - len(pending))
+    logger.debug("Flushed %s trade journal entries", len(pending))
+    return len(batch)
+
+
+def _next_due_in() -> Optional[float]:
+    with _LOCK:
+        row = _connect().execute("SELECT MIN(next_attempt_at) FROM outbox").fetchone()
+    if row is None or row[0] is None:
+        return None
+    return max(0.0, row[0] - time.time())
+
+
+def _refresh_snapshot():
+    global _snapshot
+    with _LOCK:
+        count, oldest, failing = _connect().execute(
+            "SELECT COUNT(*), MIN(created_at), SUM(attempts > 0) FROM outbox"
+        ).fetchone()
+    _snapshot = (count, oldest, failing or 0)
+
+
+def _run():
+    while not _STOP.is_set():
+        try:
+            while not _STOP.is_set() and flush_once():
+                pass
+            _refresh_snapshot()
+            wait = _next_due_in()
+        except Exception as exc:
+            logger.error("Trade journal writer error: %s", exc, exc_info=True)
+            wait = FLUSH_SECONDS
+        # Sleep until enqueue() wakes us or a deferred entry is due again
+        _WAKE.wait(wait)
+        _WAKE.clear()
+        # Short pause after a wake-up lets a close-all burst land in one batch
+        _STOP.wait(FLUSH_SECONDS)
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _STOP.clear()
+        _connect()
+        _thread = threading.Thread(target=_run, name="journal-writer", daemon=True)
+        _thread.start()
+        _refresh_snapshot()
+        pending = _snapshot[0]
+        if pending:
+            logger.info("Trade journal outbox has %s undelivered entries from a previous run", pending)
+
+
+def stop(timeout: float = 5.0):
+    """Stop the writer after a last flush attempt; undelivered entries stay on disk."""
+    global _thread
+    _STOP.set()
+    _WAKE.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        _thread = None
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and flush_once():
+            pass
+    except Exception as exc:
+        logger.warning("Final trade journal flush failed: %s", exc)
+
+
+def backlog() -> int:
+    with _LOCK:
+        return _connect().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+def get_status() -> Dict[str, Any]:
+    """Outbox state as of the writer's last pass (up to ``MT5_JOURNAL_FLUSH_SECONDS`` behind). Never blocks."""
+    count, oldest, failing = _snapshot
+    return {
+        "backlog": count,
+        "oldest_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+        "retrying": failing,
+        "running": _thread is not None and _thread.is_alive(),
+    }
+
+
+def _backlog_samples():
+    if _db is not None:
+        yield (), _snapshot[0]
+
+
+def _oldest_samples():
+    if _db is not None:
+        oldest = _snapshot[1]
+        yield (), time.time() - oldest if oldest else 0
+
+
+JOURNAL_BACKLOG.add_callback(_backlog_samples)
+JOURNAL_OLDEST_SECONDS.add_callback(_oldest_samples)
@@ -0,0 +1,224 @@
+"""
+Non-blocking logging pipeline.
+
+Records are handed to a bounded in-memory queue on the calling thread (the
+event loop, executor workers) and formatted and written to stderr by a
+single ``QueueListener`` thread, so a slow stdout pipe or journald never
+stalls a request. What stays on the calling thread is cheap:
+
+- level check (``logger.debug("... %s", x)`` costs nothing when DEBUG is off)
+- per-logger sampling of chatty sub-WARNING lines (``MT5_LOG_SAMPLE``)
+- a shallow record copy; ``%``-style arguments are interpolated later on the
+  listener thread when they are immutable scalars
+
+Environment:
+    MT5_LOG_LEVEL       root level (default INFO)
+    MT5_LOG_FORMAT      ``text`` (default, the classic format) or ``json``
+    MT5_LOG_ASYNC       ``0`` writes synchronously, as before (default 1)
+    MT5_LOG_QUEUE_SIZE  records buffered before new ones are dropped (default 10000)
+    MT5_LOG_SAMPLE      ``logger=rate`` pairs, e.g.
+                        ``services.mt5_remote=0.01,mt5_api_bridge=0.25``;
+                        keeps that fraction of DEBUG/INFO records from the
+                        logger and its children. WARNING and above always pass.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from services import metrics
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOG_LEVEL = os.getenv("MT5_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("MT5_LOG_FORMAT", "text").lower()
+LOG_ASYNC = os.getenv("MT5_LOG_ASYNC", "1").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("MT5_LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE = os.getenv("MT5_LOG_SAMPLE", "")
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_LAZY_ARG_TYPES = (str, int, float, bool, type(None))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_lock = threading.Lock()
+
+LOG_RECORDS_DROPPED = metrics.counter(
+    "mt5_bridge_log_records_dropped_total",
+    "Log records discarded because the logging queue was full.",
+)
+LOG_QUEUE_DEPTH = metrics.gauge("mt5_bridge_log_queue_depth", "Log records waiting for the writer thread.")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = record.stack_info
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in ``round(1 / rate)`` sub-WARNING records per configured
+    logger prefix. Counter-based rather than random: cheaper, and a burst of
+    identical lines is thinned evenly.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first so "services.mt5_remote" beats "services"
+        self._every = sorted(
+            ((name, max(1, round(1 / rate)) if rate > 0 else 0) for name, rate in rates.items()),
+            key=lambda item: -len(item[0]),
+        )
+        self._counters: Dict[str, int] = {}
+        self._resolved: Dict[str, Optional[tuple]] = {}
+
+    def _rule(self, logger_name: str) -> Optional[tuple]:
+        try:
+            return self._resolved[logger_name]
+        except KeyError:
+            rule = None
+            for prefix, every in self._every:
+                if logger_name == prefix or logger_name.startswith(prefix + "."):
+                    rule = (prefix, every)
+                    break
+            self._resolved[logger_name] = rule
+            return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        prefix, every = rule
+        if every == 0:
+            return False
+        # Races between threads only skew which record is kept, never the rate
+        count = self._counters.get(prefix, 0)
+        self._counters[prefix] = count + 1
+        return count % every == 0
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        name, sep, rate = part.strip().partition("=")
+        if not sep or not name:
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks and defers message interpolation.
+
+    The stdlib ``prepare`` formats the whole record on the calling thread,
+    which is exactly the work this pipeline moves off it. Here the record is
+    only copied; ``msg % args`` is left to the listener unless an argument is
+    mutable (it could change before the listener gets to it). Tracebacks are
+    rendered immediately since the frames do not outlive the ``except``.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _LAZY_ARG_TYPES) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Losing a log line beats stalling the event loop behind stderr
+            LOG_RECORDS_DROPPED.inc()
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def configure() -> logging.Logger:
+    """Install the pipeline on the root logger. Safe to call twice."""
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    with _lock:
+        # Like basicConfig: leave logging alone if something already set it up
+        if _queue_handler is not None or root.handlers:
+            return root
+        root.setLevel(LOG_LEVEL)
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(_formatter())
+
+        rates = parse_sample_rates(LOG_SAMPLE)
+        if not LOG_ASYNC:
+            if rates:
+                output.addFilter(SamplingFilter(rates))
+            root.addHandler(output)
+            return root
+
+        _queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        if rates:
+            # Filter before enqueueing so sampled-out records cost no copy
+            _queue_handler.addFilter(SamplingFilter(rates))
+        root.addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop)
+    return root
+
+
+def stop():
+    """Drain the queue and stop the writer thread (at interpreter exit)."""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+        _listener = _queue_handler = None
+
+
+def _queue_depth_samples():
+    if _queue_handler is not None:
+        yield (), _queue_handler.queue.qsize()
+
+
+LOG_QUEUE_DEPTH.add_callback(_queue_depth_samples)
@@ -0,0 +1,320 @@
+"""
+Minimal in-process Prometheus metrics (text exposition format 0.0.4).
+
+Hand-rolled rather than pulling in prometheus_client: the bridge only needs
+counters, fixed-bucket histograms and scrape-time gauges. Recording is a
+dict lookup, a bisect and two additions under an uncontended lock, so it
+can sit on every request and every MT5 call. Gauges are callbacks
+evaluated only when ``/metrics`` is scraped.
+
+Usage:
+    REQUESTS = metrics.counter("name_total", "help", ("label",))
+    REQUESTS.inc("value")
+    with metrics.timer(LATENCY, "label-value"):
+        ...
+"""
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services import request_timing, tracing
+
+# Seconds; covers sub-millisecond cached calls up to a hung RPyC request
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY: List["_Metric"] = []
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def expose(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._values.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Values produced by a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks: List[Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]] = []
+
+    def add_callback(self, callback: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]):
+        """``callback()`` yields ``(labelvalues, value)`` pairs."""
+        self._callbacks.append(callback)
+
+    def expose(self) -> List[str]:
+        lines = []
+        for callback in list(self._callbacks):
+            try:
+                samples = list(callback())
+            except Exception:
+                continue  # a broken gauge must not break the scrape
+            lines.extend(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in samples)
+        return lines
+
+
+def _register(metric):
+    with _REGISTRY_LOCK:
+        for existing in _REGISTRY:
+            if existing.name == metric.name:
+                return existing
+        _REGISTRY.append(metric)
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, documentation, labelnames))
+
+
+@contextmanager
+def timer(histogram_metric: Histogram, *labelvalues: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram_metric.observe(time.perf_counter() - started, *labelvalues)
+
+
+def render() -> str:
+    with _REGISTRY_LOCK:
+        registry = list(_REGISTRY)
+    lines: List[str] = []
+    for metric in registry:
+        lines.extend(metric.header())
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# ---------- metrics shared across modules ----------
+
+HTTP_REQUEST_SECONDS = histogram(
+    "mt5_bridge_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = gauge("mt5_bridge_http_requests_in_flight", "HTTP requests currently being served.")
+MT5_CALL_SECONDS = histogram(
+    "mt5_bridge_mt5_call_duration_seconds",
+    "Latency of calls into the MT5 terminal, by API method.",
+    ("method",),
+)
+MT5_CALL_ERRORS = counter(
+    "mt5_bridge_mt5_call_errors_total",
+    "MT5 terminal calls that raised, by API method and exception type.",
+    ("method", "error"),
+)
+LOGINS = counter("mt5_bridge_account_logins_total", "Terminal logins performed by the account switcher.", ("result",))
+LOGIN_SECONDS = histogram("mt5_bridge_account_login_duration_seconds", "Duration of terminal logins.")
+CACHE_REQUESTS = counter("mt5_bridge_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+DEPENDENCY_SECONDS = histogram(
+    "mt5_bridge_dependency_call_duration_seconds",
+    "Latency of calls to Supabase and the encryption service.",
+    ("dependency", "operation", "outcome"),
+)
+EXECUTOR_QUEUE_DEPTH = gauge("mt5_bridge_executor_queue_depth", "Work items waiting for a thread, by executor.", ("executor",))
+
+
+def cache_hit(cache: str):
+    CACHE_REQUESTS.inc(cache, "hit")
+
+
+def cache_miss(cache: str):
+    CACHE_REQUESTS.inc(cache, "miss")
+
+
+def observe_dependency(dependency: str, operation: Optional[str] = None):
+    """Decorator timing (and tracing) a Supabase / encryption-service call."""
+    def decorate(function):
+        name = operation or function.__name__
+        span_name = f"{dependency}.{name}"
+
+        def observe(started: float, outcome: str):
+            elapsed = time.perf_counter() - started
+            DEPENDENCY_SECONDS.observe(elapsed, dependency, name, outcome)
+            request_timing.record(span_name, elapsed)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    with tracing.span(span_name, {"peer.service": dependency}):
+                        result = await function(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    observe(started, outcome)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                with tracing.span(span_name, {"peer.service": dependency}):
+                    result = function(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                observe(started, outcome)
+
+        return wrapper
+    return decorate
+
+
+_EXECUTORS: Dict[str, Callable[[], object]] = {}
+
+
+def track_executor(name: str, executor_getter: Callable[[], object]):
+    """Expose the backlog of a ThreadPoolExecutor (resolved at scrape time)."""
+    _EXECUTORS[name] = executor_getter
+
+
+def _executor_samples():
+    for name, getter in list(_EXECUTORS.items()):
+        queue = getattr(getter(), "_work_queue", None)
+        if queue is not None:
+            yield (name,), queue.qsize()
+
+
+EXECUTOR_QUEUE_DEPTH.add_callback(_executor_samples)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency per route template
+    (``/api/v1/positions/{ticket}``, not the raw path) and in-flight count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        HTTP_IN_FLIGHT.add_callback(lambda: [((), self.in_flight)])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight -= 1
+            route = scope.get("route")
+            # Unmatched paths share one series so scanners can't blow up cardinality
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], template, str(status_code))
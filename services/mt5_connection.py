@@ -0,0 +1,330 @@
+"""
+MT5 terminal connection supervisor with a circuit breaker.
+
+Request handlers get the terminal through ``get_terminal()``, which hands
+out a thin proxy around the live mt5linux/MetaTrader5 object. Every call
+through the proxy reports success or failure here:
+
+- a dropped RPyC connection (EOF, reset, closed socket) opens the breaker
+  immediately;
+- RPyC timeouts open it after ``MT5_BREAKER_FAILURE_THRESHOLD`` consecutive
+  failures.
+
+While the breaker is open, requests fail fast with 503 and a background
+thread reconnects with exponential backoff, re-runs ``initialize()`` and
+restores the last login before closing the breaker again.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from services import account_switcher, metrics, mt5_lanes, request_timing, tracing
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("MT5_BREAKER_FAILURE_THRESHOLD", "3"))
+BACKOFF_INITIAL_SECONDS = float(os.getenv("MT5_RECONNECT_BACKOFF_INITIAL", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("MT5_RECONNECT_BACKOFF_MAX", "30"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+
+# Helper round trips are timed by services.mt5_remote under the MT5
+# function they wrap, so the raw eval/execute aren't timed twice.
+_UNTIMED_METHODS = frozenset(("eval", "execute"))
+
+_LOCK = threading.Lock()
+_WAKE = threading.Event()
+_STOP = threading.Event()
+
+_factory: Optional[Callable[[], Any]] = None
+_terminal: Any = None
+_state = STATE_CLOSED
+_consecutive_failures = 0
+_opened_at: Optional[float] = None
+_last_error: Optional[str] = None
+_reconnect_attempts = 0
+_next_attempt_at: Optional[float] = None
+_thread: Optional[threading.Thread] = None
+_on_reconnect: List[Callable[[Any], None]] = [account_switcher.restore_last_session]
+
+
+def _rpyc_connection(terminal):
+    # mt5linux keeps its RPyC connection in a name-mangled private attribute
+    return getattr(terminal, "_MetaTrader5__conn", None)
+
+
+def set_request_timeout(terminal, seconds: float):
+    """Bound how long a single RPyC call may block (rpyc's default is 30s)."""
+    conn = _rpyc_connection(terminal)
+    if conn is not None:
+        conn._config["sync_request_timeout"] = seconds
+
+
+def _is_connection_lost(exc: BaseException) -> bool:
+    if isinstance(exc, TimeoutError):
+        return False
+    return isinstance(exc, (EOFError, ConnectionError, OSError))
+
+
+def _open_locked(reason: str):
+    global _state, _opened_at, _next_attempt_at
+    if _state == STATE_OPEN:
+        return
+    _state = STATE_OPEN
+    _opened_at = time.time()
+    _next_attempt_at = time.time()
+    account_switcher.invalidate_current_login()
+    logger.error("🔌 MT5 circuit breaker opened: %s", reason)
+    _WAKE.set()
+
+
+def report_failure(terminal, method: str, exc: BaseException):
+    """Called by the proxy when a terminal call raises."""
+    global _consecutive_failures, _last_error
+    if not isinstance(exc, (TimeoutError, EOFError, ConnectionError, OSError)):
+        # Application-level errors (bad symbol, remote ValueError...) say
+        # nothing about the health of the connection.
+        return
+    with _LOCK:
+        if terminal is not _terminal:
+            return  # stale proxy from before a reconnect
+        _consecutive_failures += 1
+        _last_error = f"{method}: {exc}"
+        if _is_connection_lost(exc):
+            _open_locked(f"connection lost during {method}(): {exc}")
+        elif _consecutive_failures >= FAILURE_THRESHOLD:
+            _open_locked(f"{_consecutive_failures} consecutive failures, last {method}(): {exc}")
+
+
+def report_success():
+    global _consecutive_failures
+    if _consecutive_failures:
+        _consecutive_failures = 0
+
+
+def _retry_after() -> int:
+    if _next_attempt_at is None:
+        return 1
+    return max(1, int(round(_next_attempt_at - time.time())))
+
+
+class TerminalUnavailable(HTTPException):
+    """503 raised by the proxy instead of making a call: nothing reached the terminal."""
+
+
+def _unavailable() -> TerminalUnavailable:
+    return TerminalUnavailable(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="MT5 terminal connection is down; reconnecting. Please retry shortly.",
+        headers={"Retry-After": str(_retry_after())},
+    )
+
+
+class _GuardedTerminal:
+    """
+    Proxy that routes every terminal call through the circuit breaker and
+    the priority lanes (services.mt5_lanes).
+    """
+
+    __slots__ = ("_terminal",)
+
+    def __init__(self, terminal):
+        self._terminal = terminal
+
+    def __getattr__(self, name):
+        attr = getattr(self._terminal, name)
+        if not callable(attr):
+            return attr
+        return _guard(self._terminal, name, attr, timed=name not in _UNTIMED_METHODS)
+
+    def guard(self, name: str, function: Callable) -> Callable:
+        """
+        ``function`` obtained from this terminal (e.g. a remote callable from
+        ``eval``) behind the same breaker and lanes as the terminal's own
+        methods. Not timed: callers time it under their own name.
+        """
+        return _guard(self._terminal, name, function, timed=False)
+
+
+def _guard(terminal, name: str, attr: Callable, timed: bool) -> Callable:
+    span_name = "mt5." + name
+
+    def call(*args, **kwargs):
+        if _state == STATE_OPEN or terminal is not _terminal:
+            raise _unavailable()
+        with mt5_lanes.admit():
+            if _state == STATE_OPEN or terminal is not _terminal:
+                raise _unavailable()  # the breaker opened while this call was queued
+            started = time.perf_counter()
+            try:
+                with tracing.span(span_name, {"rpc.system": "rpyc", "rpc.method": name}, require_parent=True) if timed else tracing.NOOP:
+                    result = attr(*args, **kwargs)
+            except Exception as exc:
+                if timed:
+                    metrics.MT5_CALL_ERRORS.inc(name, type(exc).__name__)
+                report_failure(terminal, name, exc)
+                raise
+            finally:
+                if timed:
+                    elapsed = time.perf_counter() - started
+                    metrics.MT5_CALL_SECONDS.observe(elapsed, name)
+                    request_timing.record(span_name, elapsed)
+        report_success()
+        return result
+
+    call.__name__ = name
+    return call
+
+
+def configure(factory: Callable[[], Any], terminal: Any = None):
+    """
+    Register how to build a fresh terminal connection and the instance
+    created at startup (None if the first connection attempt failed).
+    """
+    global _factory, _terminal
+    with _LOCK:
+        _factory = factory
+        _terminal = terminal
+        if terminal is None:
+            _open_locked("initial connection failed")
+
+
+def add_reconnect_callback(callback: Callable[[Any], None]):
+    _on_reconnect.append(callback)
+
+
+def current() -> Optional[_GuardedTerminal]:
+    """The guarded terminal, or None while disconnected. Never raises."""
+    if _terminal is None or _state == STATE_OPEN:
+        return None
+    return _GuardedTerminal(_terminal)
+
+
+def identity(terminal) -> int:
+    """Stable id of the connection behind a proxy (a new proxy is handed out per call)."""
+    return id(getattr(terminal, "_terminal", terminal))
+
+
+def get_terminal() -> _GuardedTerminal:
+    """The guarded terminal, failing fast with 503 while the breaker is open."""
+    terminal = current()
+    if terminal is None:
+        raise _unavailable()
+    return terminal
+
+
+def _close_quietly(terminal):
+    conn = _rpyc_connection(terminal)
+    if conn is None:
+        return
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _attempt_reconnect() -> bool:
+    global _terminal, _state, _consecutive_failures, _opened_at, _last_error, _reconnect_attempts
+    _reconnect_attempts += 1
+    old = _terminal
+    try:
+        fresh = _factory()
+        if hasattr(fresh, "initialize") and not fresh.initialize():
+            error = fresh.last_error() if hasattr(fresh, "last_error") else "Unknown error"
+            raise ConnectionError(f"initialize() returned False: {error}")
+        for callback in _on_reconnect:
+            try:
+                callback(fresh)
+            except Exception as exc:
+                # A failed login restore shouldn't keep the terminal down;
+                # the next request will log in on demand.
+                logger.warning("Reconnect callback %s failed: %s", getattr(callback, "__name__", callback), exc)
+    except Exception as exc:
+        _last_error = f"reconnect: {exc}"
+        logger.warning("MT5 reconnect attempt %s failed: %s", _reconnect_attempts, exc)
+        return False
+
+    with _LOCK:
+        _terminal = fresh
+        _state = STATE_CLOSED
+        _consecutive_failures = 0
+        downtime = time.time() - _opened_at if _opened_at else 0
+        _opened_at = None
+    if old is not None and old is not fresh:
+        _close_quietly(old)
+    logger.info("✅ MT5 connection restored after %.1fs (attempt %s)", downtime, _reconnect_attempts)
+    return True
+
+
+def _supervise():
+    global _next_attempt_at
+    while not _STOP.is_set():
+        _WAKE.wait()
+        if _STOP.is_set():
+            break
+        delay = BACKOFF_INITIAL_SECONDS
+        while not _STOP.is_set() and _state == STATE_OPEN:
+            if _factory is not None and _attempt_reconnect():
+                break
+            # Full jitter keeps several bridges from hammering a
+            # restarting terminal in lockstep.
+            wait = random.uniform(delay / 2, delay)
+            _next_attempt_at = time.time() + wait
+            _STOP.wait(wait)
+            delay = min(delay * 2, BACKOFF_MAX_SECONDS)
+        _WAKE.clear()
+        if _state == STATE_OPEN:
+            _WAKE.set()
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _STOP.clear()
+        _thread = threading.Thread(target=_supervise, name="mt5-supervisor", daemon=True)
+        _thread.start()
+
+
+def shutdown():
+    """Stop the supervisor and shut the terminal connection down."""
+    global _terminal
+    _STOP.set()
+    _WAKE.set()
+    with _LOCK:
+        terminal, _terminal = _terminal, None
+    if terminal is not None and hasattr(terminal, "shutdown"):
+        try:
+            terminal.shutdown()
+        except Exception as exc:
+            logger.warning("MT5 shutdown failed: %s", exc)
+    if terminal is not None:
+        _close_quietly(terminal)
+
+
+def _breaker_samples():
+    yield (), 1 if _state == STATE_OPEN else 0
+
+
+metrics.gauge("mt5_bridge_circuit_breaker_open", "1 while the MT5 circuit breaker is open.").add_callback(_breaker_samples)
+
+
+def is_open() -> bool:
+    return _state == STATE_OPEN
+
+
+def get_status() -> Dict[str, Any]:
+    return {
+        "state": _state,
+        "consecutive_failures": _consecutive_failures,
+        "opened_at": _opened_at,
+        "reconnect_attempts": _reconnect_attempts,
+        "retry_after": _retry_after() if _state == STATE_OPEN else None,
+        "last_error": _last_error,
+    }
@@ -0,0 +1,183 @@
+"""
+Priority lanes for terminal calls.
+
+Every call through the guarded terminal (services.mt5_connection) is
+admitted by one scheduler, in four lanes:
+
+    trading      order_send and friends        (highest)
+    account      account info, positions, pending orders, logins
+    market_data  bars and ticks
+    bulk         symbol scans, deal history, background reconciliation
+
+The terminal has ``MT5_TERMINAL_CONCURRENCY`` call slots, and each lane
+has its own budget (``MT5_LANE_LIMITS``). Lanes other than trading may
+not take the last ``MT5_TRADING_RESERVED_SLOTS`` free slots. A freed slot
+goes to the highest-priority waiter; within a lane, waiters are served
+first come, first served. So however much history or bar downloading is
+going on, an order waits at most for a call already running. Calls are
+never interrupted.
+
+The lane is taken from a context variable, set by the ``lane`` decorator
+on handlers or by ``use_lane`` in background threads. It follows
+``asyncio.to_thread`` into worker threads, and defaults to ``account``.
+"""
+
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List
+
+from services import metrics, request_timing
+
+TRADING = "trading"
+ACCOUNT = "account"
+MARKET_DATA = "market_data"
+BULK = "bulk"
+LANES = (TRADING, ACCOUNT, MARKET_DATA, BULK)
+
+DEFAULT_LIMITS = {TRADING: 4, ACCOUNT: 3, MARKET_DATA: 2, BULK: 1}
+
+LANE_WAIT_SECONDS = metrics.histogram(
+    "mt5_bridge_lane_wait_seconds",
+    "Time terminal calls waited for a slot, by lane.",
+    ("lane",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LANE_IN_FLIGHT = metrics.gauge("mt5_bridge_lane_in_flight", "Terminal calls running, by lane.", ("lane",))
+LANE_QUEUED = metrics.gauge("mt5_bridge_lane_queued", "Terminal calls waiting for a slot, by lane.", ("lane",))
+
+_LANE: ContextVar[str] = ContextVar("mt5_lane", default=ACCOUNT)
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """``"trading=4,bulk=1"`` -> lane budgets, defaults for lanes not named."""
+    limits = dict(DEFAULT_LIMITS)
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip() in limits:
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+class Scheduler:
+    """Admits calls by lane priority within a total and per-lane budget."""
+
+    def __init__(self, total: int, limits: Dict[str, int], reserved: int):
+        self.total = max(1, total)
+        self.limits = limits
+        self.reserved = min(max(0, reserved), self.total - 1)
+        self._cond = threading.Condition(threading.Lock())
+        self._running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._waiting: Dict[str, Deque[object]] = {lane: deque() for lane in LANES}
+
+    def _can_run(self, lane: str, ticket: object) -> bool:
+        if self._waiting[lane][0] is not ticket or self._running[lane] >= self.limits[lane]:
+            return False
+        busy = sum(self._running.values())
+        if busy >= self.total or (lane != TRADING and busy >= self.total - self.reserved):
+            return False
+        # A waiting higher-priority lane that has budget goes first
+        for higher in LANES[:LANES.index(lane)]:
+            if self._waiting[higher] and self._running[higher] < self.limits[higher]:
+                return False
+        return True
+
+    def acquire(self, lane: str) -> float:
+        """Block until ``lane`` may run a call; returns the seconds waited."""
+        ticket = object()
+        started = time.perf_counter()
+        with self._cond:
+            self._waiting[lane].append(ticket)
+            try:
+                while not self._can_run(lane, ticket):
+                    self._cond.wait()
+            finally:
+                self._waiting[lane].remove(ticket)
+            self._running[lane] += 1
+            # The next waiter in this lane may be admissible too
+            self._cond.notify_all()
+        return time.perf_counter() - started
+
+    def release(self, lane: str):
+        with self._cond:
+            self._running[lane] -= 1
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                lane: {"running": self._running[lane], "queued": len(self._waiting[lane]), "limit": self.limits[lane]}
+                for lane in LANES
+            }
+
+
+_SCHEDULER = Scheduler(
+    int(os.getenv("MT5_TERMINAL_CONCURRENCY", "4")),
+    parse_limits(os.getenv("MT5_LANE_LIMITS", "")),
+    int(os.getenv("MT5_TRADING_RESERVED_SLOTS", "1")),
+)
+
+
+@contextmanager
+def admit(lane: str = None):
+    """Hold a terminal call slot of ``lane`` (default: the current lane)."""
+    lane = lane or _LANE.get()
+    waited = _SCHEDULER.acquire(lane)
+    LANE_WAIT_SECONDS.observe(waited, lane)
+    if waited >= 0.001:
+        request_timing.record("mt5.queue", waited)
+    try:
+        yield
+    finally:
+        _SCHEDULER.release(lane)
+
+
+def current() -> str:
+    return _LANE.get()
+
+
+@contextmanager
+def use_lane(lane: str):
+    """Run terminal calls in this block (and threads started from it via to_thread) in ``lane``."""
+    token = _LANE.set(lane)
+    try:
+        yield
+    finally:
+        _LANE.reset(token)
+
+
+def lane(name: str):
+    """Decorator putting a handler's terminal calls in lane ``name``."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with use_lane(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with use_lane(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def get_status() -> Dict[str, Dict[str, int]]:
+    return _SCHEDULER.snapshot()
+
+
+def _samples(field: str):
+    def collect() -> List:
+        return [((lane_name,), values[field]) for lane_name, values in _SCHEDULER.snapshot().items()]
+    return collect
+
+
+LANE_IN_FLIGHT.add_callback(_samples("running"))
+LANE_QUEUED.add_callback(_samples("queued"))
@@ -0,0 +1,75 @@
+"""
+Compact local copies of MT5 result structures.
+
+Each record declares, via ``__slots__``, exactly the fields the bridge
+reads. services.mt5_remote asks the terminal side for those fields only,
+so results cross the RPyC boundary once, by value, and handler code never
+holds a remote proxy.
+"""
+
+from typing import Any, Dict
+
+
+class MT5Record:
+    """Base for slot-only records built from a tuple of field values."""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def _asdict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Position(MT5Record):
+    __slots__ = (
+        "ticket", "time", "type", "magic", "volume", "price_open", "sl", "tp",
+        "price_current", "swap", "profit", "symbol", "comment",
+    )
+
+
+class Deal(MT5Record):
+    __slots__ = (
+        "ticket", "order", "time", "type", "entry", "magic", "position_id",
+        "volume", "price", "commission", "swap", "profit", "symbol", "comment", "reason",
+    )
+
+
+class Order(MT5Record):
+    __slots__ = (
+        "ticket", "time_setup", "time_expiration", "type", "type_time", "magic", "volume_current",
+        "price_open", "sl", "tp", "price_current", "price_stoplimit", "symbol", "comment",
+    )
+
+
+class SymbolInfo(MT5Record):
+    __slots__ = (
+        "name", "description", "currency_base", "currency_profit", "digits", "spread",
+        "filling_mode", "bid", "ask", "point", "trade_stops_level",
+        "volume_min", "volume_max", "volume_step",
+    )
+
+
+class Tick(MT5Record):
+    __slots__ = ("time", "bid", "ask", "last", "volume", "time_msc")
+
+
+class AccountInfo(MT5Record):
+    __slots__ = (
+        "login", "balance", "equity", "margin", "margin_free", "margin_level",
+        "profit", "server", "currency", "leverage", "company",
+    )
+
+
+class TerminalInfo(MT5Record):
+    __slots__ = ("connected", "trade_allowed", "ping_last")
+
+
+class OrderSendResult(MT5Record):
+    __slots__ = ("retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id")
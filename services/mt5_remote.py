@@ -0,0 +1,289 @@
+"""
+Terminal-side batching of MT5 calls.
+
+With mt5linux every attribute read on a returned TradePosition, SymbolInfo
+or TradeDeal is a separate RPyC round trip. This module installs a small
+helper namespace inside the Windows-side RPyC server (via the connection's
+``execute``) whose functions run compound operations next to the terminal
+and return nested tuples of primitives. The helpers are installed once per
+connection and then called as remote callables (fetched with one ``eval``),
+never by generating source text. Arguments and results are nested tuples
+of primitives, which RPyC's brine serializer passes by value (dicts travel
+as tagged item tuples), so each helper call costs exactly one round trip
+no matter how many rows or fields come back, and any float (nan, inf)
+survives the trip.
+
+The helpers only send back the fields named by the requested record type
+(see services.mt5_records), already materialized, so handlers work with
+local ``__slots__`` records and never touch a remote proxy.
+
+The Windows ``MetaTrader5`` package has no ``execute``/``eval``; there the
+same helper source is exec'd locally against the module.
+"""
+
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from services import metrics, request_timing, tracing
+from services.mt5_records import (
+    AccountInfo,
+    Deal,
+    MT5Record,
+    Order,
+    OrderSendResult,
+    Position,
+    SymbolInfo,
+    TerminalInfo,
+    Tick,
+)
+
+logger = logging.getLogger(__name__)
+
+HELPER_VERSION = 6
+
+# Marks a dict sent as a tuple of (key, value) pairs: brine passes dicts by
+# reference, which would cost a round trip per key read on the server.
+_DICT_TAG = "__bridge_dict__"
+
+# Runs inside the RPyC server, where mt5linux has already done
+# ``import MetaTrader5 as mt5``. Must only return brine-able values:
+# None, bool, int, float, str, bytes and (nested) tuples of those.
+HELPER_SOURCE = '''
+import time as _bridge_time
+
+_bridge_helpers_version = %d
+
+def _bridge_unwire(value):
+    if isinstance(value, tuple):
+        if value[:1] == (%r,):
+            return dict((key, _bridge_unwire(item)) for key, item in value[1])
+        return tuple(_bridge_unwire(item) for item in value)
+    return value
+
+def _bridge_entry(function):
+    # Helpers are called with wired arguments (see _wire in mt5_remote)
+    def entry(*args):
+        return function(*[_bridge_unwire(arg) for arg in args])
+    return entry
+
+def _bridge_pack(item, fields):
+    if item is None:
+        return None
+    return tuple(getattr(item, name, None) for name in fields)
+
+def _bridge_fetch(function, args, kwargs, fields):
+    result = getattr(mt5, function)(*args, **kwargs)
+    if result is None:
+        return None
+    if isinstance(result, tuple) and not hasattr(result, "_asdict"):
+        return (True, tuple(_bridge_pack(item, fields) for item in result))
+    return (False, _bridge_pack(result, fields))
+
+def _bridge_symbol_snapshot(symbol, info_fields, tick_fields):
+    info = mt5.symbol_info(symbol)
+    if info is None:
+        return None
+    return (_bridge_pack(info, info_fields), _bridge_pack(mt5.symbol_info_tick(symbol), tick_fields))
+
+def _bridge_symbol_snapshots(symbols, info_fields, tick_fields):
+    return tuple(_bridge_symbol_snapshot(symbol, info_fields, tick_fields) for symbol in symbols)
+
+def _bridge_order_batch(orders, fields, retry_retcode):
+    # Each order is (request, filling modes); modes are tried in turn only
+    # while the terminal answers retry_retcode (unsupported filling mode). A
+    # request with price None gets the current ask (buy) or bid (sell).
+    results = []
+    for request, fillings in orders:
+        started = _bridge_time.perf_counter()
+        if "price" in request and request["price"] is None:
+            tick = mt5.symbol_info_tick(request["symbol"])
+            request = dict(request, price=(tick.ask if request["type"] == 0 else tick.bid) if tick is not None else 0.0)
+        packed = error = filling = None
+        for filling in fillings:
+            attempt = dict(request)
+            if filling is not None:
+                attempt["type_filling"] = filling
+            try:
+                result = mt5.order_send(attempt)
+            except Exception as exc:
+                # Fate unknown: never resend with another filling mode
+                error = "%%s: %%s" %% (type(exc).__name__, exc)
+                break
+            if result is None:
+                error = "Order send returned None"
+                break
+            packed = _bridge_pack(result, fields)
+            if result.retcode != retry_retcode:
+                break
+        results.append((packed, filling, error, _bridge_time.perf_counter() - started))
+    return tuple(results)
+
+# In the order of HELPERS; a tuple, so one eval brings back all of them
+_bridge_helpers = (_bridge_helpers_version,) + tuple(
+    _bridge_entry(function)
+    for function in (_bridge_fetch, _bridge_symbol_snapshot, _bridge_symbol_snapshots, _bridge_order_batch)
+)
+''' % (HELPER_VERSION, _DICT_TAG)
+
+HELPERS = ("fetch", "symbol_snapshot", "symbol_snapshots", "order_batch")
+
+_LOCK = threading.Lock()
+# Terminals (raw mt5linux objects / modules) -> their helper callables.
+# Weak so a reconnect's fresh connection gets a fresh install.
+_INSTALLED: "weakref.WeakKeyDictionary[Any, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _raw(terminal):
+    # Unwrap the circuit-breaker proxy from services.mt5_connection
+    return getattr(terminal, "_terminal", terminal)
+
+
+def _is_remote(terminal) -> bool:
+    return hasattr(_raw(terminal), "execute") and hasattr(_raw(terminal), "eval")
+
+
+def install(terminal) -> Dict[str, Any]:
+    """Upload the helper namespace into the terminal's Python process; returns the helpers by name."""
+    raw = _raw(terminal)
+    if _is_remote(terminal):
+        terminal.execute(HELPER_SOURCE)
+        # The tuple comes back by value, its functions as remote callables
+        version, *functions = terminal.eval("_bridge_helpers")
+    else:
+        namespace = {"mt5": raw}
+        exec(HELPER_SOURCE, namespace)
+        version, *functions = namespace["_bridge_helpers"]
+    helpers = dict(zip(HELPERS, functions))
+    with _LOCK:
+        _INSTALLED[raw] = helpers
+    logger.info("Installed MT5 terminal helpers v%s (%s)", version, "remote" if _is_remote(terminal) else "local")
+    return helpers
+
+
+def _wire(value):
+    """``value`` as nested tuples of primitives, which brine passes by value."""
+    if isinstance(value, dict):
+        return (_DICT_TAG, tuple((key, _wire(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_wire(item) for item in value)
+    return value
+
+
+def _call(terminal, method: str, helper: str, *args):
+    """Run helper ``helper(*args)`` next to the terminal, timed as ``method``."""
+    with _LOCK:
+        helpers = _INSTALLED.get(_raw(terminal))
+    if helpers is None:
+        helpers = install(terminal)
+    function = helpers[helper]
+    guard = getattr(terminal, "guard", None)
+    if guard is not None:
+        # Called through the connection's breaker and lanes like any other terminal call
+        function = guard(method, function)
+
+    wired = [_wire(arg) for arg in args]
+    started = time.perf_counter()
+    try:
+        with tracing.span("mt5." + method, {"rpc.system": "rpyc", "rpc.method": method}, require_parent=True):
+            return function(*wired)
+    except Exception as exc:
+        metrics.MT5_CALL_ERRORS.inc(method, type(exc).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.MT5_CALL_SECONDS.observe(elapsed, method)
+        request_timing.record("mt5." + method, elapsed)
+
+
+def fetch(terminal, record: Type[MT5Record], function: str, *args, **kwargs):
+    """
+    Call ``mt5.<function>(*args, **kwargs)`` next to the terminal and return
+    the result as local ``record`` instances (a list for tuple results).
+    """
+    packed = _call(terminal, function, "fetch", function, args, kwargs, record.__slots__)
+    if packed is None:
+        return None
+    is_sequence, payload = packed
+    if is_sequence:
+        return [record(*row) for row in payload]
+    return record(*payload)
+
+
+def positions(terminal, **filters) -> Optional[List[Position]]:
+    """``positions_get(**filters)`` as local records, in one round trip."""
+    return fetch(terminal, Position, "positions_get", **filters)
+
+
+def orders(terminal, **filters) -> Optional[List[Order]]:
+    """Pending orders (``orders_get(**filters)``) as local records, in one round trip."""
+    return fetch(terminal, Order, "orders_get", **filters)
+
+
+def symbol_snapshot(terminal, symbol: str) -> Tuple[Optional[SymbolInfo], Optional[Tick]]:
+    """``(symbol_info(symbol), symbol_info_tick(symbol))`` in one round trip."""
+    packed = _call(terminal, "symbol_snapshot", "symbol_snapshot", symbol, SymbolInfo.__slots__, Tick.__slots__)
+    if packed is None:
+        return None, None
+    info, tick = packed
+    return SymbolInfo(*info), Tick(*tick) if tick is not None else None
+
+
+def symbol_snapshots(terminal, symbols: List[str]) -> Dict[str, Tuple[Optional[SymbolInfo], Optional[Tick]]]:
+    """``symbol_snapshot`` for several symbols, in one round trip."""
+    packed = _call(
+        terminal, "symbol_snapshots", "symbol_snapshots", tuple(symbols), SymbolInfo.__slots__, Tick.__slots__
+    )
+    snapshots = {}
+    for symbol, snapshot in zip(symbols, packed or ()):
+        if snapshot is None:
+            snapshots[symbol] = (None, None)
+        else:
+            info, tick = snapshot
+            snapshots[symbol] = (SymbolInfo(*info), Tick(*tick) if tick is not None else None)
+    return snapshots
+
+
+def deals_range(terminal, date_from: int, date_to: int) -> Optional[List[Deal]]:
+    """``history_deals_get(date_from, date_to)`` as local records, in one round trip."""
+    return fetch(terminal, Deal, "history_deals_get", date_from, date_to)
+
+
+def position_deals(terminal, position_id: int) -> Optional[List[Deal]]:
+    """All deals of one position (``history_deals_get(position=...)``)."""
+    return fetch(terminal, Deal, "history_deals_get", position=position_id)
+
+
+def symbols(terminal) -> Optional[List[SymbolInfo]]:
+    return fetch(terminal, SymbolInfo, "symbols_get")
+
+
+def account_info(terminal) -> Optional[AccountInfo]:
+    return fetch(terminal, AccountInfo, "account_info")
+
+
+def terminal_info(terminal) -> Optional[TerminalInfo]:
+    return fetch(terminal, TerminalInfo, "terminal_info")
+
+
+def order_send(terminal, request: Dict[str, Any]) -> Optional[OrderSendResult]:
+    return fetch(terminal, OrderSendResult, "order_send", request)
+
+
+def order_batch(
+    terminal, orders: List[Tuple[Dict[str, Any], List[Optional[int]]]], retry_retcode: int
+) -> List[Tuple[Optional[OrderSendResult], Optional[int], Optional[str], float]]:
+    """
+    Send ``orders`` back to back inside the terminal process, in one round
+    trip. Each order is ``(request, filling modes to try)``; the next mode is
+    only tried while the terminal answers ``retry_retcode``. ``"price": None``
+    is filled in with the current quote next to the terminal. Returns, per
+    order, ``(last result, its filling mode, last error, seconds taken)``.
+    """
+    packed = _call(terminal, "order_batch", "order_batch", tuple(orders), OrderSendResult.__slots__, retry_retcode)
+    return [
+        (OrderSendResult(*result) if result is not None else None, filling, error, seconds)
+        for result, filling, error, seconds in packed
+    ]
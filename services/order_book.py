@@ -0,0 +1,77 @@
+"""
+Short-lived snapshots of an account's pending orders (``GET /api/v1/orders``).
+
+Strategies that used to poll prices and fire market orders now leave
+limit/stop orders in the terminal and poll those instead. A snapshot is
+reused for ``MT5_ORDERS_CACHE_SECONDS`` and dropped as soon as the bridge
+places, modifies or cancels an order for that account; orders the terminal
+fills or expires on its own show up within that interval.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from services import metrics, mt5_connection, mt5_remote
+
+ORDERS_CACHE_SECONDS = float(os.getenv("MT5_ORDERS_CACHE_SECONDS", "1"))
+
+# ORDER_TYPE_* values of pending orders
+ORDER_TYPES = {
+    2: "buy_limit",
+    3: "sell_limit",
+    4: "buy_stop",
+    5: "sell_stop",
+    6: "buy_stop_limit",
+    7: "sell_stop_limit",
+}
+
+_LOCK = threading.Lock()
+# (terminal, login) -> (expires_at, orders)
+_SNAPSHOTS: Dict[Tuple[int, str], Tuple[float, List[Dict[str, Any]]]] = {}
+# Bumped by invalidate(), so a fetch that raced a write is not cached
+_GENERATION: Dict[Tuple[int, str], int] = {}
+
+
+def _serialize(order) -> Dict[str, Any]:
+    return {
+        "ticket": order.ticket,
+        "symbol": order.symbol,
+        "type": ORDER_TYPES.get(order.type, str(order.type)),
+        "volume": float(order.volume_current),
+        "price": float(order.price_open),
+        "stop_limit_price": float(order.price_stoplimit) if order.price_stoplimit else None,
+        "price_current": float(order.price_current),
+        "sl": float(order.sl) if order.sl > 0 else None,
+        "tp": float(order.tp) if order.tp > 0 else None,
+        "time_setup": order.time_setup,
+        "expiration": order.time_expiration or None,
+        "magic": order.magic,
+        "comment": order.comment,
+    }
+
+
+def snapshot(terminal, login: str) -> List[Dict[str, Any]]:
+    """Pending orders of the logged-in account ``login``, at most ORDERS_CACHE_SECONDS old."""
+    key = (mt5_connection.identity(terminal), str(login))
+    with _LOCK:
+        cached = _SNAPSHOTS.get(key)
+        generation = _GENERATION.get(key, 0)
+    if cached is not None and cached[0] > time.monotonic():
+        metrics.cache_hit("pending_orders")
+        return cached[1]
+    metrics.cache_miss("pending_orders")
+    orders = [_serialize(order) for order in mt5_remote.orders(terminal) or ()]
+    if ORDERS_CACHE_SECONDS > 0:
+        with _LOCK:
+            if _GENERATION.get(key, 0) == generation:
+                _SNAPSHOTS[key] = (time.monotonic() + ORDERS_CACHE_SECONDS, orders)
+    return orders
+
+
+def invalidate(terminal, login: str):
+    key = (mt5_connection.identity(terminal), str(login))
+    with _LOCK:
+        _SNAPSHOTS.pop(key, None)
+        _GENERATION[key] = _GENERATION.get(key, 0) + 1
@@ -0,0 +1,261 @@
+"""
+Order submission shared by the trade endpoints.
+
+Brokers accept different filling modes per symbol, and the symbol's
+``filling_mode`` mask is not always reliable. An order is therefore tried
+with the detected mode first, then without ``type_filling`` (some brokers
+pick one themselves), then with each remaining mode, moving on only when
+the terminal answers 10030 (unsupported filling mode). Any other failure
+ends the loop: after a transport error (dropped connection, timeout) the
+order may already have been filled, so it is reported as unknown instead
+of being sent again.
+
+The mode that last worked for a symbol and trade action is remembered
+and tried first next time, so after the first order a symbol normally
+needs a single ``order_send``. Symbol metadata (filling modes, volume limits) is
+cached for ``MT5_SYMBOL_CACHE_SECONDS``; prices are never taken from it.
+
+``send`` runs that loop with one ``order_send`` round trip per attempt.
+``send_batch`` runs the same loop for a whole basket inside the terminal
+process (services.mt5_remote), so N orders cost one round trip.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from services import account_switcher, idempotency, metrics, mt5_connection, mt5_remote
+
+logger = logging.getLogger(__name__)
+
+# Numeric values rather than terminal constants, for RPyC compatibility
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_AUTOTRADING_DISABLED = 10027
+TRADE_RETCODE_INVALID_FILL = 10030
+
+AUTOTRADING_DISABLED = (
+    "AutoTrading is disabled in MT5 Terminal. Please enable AutoTrading in MT5 Terminal "
+    "(Tools → Options → Expert Advisors → Allow automated trading) to {} via API."
+)
+
+SYMBOL_CACHE_SECONDS = float(os.getenv("MT5_SYMBOL_CACHE_SECONDS", "300"))
+
+BatchOutcome = namedtuple("BatchOutcome", ("result", "filling_mode", "error", "seconds"))
+
+_LOCK = threading.Lock()
+# (terminal, symbol) -> (expires_at, SymbolInfo)
+_SYMBOLS: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+# (terminal, symbol, trade action) -> filling mode of the last accepted
+# order (None = no type_filling). Per action: brokers often take different
+# modes for market and pending orders.
+_LEARNED_FILLING: Dict[Tuple[int, str, Any], Optional[int]] = {}
+_UNKNOWN = object()
+
+
+def remember_symbol(terminal, symbol_info):
+    """Cache metadata read elsewhere (e.g. by a symbol_snapshot)."""
+    if symbol_info is not None and SYMBOL_CACHE_SECONDS > 0:
+        with _LOCK:
+            _SYMBOLS[(mt5_connection.identity(terminal), symbol_info.name)] = (
+                time.monotonic() + SYMBOL_CACHE_SECONDS, symbol_info,
+            )
+
+
+def symbol_info(terminal, symbol: str):
+    """Symbol metadata, from the cache when fresh. None if the symbol is unknown."""
+    key = (mt5_connection.identity(terminal), symbol)
+    with _LOCK:
+        cached = _SYMBOLS.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        metrics.cache_hit("symbol_info")
+        return cached[1]
+    metrics.cache_miss("symbol_info")
+    info, _ = mt5_remote.symbol_snapshot(terminal, symbol)
+    remember_symbol(terminal, info)
+    return info
+
+
+def _learn(terminal, symbol_info, action, filling_mode: Optional[int]):
+    with _LOCK:
+        _LEARNED_FILLING[(mt5_connection.identity(terminal), symbol_info.name, action)] = filling_mode
+
+
+def _modes_for(terminal, symbol_info, action) -> List[Optional[int]]:
+    modes = filling_modes_to_try(symbol_info)
+    if symbol_info is None:
+        return modes
+    with _LOCK:
+        learned = _LEARNED_FILLING.get((mt5_connection.identity(terminal), symbol_info.name, action), _UNKNOWN)
+    if learned is not _UNKNOWN and learned in modes:
+        modes.remove(learned)
+        modes.insert(0, learned)
+    return modes
+
+
+def filling_modes_to_try(symbol_info) -> List[Optional[int]]:
+    """Detected filling mode first, then none (broker default), then the rest."""
+    filling_mode = None
+    try:
+        if symbol_info is not None and hasattr(symbol_info, "filling_mode"):
+            filling_modes = symbol_info.filling_mode
+            # Check which modes are supported (bitwise AND)
+            if filling_modes & ORDER_FILLING_IOC:
+                filling_mode = ORDER_FILLING_IOC
+            elif filling_modes & ORDER_FILLING_FOK:
+                filling_mode = ORDER_FILLING_FOK
+            elif filling_modes & ORDER_FILLING_RETURN:
+                filling_mode = ORDER_FILLING_RETURN
+            logger.debug("Symbol %s filling_mode=%s, using %s", getattr(symbol_info, "name", "?"), filling_modes, filling_mode)
+    except Exception as e:
+        logger.warning("Error reading filling_mode: %s", e)
+
+    modes: List[Optional[int]] = []
+    if filling_mode is not None:
+        modes.append(filling_mode)
+    modes.append(None)
+    for mode in (ORDER_FILLING_RETURN, ORDER_FILLING_IOC, ORDER_FILLING_FOK):
+        if mode not in modes:
+            modes.append(mode)
+    return modes
+
+
+def describe_failure(result, purpose: str = "place trades") -> str:
+    """Client-facing reason for a result that is not TRADE_RETCODE_DONE."""
+    if result.retcode == TRADE_RETCODE_AUTOTRADING_DISABLED:
+        return AUTOTRADING_DISABLED.format(purpose)
+    comment = result.comment if getattr(result, "comment", None) else f"Error code: {result.retcode}"
+    return f"{comment} (code: {result.retcode})"
+
+
+def _dispatch(function, *args):
+    """
+    Run an order round trip, marking the request's Idempotency-Key as
+    dispatched unless the connection guard refused the call before sending.
+    """
+    try:
+        result = function(*args)
+    except mt5_connection.TerminalUnavailable:
+        raise
+    except BaseException:
+        idempotency.mark_dispatched()
+        raise
+    idempotency.mark_dispatched()
+    return result
+
+
+def send(
+    terminal,
+    request: Dict[str, Any],
+    symbol_info,
+    purpose: str = "place trades",
+    failure: str = "Order failed",
+) -> Tuple[Any, Optional[int]]:
+    """
+    Send one order, falling back through the filling modes. Returns the
+    result and the filling mode that worked; raises HTTPException(400) with
+    ``failure`` as prefix when the terminal rejects it, and 502 when the
+    call itself failed and the order's fate is unknown. ``symbol_info`` is
+    None for requests without a fill (SL/TP changes, close-by).
+    """
+    result = None
+    last_error = None
+
+    for try_filling_mode in _modes_for(terminal, symbol_info, request.get("action")):
+        trade_request = dict(request)
+        # Only add type_filling if we have a value
+        if try_filling_mode is not None:
+            trade_request["type_filling"] = try_filling_mode
+
+        logger.debug(
+            "Trying order: symbol=%s, type=%s, volume=%s, price=%s, position=%s, filling_mode=%s",
+            request.get("symbol"), request.get("type"), request.get("volume"), request.get("price"),
+            request.get("position"), try_filling_mode,
+        )
+        try:
+            result = _dispatch(mt5_remote.order_send, terminal, trade_request)
+        except HTTPException:
+            raise
+        except Exception as e:
+            # The order may have been filled before the connection failed:
+            # sending it again with another filling mode could double it
+            account_switcher.invalidate_current_login()
+            logger.error("order_send failed with filling_mode=%s, outcome unknown: %s", try_filling_mode, e)
+            raise HTTPException(
+                status_code=502,
+                detail=f"{failure}: terminal call failed ({e}); the outcome is unknown, check positions and orders before retrying",
+            )
+
+        if result is None:
+            raise HTTPException(status_code=400, detail=f"{failure}: Order send returned None (code: unknown)")
+        if result.retcode == TRADE_RETCODE_DONE:
+            if symbol_info is not None:
+                _learn(terminal, symbol_info, request.get("action"), try_filling_mode)
+            return result, try_filling_mode
+        if result.retcode == TRADE_RETCODE_AUTOTRADING_DISABLED:
+            raise HTTPException(status_code=400, detail=AUTOTRADING_DISABLED.format(purpose))
+        # If it's not a filling mode error (10030), fail immediately
+        if result.retcode != TRADE_RETCODE_INVALID_FILL:
+            raise HTTPException(status_code=400, detail=f"{failure}: {describe_failure(result, purpose)}")
+        last_error = result.comment if hasattr(result, "comment") else f"Error code: {result.retcode}"
+        logger.warning("Filling mode %s failed: %s, trying next...", try_filling_mode, last_error)
+
+    error_msg = last_error or "All filling modes failed"
+    raise HTTPException(
+        status_code=400,
+        detail=f"{failure}: {error_msg} (code: {result.retcode if result else 'unknown'})",
+    )
+
+
+def send_batch(
+    terminal,
+    orders: List[Tuple[Dict[str, Any], Any]],
+    failure: str = "Orders failed",
+) -> List[BatchOutcome]:
+    """
+    Send ``(request, symbol_info)`` pairs back to back in one terminal round
+    trip, each with the same filling-mode fallback as ``send``. Rejections
+    are reported per order, never raised. If the round trip itself fails,
+    any of the orders may have been filled: like ``send``, that raises 502
+    (outcome unknown) with ``failure`` as prefix.
+    """
+    try:
+        batch = _dispatch(
+            mt5_remote.order_batch,
+            terminal,
+            [(request, _modes_for(terminal, symbol_info, request.get("action"))) for request, symbol_info in orders],
+            TRADE_RETCODE_INVALID_FILL,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        account_switcher.invalidate_current_login()
+        logger.error("order_batch of %s orders failed, outcome unknown: %s", len(orders), e)
+        raise HTTPException(
+            status_code=502,
+            detail=f"{failure}: terminal call failed ({e}); the outcome is unknown, check positions and orders before retrying",
+        )
+    outcomes = [BatchOutcome(*outcome) for outcome in batch]
+    for (request, symbol_info), outcome in zip(orders, outcomes):
+        if symbol_info is not None and outcome.result is not None and outcome.result.retcode == TRADE_RETCODE_DONE:
+            _learn(terminal, symbol_info, request.get("action"), outcome.filling_mode)
+    return outcomes
+
+
+def invalidate(terminal=None):
+    """Forget cached metadata and learned filling modes (of one terminal, or all)."""
+    with _LOCK:
+        for cache in (_SYMBOLS, _LEARNED_FILLING):
+            if terminal is None:
+                cache.clear()
+            else:
+                identity = mt5_connection.identity(terminal)
+                for key in [key for key in cache if key[0] == identity]:
+                    del cache[key]
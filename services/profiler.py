@@ -0,0 +1,190 @@
+"""
+On-demand sampling profiler for the live process.
+
+A background thread snapshots every thread's Python stack via
+``sys._current_frames()`` at a fixed interval and counts identical stacks.
+Output is the "collapsed stack" format understood by flamegraph.pl,
+speedscope and inferno::
+
+    MainThread;run (base_events.py:612);...;place_order (mt5_api_bridge.py:1236) 42
+
+No dependencies and no tracing hooks: the profiled code runs at full speed,
+the sampler costs one stack walk per thread per interval, and nothing runs
+when no profile is active.
+
+Two modes:
+- ``profile_process(seconds, interval)``: all threads, for a fixed window
+  (one at a time), used by ``GET /admin/profile``.
+- ``RequestProfilerMiddleware``: samples for the lifetime of one request
+  when it carries ``X-Profile: 1`` and a valid admin key; the result is kept
+  in a small ring buffer and its id returned in ``X-Profile-Id``.
+"""
+
+import collections
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from typing import Any, Counter, Deque, Dict, List, Optional
+
+MAX_PROCESS_PROFILE_SECONDS = 60
+MAX_CONCURRENT_REQUEST_PROFILES = 2
+REQUEST_PROFILE_HISTORY = 20
+
+# Leaf frames of threads that are parked, not working
+_IDLE_LEAVES = frozenset((
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("profiler.py", "profile_process"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+))
+
+_PROCESS_LOCK = threading.Lock()
+_REQUEST_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_REQUEST_PROFILES)
+_REQUEST_PROFILES: Deque[Dict[str, Any]] = collections.deque(maxlen=REQUEST_PROFILE_HISTORY)
+_REQUEST_IDS = itertools.count(1)
+
+
+class ProfilerBusy(Exception):
+    """A process-wide profile is already running."""
+
+
+class StackSampler:
+    """Samples all thread stacks every ``interval`` seconds until stopped."""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter[str] = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._code_labels: Dict[Any, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._code_labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._code_labels[code] = label
+        return label
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if not self.include_idle:
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_process(seconds: float, interval: float = 0.005, include_idle: bool = False) -> StackSampler:
+    """
+    Sample every thread for ``seconds``. Blocking - call it from a worker
+    thread, not the event loop. Raises ProfilerBusy if one is running.
+    """
+    if not _PROCESS_LOCK.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        sampler = StackSampler(interval, include_idle).start()
+        time.sleep(min(seconds, MAX_PROCESS_PROFILE_SECONDS))
+        return sampler.stop()
+    finally:
+        _PROCESS_LOCK.release()
+
+
+def request_profiles() -> List[Dict[str, Any]]:
+    """Summaries of the most recent per-request profiles, newest first."""
+    return [{k: v for k, v in entry.items() if k != "collapsed"} for entry in reversed(_REQUEST_PROFILES)]
+
+
+def request_profile(profile_id: int) -> Optional[str]:
+    for entry in _REQUEST_PROFILES:
+        if entry["id"] == profile_id:
+            return entry["collapsed"]
+    return None
+
+
+def is_admin_key(expected: Optional[str], provided: Optional[str]) -> bool:
+    return bool(expected) and bool(provided) and hmac.compare_digest(expected, provided)
+
+
+class RequestProfilerMiddleware:
+    """
+    Pure ASGI middleware profiling single requests on demand. Only requests
+    with ``X-Profile: 1`` and ``X-Admin-Key`` matching ``admin_key`` are
+    sampled; everything else passes straight through.
+    """
+
+    def __init__(self, app, admin_key: Optional[str] = None, interval: float = 0.001):
+        self.app = app
+        self.admin_key = admin_key
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.admin_key:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", ()))
+        if headers.get(b"x-profile") != b"1" or not is_admin_key(self.admin_key, headers.get(b"x-admin-key", b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+        if not _REQUEST_SLOTS.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = next(_REQUEST_IDS)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile_id).encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        sampler = StackSampler(self.interval).start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _REQUEST_SLOTS.release()
+            _REQUEST_PROFILES.append({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "samples": sampler.samples,
+                "recorded_at": time.time(),
+                "collapsed": sampler.collapsed(),
+            })
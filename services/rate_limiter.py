@@ -0,0 +1,117 @@
+"""
+Token-bucket rate limiting per client and route class.
+
+All clients share one terminal, so each caller gets a quota per route
+class (the priority lanes of services.mt5_lanes): a bucket of ``burst``
+tokens refilled at ``rate`` per second, one token per request. An empty
+bucket answers 429 with ``Retry-After`` set to when the next token is due.
+
+Users are keyed by user id. Requests authenticated with ``X-Service-Key``
+share a single ``service`` identity with its own quotas, so the backend's
+auto-resume polling is metered without being held to a single user's
+share.
+
+Quotas are ``class=rate:burst`` lists (``MT5_RATE_LIMITS``,
+``MT5_SERVICE_RATE_LIMITS``); a rate of 0 leaves a class unlimited. A
+bucket is at most ``burst`` tokens of state, and the least recently used
+ones are dropped beyond ``MT5_RATE_LIMIT_MAX_CLIENTS`` (an idle bucket is
+full anyway, so forgetting it changes nothing).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, status
+
+from services import metrics, mt5_lanes
+
+SERVICE_IDENTITY = "service"
+
+# (requests per second, burst)
+DEFAULT_QUOTAS = {
+    mt5_lanes.TRADING: (5.0, 20.0),
+    mt5_lanes.ACCOUNT: (10.0, 20.0),
+    mt5_lanes.MARKET_DATA: (10.0, 20.0),
+    mt5_lanes.BULK: (1.0, 5.0),
+}
+DEFAULT_SERVICE_QUOTAS = dict(DEFAULT_QUOTAS, **{mt5_lanes.MARKET_DATA: (50.0, 100.0), mt5_lanes.BULK: (5.0, 10.0)})
+
+MAX_CLIENTS = int(os.getenv("MT5_RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+RATE_LIMITED_REQUESTS = metrics.counter(
+    "mt5_bridge_rate_limit_requests_total",
+    "Requests checked against a rate limit, by route class, client kind (user/service) and result (allowed/limited).",
+    ("route_class", "client", "result"),
+)
+RATE_LIMIT_BUCKETS = metrics.gauge("mt5_bridge_rate_limit_buckets", "Token buckets currently tracked.")
+
+
+def parse_quotas(spec: str, defaults: Dict[str, Tuple[float, float]]) -> Dict[str, Tuple[float, float]]:
+    """``"market_data=10:20,bulk=1:5"`` -> {class: (rate, burst)}, defaults for classes not named."""
+    quotas = dict(defaults)
+    for part in spec.split(","):
+        name, sep, value = part.partition("=")
+        if not sep:
+            continue
+        rate, _, burst = value.partition(":")
+        rate = float(rate)
+        quotas[name.strip()] = (rate, max(1.0, float(burst) if burst else rate))
+    return quotas
+
+
+USER_QUOTAS = parse_quotas(os.getenv("MT5_RATE_LIMITS", ""), DEFAULT_QUOTAS)
+SERVICE_QUOTAS = parse_quotas(os.getenv("MT5_SERVICE_RATE_LIMITS", ""), DEFAULT_SERVICE_QUOTAS)
+
+_LOCK = threading.Lock()
+# (identity, route class) -> [tokens, updated_at]
+_BUCKETS: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+
+def _take(key: Tuple[str, str], rate: float, burst: float) -> float:
+    """Take a token from ``key``'s bucket. Returns 0, or the seconds until one is available."""
+    now = time.monotonic()
+    with _LOCK:
+        bucket = _BUCKETS.get(key)
+        if bucket is None:
+            bucket = _BUCKETS[key] = [burst, now]
+            while len(_BUCKETS) > MAX_CLIENTS:
+                _BUCKETS.popitem(last=False)
+        else:
+            _BUCKETS.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+def check(user: Dict, route_class: str):
+    """
+    Charge one request of ``route_class`` to the authenticated ``user``
+    (as returned by the auth dependencies). Raises HTTPException(429) with
+    Retry-After when the caller's quota is used up.
+    """
+    service = bool(user.get("service_role"))
+    rate, burst = (SERVICE_QUOTAS if service else USER_QUOTAS).get(route_class, (0.0, 0.0))
+    if rate <= 0:
+        return
+    client = "service" if service else "user"
+    identity = SERVICE_IDENTITY if service else str(user["user_id"])
+    wait = _take((identity, route_class), rate, burst)
+    if not wait:
+        RATE_LIMITED_REQUESTS.inc(route_class, client, "allowed")
+        return
+    RATE_LIMITED_REQUESTS.inc(route_class, client, "limited")
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Rate limit exceeded for {route_class.replace('_', ' ')} requests ({rate:g}/s, burst {burst:g})",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+RATE_LIMIT_BUCKETS.add_callback(lambda: [((), len(_BUCKETS))])
@@ -0,0 +1,159 @@
+"""
+Per-request latency breakdown, emitted as a ``Server-Timing`` header.
+
+``ServerTimingMiddleware`` opens a span collection for each HTTP request in
+a context variable. Stages record into it with ``span(name)``, ``timed(name)``
+or ``record(name, seconds)``; repeated stages (three ``order_send`` calls
+during filling-mode fallback) are summed and counted. Outside a request,
+recording is a single ContextVar lookup and does nothing.
+
+Example header:
+    Server-Timing: auth;dur=0.4, supabase.get_account;dur=21.3,
+        session;dur=212.0, mt5.login;dur=210.8, mt5.symbol_snapshot;dur=3.1,
+        mt5.order_send;dur=9.2;desc="x3", app;dur=247.9
+
+With ``MT5_SERVER_TIMING_DEBUG=1``, requests sending ``X-Debug-Timing: 1``
+also get the breakdown as a ``_timing`` field in JSON object responses.
+"""
+
+import functools
+import inspect
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+SERVER_TIMING_ENABLED = os.getenv("MT5_SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+DEBUG_FIELD_ENABLED = os.getenv("MT5_SERVER_TIMING_DEBUG", "0").lower() in ("1", "true", "yes")
+
+# name -> [total seconds, count], in first-recorded order
+_SPANS: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timing_spans", default=None)
+
+
+def record(name: str, seconds: float):
+    spans = _SPANS.get()
+    if spans is None:
+        return
+    entry = spans.get(name)
+    if entry is None:
+        spans[name] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator recording each call of a sync or async function as ``name``."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    record(name, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def current() -> Optional[Dict[str, List[float]]]:
+    return _SPANS.get()
+
+
+def header_value(spans: Dict[str, List[float]], total_seconds: float) -> str:
+    parts = []
+    for name, (seconds, count) in spans.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    parts.append(f"app;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def as_dict(spans: Dict[str, List[float]], total_seconds: float) -> Dict[str, Dict[str, float]]:
+    breakdown = {name: {"ms": round(seconds * 1000, 2), "count": int(count)} for name, (seconds, count) in spans.items()}
+    breakdown["app"] = {"ms": round(total_seconds * 1000, 2), "count": 1}
+    return breakdown
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware collecting spans and adding the Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        spans: Dict[str, List[float]] = {}
+        token = _SPANS.set(spans)
+        started = time.perf_counter()
+        debug = DEBUG_FIELD_ENABLED and (b"x-debug-timing", b"1") in scope.get("headers", ())
+        pending_start = None
+        body_parts: List[bytes] = []
+
+        async def send_wrapper(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                if debug:
+                    # Hold the headers back until the body is known
+                    pending_start = message
+                    return
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"server-timing", header_value(spans, time.perf_counter() - started).encode("latin-1")),
+                ]
+            elif message["type"] == "http.response.body" and pending_start is not None:
+                body_parts.append(message.get("body", b""))
+                if message.get("more_body"):
+                    return
+                await _send_with_debug_field(send, pending_start, b"".join(body_parts), spans, time.perf_counter() - started)
+                pending_start = None
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _SPANS.reset(token)
+
+
+async def _send_with_debug_field(send, start_message, body: bytes, spans, total_seconds: float):
+    headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+    content_type = dict(headers).get(b"content-type", b"")
+    if content_type.startswith(b"application/json"):
+        try:
+            payload = json.loads(body)
+            if isinstance(payload, dict):
+                payload["_timing"] = as_dict(spans, total_seconds)
+                body = json.dumps(payload).encode("utf-8")
+        except ValueError:
+            pass
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    headers.append((b"server-timing", header_value(spans, total_seconds).encode("latin-1")))
+    await send({**start_message, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,64 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many clients poll the same thing at once (40 dashboards refreshing
+positions for one account), only the first request starts a terminal call;
+the rest await the same in-flight call and receive the same result, or the
+same exception. Nothing is cached: once the call completes, the next
+request starts a fresh one.
+
+The shared call runs in a worker thread (``asyncio.to_thread``, so the
+leader's request-timing and tracing context come along) as a task of its
+own; a waiter being cancelled (client hung up) never cancels the call the
+others are waiting for.
+
+Callers must treat results as read-only - every waiter gets the same object.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from services import metrics, request_timing
+
+COALESCED_CALLS = metrics.counter(
+    "mt5_bridge_coalesced_calls_total",
+    "Coalescable reads by method and role: leader (made the terminal call) or shared (reused it).",
+    ("method", "role"),
+)
+
+_IN_FLIGHT: Dict[Tuple[Hashable, ...], "asyncio.Task"] = {}
+
+
+def _forget(key: Tuple[Hashable, ...], task: "asyncio.Task"):
+    if _IN_FLIGHT.get(key) is task:
+        del _IN_FLIGHT[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved even if every waiter went away
+
+
+async def run(method: str, key: Tuple[Hashable, ...], function: Callable[..., Any], *args) -> Any:
+    """
+    ``function(*args)`` in a worker thread, shared with concurrent callers
+    passing the same ``method`` and ``key``. ``key`` must capture everything
+    the result depends on (terminal, account, arguments).
+    """
+    full_key = (method,) + tuple(key)
+    task = _IN_FLIGHT.get(full_key)
+    if task is None:
+        COALESCED_CALLS.inc(method, "leader")
+        task = asyncio.ensure_future(asyncio.to_thread(function, *args))
+        _IN_FLIGHT[full_key] = task
+        task.add_done_callback(lambda done: _forget(full_key, done))
+        return await asyncio.shield(task)
+
+    COALESCED_CALLS.inc(method, "shared")
+    started = time.perf_counter()
+    try:
+        return await asyncio.shield(task)
+    finally:
+        request_timing.record(f"mt5.{method}.shared", time.perf_counter() - started)
+
+
+def in_flight() -> int:
+    return len(_IN_FLIGHT)
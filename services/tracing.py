@@ -0,0 +1,173 @@
+"""
+Optional OpenTelemetry tracing.
+
+Disabled unless ``MT5_TRACING_EXPORTER`` is set and the OpenTelemetry SDK is
+installed (``pip install opentelemetry-sdk``, plus
+``opentelemetry-exporter-otlp-proto-http`` for OTLP). When disabled every
+helper here returns a shared no-op context manager, so instrumented code
+pays one global lookup.
+
+Exporters:
+- ``otlp``: OTLP/HTTP to ``OTEL_EXPORTER_OTLP_ENDPOINT`` (standard OTEL_* vars apply)
+- ``file``: one JSON span per line, appended to ``MT5_TRACING_FILE``
+- ``console``: spans printed to stdout
+
+``TracingMiddleware`` opens a server span per request and continues an
+incoming W3C ``traceparent``. ``inject_headers`` propagates the trace to
+outgoing calls (the Trainflow encryption service), so a slow request shows
+up as one trace across both services.
+"""
+
+import contextlib
+import functools
+import inspect
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+TRACING_EXPORTER = os.getenv("MT5_TRACING_EXPORTER", "").lower()
+TRACING_FILE = os.getenv("MT5_TRACING_FILE", "mt5_bridge_traces.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mt5-api-bridge")
+
+NOOP = contextlib.nullcontext()
+_tracer = None
+_provider = None
+_file = None
+
+
+def _exporter():
+    global _file
+    if TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        _file = open(TRACING_FILE, "a", buffering=1)
+        return ConsoleSpanExporter(out=_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if TRACING_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    raise ValueError(f"Unknown MT5_TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+
+def configure() -> bool:
+    """Set up the tracer provider if tracing is requested. Safe to call twice."""
+    global _tracer, _provider
+    if _tracer is not None or not TRACING_EXPORTER:
+        return _tracer is not None
+    if not OTEL_AVAILABLE:
+        logger.warning("MT5_TRACING_EXPORTER=%s but opentelemetry-sdk is not installed - tracing disabled", TRACING_EXPORTER)
+        return False
+    try:
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(_exporter()))
+    except Exception as exc:
+        logger.error("Failed to configure tracing (%s): %s", TRACING_EXPORTER, exc)
+        return False
+    _provider = provider
+    _tracer = provider.get_tracer("mt5_api_bridge")
+    logger.info("🔭 OpenTelemetry tracing enabled (exporter=%s)", TRACING_EXPORTER)
+    return True
+
+
+def shutdown():
+    """Flush pending spans."""
+    global _tracer, _provider, _file
+    if _provider is not None:
+        _provider.shutdown()
+    if _file is not None:
+        _file.close()
+    _tracer = _provider = _file = None
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, require_parent: bool = False):
+    """
+    Context manager for a child span of the current one. With
+    ``require_parent`` nothing is recorded outside a traced request (keeps
+    background health probes from producing a root trace every few seconds).
+    """
+    if _tracer is None:
+        return NOOP
+    if require_parent and not trace.get_current_span().is_recording():
+        return NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced(name: str):
+    """Decorator wrapping each call of a sync or async function in a span."""
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def inject_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Add W3C trace-context headers for an outgoing request."""
+    if _tracer is not None:
+        propagate.inject(headers)
+    return headers
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware creating a server span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", ())}
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        ) as server_span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    server_span.update_name(f"{scope['method']} {route}")
+                    server_span.set_attribute("http.route", route)
+                server_span.set_attribute("http.status_code", status_code)
+                if status_code >= 500:
+                    server_span.set_status(Status(StatusCode.ERROR))
@@ -0,0 +1,133 @@
+import time
+from collections import OrderedDict
+
+import pytest
+from fastapi import HTTPException
+
+from services import deal_cache
+from services.deal_cache import DEAL_ENTRY_IN, DEAL_ENTRY_OUT, OVERLAP_SECONDS
+from services.fake_mt5 import TradeDeal
+
+BUY, SELL = 0, 1
+NOW = int(time.time())
+START = NOW - 10_000
+
+
+def deal(ticket, position_id, entry, time, volume=0.1, price=1.1, type=BUY, profit=0.0):
+    return TradeDeal(
+        ticket=ticket, order=ticket, time=time, time_msc=0, type=type, entry=entry, magic=0,
+        position_id=position_id, reason=0, volume=volume, price=price, commission=0.0, swap=0.0,
+        profit=profit, fee=0.0, symbol="EURUSD", comment="", external_id="",
+    )
+
+
+def trade(position_id, opened, closed):
+    """Entry and exit deals of one position."""
+    return [
+        deal(position_id * 10, position_id, DEAL_ENTRY_IN, opened),
+        deal(position_id * 10 + 1, position_id, DEAL_ENTRY_OUT, closed, type=SELL),
+    ]
+
+
+class History:
+    """Stands in for mt5_remote.deals_range, recording the windows asked for."""
+
+    def __init__(self):
+        self.deals = []
+        self.calls = []
+        self.fail = False
+
+    def deals_range(self, terminal, date_from, date_to):
+        self.calls.append((date_from, date_to))
+        if self.fail:
+            return None
+        return [d for d in self.deals if date_from <= d.time <= date_to]
+
+
+@pytest.fixture
+def history(monkeypatch):
+    history = History()
+    monkeypatch.setattr(deal_cache.mt5_remote, "deals_range", history.deals_range)
+    monkeypatch.setattr(deal_cache, "_ACCOUNTS", OrderedDict())
+    return history
+
+
+def page(start_ts=START, limit=10, before=None, after=None, server="Demo", login="5001"):
+    return deal_cache.trade_page(None, server, login, start_ts, NOW, limit, before, after)
+
+
+def test_pages_walk_newest_first_and_back(history):
+    for position_id in range(1, 6):
+        history.deals += trade(position_id, START + position_id * 100, START + position_id * 100 + 50)
+
+    first = page(limit=2)
+    assert [t["ticket"] for t in first["trades"]] == [5, 4]
+    assert first["prev_cursor"] is None
+
+    second = page(limit=2, before=first["next_cursor"])
+    assert [t["ticket"] for t in second["trades"]] == [3, 2]
+
+    last = page(limit=2, before=second["next_cursor"])
+    assert [t["ticket"] for t in last["trades"]] == [1]
+    assert last["next_cursor"] is None
+
+    # Back towards newer trades from the last page
+    assert [t["ticket"] for t in page(limit=2, after=last["prev_cursor"])["trades"]] == [3, 2]
+    # A bare position ticket works as a cursor too
+    assert [t["ticket"] for t in page(limit=2, before="4")["trades"]] == [3, 2]
+
+
+def test_refresh_only_fetches_deals_after_the_newest_seen(history):
+    history.deals += trade(1, START + 100, START + 200)
+    page()
+    assert [date_from for date_from, _ in history.calls] == [START]
+
+    history.calls.clear()
+    history.deals += trade(2, START + 300, START + 400)
+    assert [t["ticket"] for t in page()["trades"]] == [2, 1]
+    assert [date_from for date_from, _ in history.calls] == [START + 200 - OVERLAP_SECONDS]
+
+    # Overlapping refreshes don't duplicate deals
+    assert page()["count"] == 2
+
+
+def test_older_range_is_backfilled_once(history):
+    history.deals += trade(1, START - 5000, START - 4000) + trade(2, START + 100, START + 200)
+    assert [t["ticket"] for t in page()["trades"]] == [2]
+
+    history.calls.clear()
+    assert [t["ticket"] for t in page(start_ts=START - 6000)["trades"]] == [2, 1]
+    assert history.calls[0] == (START - 6000, START + OVERLAP_SECONDS)
+
+    history.calls.clear()
+    page(start_ts=START - 6000)
+    assert len(history.calls) == 1  # only the refresh at the newest end
+
+
+def test_failed_fetch_does_not_count_as_covered(history):
+    history.fail = True
+    with pytest.raises(HTTPException) as failed:
+        page()
+    assert failed.value.status_code == 503
+    assert deal_cache._history("Demo", "5001").covered_from is None
+
+    # Backfill failing leaves the older range to be fetched again
+    history.fail = False
+    history.deals += trade(1, START - 5000, START - 4000)
+    page()
+    history.fail = True
+    with pytest.raises(HTTPException):
+        page(start_ts=START - 6000)
+    assert deal_cache._history("Demo", "5001").covered_from == START
+
+    history.fail = False
+    assert [t["ticket"] for t in page(start_ts=START - 6000)["trades"]] == [1]
+
+
+def test_same_login_on_two_servers_is_cached_apart(history):
+    history.deals += trade(1, START + 100, START + 200)
+    assert page(server="Demo")["count"] == 1
+
+    history.deals.clear()
+    assert page(server="Live")["count"] == 0
+    assert page(server="Demo")["count"] == 1
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from services import account_switcher, deal_reconciler, journal_writer
+from services.deal_reconciler import DEAL_ENTRY_IN, DEAL_ENTRY_INOUT, DEAL_ENTRY_OUT, fold_deals
+from services.fake_mt5 import FakeConfig, FakeMetaTrader5, FakeTerminal, TradeDeal
+
+BUY, SELL, BALANCE = 0, 1, 2
+
+
+def deal(ticket, position_id, entry, volume, price, type=BUY, profit=0.0, time=None, reason=0):
+    return TradeDeal(
+        ticket=ticket, order=ticket, time=time if time is not None else 1_700_000_000 + ticket,
+        time_msc=0, type=type, entry=entry, magic=0, position_id=position_id, reason=reason,
+        volume=volume, price=price, commission=0.0, swap=0.0, profit=profit, fee=0.0,
+        symbol="EURUSD", comment="", external_id="",
+    )
+
+
+def test_partial_closes_accumulate_until_the_position_is_flat():
+    open_positions = {}
+    closed, orphans = fold_deals([
+        deal(1, 10, DEAL_ENTRY_IN, 1.0, 1.1000),
+        deal(2, 10, DEAL_ENTRY_OUT, 0.4, 1.1100, type=SELL, profit=40.0),
+    ], open_positions)
+    assert closed == [] and orphans == []
+    assert open_positions[10]["out_volume"] == pytest.approx(0.4)
+
+    # The rest arrives in a later pass, against the state kept in between
+    closed, orphans = fold_deals([
+        deal(3, 10, DEAL_ENTRY_OUT, 0.6, 1.1200, type=SELL, profit=120.0, time=1_700_000_500, reason=4),
+    ], open_positions)
+    assert orphans == []
+    assert open_positions == {}
+    (position,) = closed
+    assert position["type"] == BUY
+    assert position["in_volume"] == pytest.approx(1.0)
+    assert position["out_volume"] == pytest.approx(1.0)
+    assert position["out_value"] / position["out_volume"] == pytest.approx(1.1160)
+    assert position["profit"] == pytest.approx(160.0)
+    assert position["exit_time"] == 1_700_000_500
+    assert position["exit_reason"] == 4
+
+
+def test_exits_without_a_known_entry_are_orphans():
+    open_positions = {}
+    closed, orphans = fold_deals([
+        deal(1, 20, DEAL_ENTRY_OUT, 0.5, 1.1000, type=SELL, profit=5.0),
+        deal(2, 21, DEAL_ENTRY_IN, 0.1, 1.1000),
+        deal(3, 20, DEAL_ENTRY_OUT, 0.5, 1.1010, type=SELL, profit=5.0),
+    ], open_positions)
+    assert closed == []
+    assert orphans == [20, 20]
+    assert list(open_positions) == [21]
+
+
+def test_inout_counts_as_an_exit():
+    open_positions = {}
+    closed, orphans = fold_deals([
+        deal(1, 30, DEAL_ENTRY_IN, 1.0, 1.1000, type=SELL),
+        deal(2, 30, DEAL_ENTRY_INOUT, 1.0, 1.0950, type=BUY, profit=50.0),
+    ], open_positions)
+    assert orphans == []
+    (position,) = closed
+    assert position["type"] == SELL
+    assert position["profit"] == pytest.approx(50.0)
+
+    # With no entry seen, an INOUT is an orphan exit like any other
+    closed, orphans = fold_deals([deal(3, 31, DEAL_ENTRY_INOUT, 1.0, 1.1, type=BUY)], {})
+    assert closed == [] and orphans == [31]
+
+
+def test_non_trade_deals_are_ignored():
+    open_positions = {}
+    closed, orphans = fold_deals([
+        deal(1, 0, DEAL_ENTRY_IN, 0.0, 0.0, type=BALANCE, profit=1000.0),
+        deal(2, 40, DEAL_ENTRY_OUT, 0.0, 0.0, type=BALANCE, profit=-3.0),
+    ], open_positions)
+    assert closed == [] and orphans == [] and open_positions == {}
+
+
+@pytest.fixture
+def terminal(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal_writer, "OUTBOX_PATH", str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(journal_writer, "_db", None)
+    monkeypatch.setattr(deal_reconciler, "_schema_ready", False)
+    mt5 = FakeMetaTrader5(FakeTerminal(FakeConfig(latency_ms=0, login_latency_ms=0)))
+    mt5.login(5001, password="x", server="Demo")
+    monkeypatch.setattr(account_switcher, "_CURRENT_LOGIN", "5001")
+    return mt5
+
+
+def on_row(monkeypatch, server):
+    account = {"id": "acc-1", "user_id": "user-1", "login": "5001", "server": server}
+    monkeypatch.setattr(account_switcher, "_LAST_ACCOUNT", account)
+
+
+def test_broker_closes_are_journaled_for_the_account_row_on_the_terminal(terminal, monkeypatch):
+    on_row(monkeypatch, "Demo")
+    ticket = terminal.order_send({"action": 1, "symbol": "EURUSD", "volume": 0.1, "type": BUY, "type_filling": 1}).order
+    assert deal_reconciler.reconcile(terminal) == 0  # the first pass only learns open positions
+
+    terminal._fake.broker_close(5001, ticket, reason=4)
+    assert deal_reconciler.reconcile(terminal) == 1
+    assert deal_reconciler.reconcile(terminal) == 0
+    with journal_writer.transaction() as db:
+        (payload,) = [json.loads(row[0]) for row in db.execute("SELECT payload FROM outbox")]
+        marks = db.execute("SELECT server, login FROM reconciler_marks").fetchall()
+    assert (payload["user_id"], payload["account_id"], payload["mt5_ticket"]) == ("user-1", "acc-1", ticket)
+    assert payload["exit_reason"] == "STOP_LOSS"
+    assert marks == [("Demo", "5001")]
+
+
+def test_row_for_another_server_is_not_reconciled(terminal, monkeypatch):
+    # Same login number, but the terminal is on another trade server
+    on_row(monkeypatch, "Live")
+    assert deal_reconciler.reconcile(terminal) is None
+    with journal_writer.transaction() as db:
+        deal_reconciler._ensure_schema(db)
+        assert db.execute("SELECT COUNT(*) FROM reconciler_marks").fetchone() == (0,)
@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services import encryption_client
+
+
+class Backend:
+    """Answers the encryption service's requests from a list of (status, body)."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.requests = []
+        self.delay = 0.0
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        status, body = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(body, dict):
+            return httpx.Response(status, json=body)
+        return httpx.Response(status, text=body)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(encryption_client, "BACKEND_API_BASE", "http://backend")
+    monkeypatch.setattr(encryption_client, "SERVICE_KEY", "service-key")
+    monkeypatch.setattr(encryption_client, "RETRIES", 1)
+    monkeypatch.setattr(encryption_client, "BACKOFF_INITIAL_SECONDS", 0.0)
+    monkeypatch.setattr(encryption_client, "BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(encryption_client, "_consecutive_failures", 0)
+    monkeypatch.setattr(encryption_client, "_open_until", 0.0)
+    backend = Backend((200, {"password": "secret"}))
+    encryption_client._ensure_loop()
+    encryption_client._client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    yield backend
+    encryption_client.stop()
+
+
+def test_decrypt_retries_a_5xx(backend):
+    backend.answers = [(503, "starting up"), (200, {"password": "secret"})]
+    assert encryption_client.call("decrypt", {"encrypted_password": "x"}) == "secret"
+    assert len(backend.requests) == 2
+    assert backend.requests[0].url == "http://backend/api/v1/accounts/decrypt"
+    assert encryption_client.get_status()["consecutive_failures"] == 0
+
+
+def test_breaker_opens_after_repeated_failures_and_closes_on_success(backend):
+    backend.answers = [(503, "down")]
+    for _ in range(encryption_client.BREAKER_THRESHOLD):
+        assert encryption_client.call("decrypt", {}) is None
+    assert len(backend.requests) == 2 * (encryption_client.RETRIES + 1)
+    assert encryption_client.is_open()
+
+    # While open, calls return at once without touching the backend
+    assert encryption_client.call("decrypt", {}) is None
+    assert asyncio.run(encryption_client.acall("encrypt", {})) is None
+    assert len(backend.requests) == 4
+
+    # After the cooldown one good answer closes it again
+    encryption_client._open_until = 0.0
+    backend.answers = [(200, {"encrypted": "cipher"})]
+    assert asyncio.run(encryption_client.acall("encrypt", {"password": "p"})) == "cipher"
+    assert not encryption_client.is_open()
+    assert encryption_client.get_status()["consecutive_failures"] == 0
+
+
+def test_refusals_are_not_retried_and_not_failures(backend):
+    backend.answers = [(401, "bad service key")]
+    assert encryption_client.call("decrypt", {}) is None
+    assert len(backend.requests) == 1
+    assert encryption_client.get_status()["consecutive_failures"] == 0
+
+
+def test_200_without_a_json_object_counts_as_a_failure(backend):
+    backend.answers = [(200, "<html>proxy error</html>")]
+    assert encryption_client.call("decrypt", {}) is None
+    assert len(backend.requests) == encryption_client.RETRIES + 1
+    assert encryption_client.get_status()["consecutive_failures"] == 1
+
+
+def test_slow_backend_is_cut_off_at_the_call_timeout(backend, monkeypatch):
+    monkeypatch.setattr(encryption_client, "CALL_TIMEOUT_SECONDS", 0.05)
+    backend.delay = 1.0
+    assert encryption_client.call("decrypt", {}) is None
+    assert encryption_client.get_status()["consecutive_failures"] == 1
+
+
+def test_unconfigured_client_makes_no_calls(backend, monkeypatch):
+    monkeypatch.setattr(encryption_client, "SERVICE_KEY", None)
+    assert encryption_client.call("decrypt", {}) is None
+    assert backend.requests == []
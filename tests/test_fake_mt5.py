@@ -0,0 +1,57 @@
+import pytest
+
+from services import mt5_remote
+from services.fake_mt5 import FakeConfig, FakeMetaTrader5, FakeTerminal
+
+
+def fake(seed=42):
+    return FakeMetaTrader5(FakeTerminal(FakeConfig(seed=seed, latency_ms=0, login_latency_ms=0)))
+
+
+@pytest.fixture
+def terminal():
+    mt5 = fake()
+    mt5.initialize()
+    mt5.login(5001, password="x", server="Demo")
+    mt5.reset_stats()
+    return mt5
+
+
+def test_prices_depend_only_on_seed_symbol_and_time():
+    start = 1_800_000_000
+    first, again, other = fake(), fake(), fake(seed=7)
+    assert first._fake.tick("EURUSD", start) == again._fake.tick("EURUSD", start)
+    assert first._fake.bar("EURUSD", start, 60) == again._fake.bar("EURUSD", start, 60)
+    assert first._fake.bar("EURUSD", start, 60) != other._fake.bar("EURUSD", start, 60)
+
+    bars = first.copy_rates_range("EURUSD", first.TIMEFRAME_M1, start, start + 600)
+    assert [tuple(bar) for bar in bars] == [tuple(bar) for bar in again.copy_rates_range("EURUSD", again.TIMEFRAME_M1, start, start + 600)]
+
+
+def test_every_call_is_one_round_trip(terminal):
+    terminal.symbol_info_tick("EURUSD")
+    terminal.positions_get()
+    assert terminal.stats() == {"round_trips": 2, "calls": {"symbol_info_tick": 1, "positions_get": 1}}
+
+
+def test_helpers_cost_one_round_trip_per_call(terminal):
+    mt5_remote.install(terminal)
+    terminal.reset_stats()
+
+    # The mt5 calls a helper makes on the terminal side are not charged again
+    assert mt5_remote.positions(terminal) == []
+    snapshots = mt5_remote.symbol_snapshots(terminal, ["EURUSD", "GBPUSD"])
+    assert set(snapshots) == {"EURUSD", "GBPUSD"}
+    assert terminal.stats() == {"round_trips": 2, "calls": {"call": 2}}
+
+
+def test_dropped_link_fails_every_call_until_reconnected(terminal):
+    terminal._disconnected = True
+    with pytest.raises(EOFError):
+        terminal.positions_get()
+    with pytest.raises(EOFError):
+        terminal.eval("mt5.positions_get()")
+
+    # A new connection to the same terminal sees the same account
+    reconnected = FakeMetaTrader5(terminal._fake)
+    assert reconnected.account_info().login == 5001
@@ -0,0 +1,125 @@
+import asyncio
+from collections import OrderedDict
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from services import idempotency
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    monkeypatch.setattr(idempotency, "_ENTRIES", OrderedDict())
+    monkeypatch.setattr(idempotency, "STORE_PATH", None)
+    monkeypatch.setattr(idempotency, "_db", None)
+
+
+def make_app(gate: asyncio.Event = None):
+    """An order endpoint wired like the bridge's; ``sent`` counts orders that went out."""
+    app = FastAPI()
+    app.add_middleware(idempotency.IdempotencyMiddleware)
+    app.add_exception_handler(idempotency.Replay, idempotency.replay_response)
+    app.state.sent = 0
+
+    async def idempotency_key(request: Request, x_user: str = Header("u1")):
+        await idempotency.reserve(request, x_user)
+
+    @app.post("/orders", dependencies=[Depends(idempotency_key)])
+    async def place(order: dict):
+        if gate is not None:
+            await gate.wait()
+        if order.get("refuse"):
+            # e.g. an open circuit breaker: nothing reached the terminal
+            raise HTTPException(status_code=503, detail="MT5 unavailable")
+        await asyncio.to_thread(idempotency.mark_dispatched)
+        app.state.sent += 1
+        if order.get("crash"):
+            raise RuntimeError("connection reset after send")
+        if order.get("lost"):
+            raise HTTPException(status_code=503, detail="Terminal went away")
+        return {"order": app.state.sent, **order}
+
+    return app
+
+
+def test_retry_gets_the_first_response_back():
+    app = make_app()
+    client = TestClient(app)
+    first = client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1"})
+    retry = client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1"})
+    assert first.json() == retry.json() == {"order": 1, "volume": 0.1}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert app.state.sent == 1
+
+    # Keys are per user, and requests without one are never deduplicated
+    assert client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1", "X-User": "u2"}).json()["order"] == 2
+    client.post("/orders", json={"volume": 0.1})
+    client.post("/orders", json={"volume": 0.1})
+    assert app.state.sent == 4
+
+
+def test_key_reused_for_another_request_is_rejected():
+    client = TestClient(make_app())
+    client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1"})
+    reused = client.post("/orders", json={"volume": 0.2}, headers={"Idempotency-Key": "k1"})
+    assert reused.status_code == 422
+
+
+def test_refusal_before_dispatch_releases_the_key():
+    app = make_app()
+    client = TestClient(app)
+    assert client.post("/orders", json={"refuse": True}, headers={"Idempotency-Key": "k1"}).status_code == 503
+    retry = client.post("/orders", json={"refuse": True}, headers={"Idempotency-Key": "k1"})
+    assert retry.status_code == 503 and "Idempotent-Replayed" not in retry.headers
+    assert idempotency.get_status()["keys"] == 0
+
+
+def test_failures_after_dispatch_are_stored():
+    app = make_app()
+    client = TestClient(app, raise_server_exceptions=False)
+    for body in ({"lost": True}, {"crash": True}):
+        key = {"Idempotency-Key": str(body)}
+        first = client.post("/orders", json=body, headers=key)
+        retry = client.post("/orders", json=body, headers=key)
+        assert retry.status_code == first.status_code in (500, 503)
+        assert retry.headers["Idempotent-Replayed"] == "true"
+    # Each order went out once: a blind resend could have doubled it
+    assert app.state.sent == 2
+
+
+def test_concurrent_retry_waits_for_the_first_request():
+    async def scenario():
+        gate = asyncio.Event()
+        app = make_app(gate)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bridge") as client:
+            headers = {"Idempotency-Key": "k1"}
+            first = asyncio.ensure_future(client.post("/orders", json={"volume": 0.1}, headers=headers))
+            while not idempotency.get_status()["running"]:
+                await asyncio.sleep(0.001)
+            hedged = asyncio.ensure_future(client.post("/orders", json={"volume": 0.1}, headers=headers))
+            await asyncio.sleep(0.01)
+            assert not hedged.done()
+            gate.set()
+            return app.state, await first, await hedged
+
+    state, first, hedged = asyncio.run(scenario())
+    assert state.sent == 1
+    assert hedged.json() == first.json()
+    assert hedged.headers["Idempotent-Replayed"] == "true"
+
+
+def test_stored_responses_survive_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(idempotency, "STORE_PATH", str(tmp_path / "idempotency.sqlite3"))
+    app = make_app()
+    client = TestClient(app)
+    first = client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1"})
+
+    idempotency._ENTRIES.clear()  # memory lost, SQLite kept
+    retry = client.post("/orders", json={"volume": 0.1}, headers={"Idempotency-Key": "k1"})
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert app.state.sent == 1
@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import journal_writer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_800_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class Journal:
+    """Stands in for the Supabase trade_journal table."""
+
+    def __init__(self):
+        self.rows = []
+        self.inserts = 0
+        self.rejected_tickets = set()
+        self.lose_responses = False
+
+    def table(self, name):
+        assert name == journal_writer.JOURNAL_TABLE
+        return Query(self)
+
+
+class Query:
+    def __init__(self, journal):
+        self.journal = journal
+        self.tickets = None
+        self.payload = None
+
+    def select(self, columns):
+        return self
+
+    def in_(self, column, values):
+        self.tickets = {str(value) for value in values}
+        return self
+
+    def insert(self, entries):
+        self.payload = entries
+        return self
+
+    def execute(self):
+        journal = self.journal
+        if self.payload is None:
+            return SimpleNamespace(data=[row for row in journal.rows if str(row["mt5_ticket"]) in self.tickets])
+        journal.inserts += 1
+        if any(entry["mt5_ticket"] in journal.rejected_tickets for entry in self.payload):
+            raise ValueError("invalid input syntax")
+        journal.rows.extend(self.payload)
+        if journal.lose_responses:
+            raise TimeoutError("read timed out")
+        return SimpleNamespace(data=self.payload)
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    clock = Clock()
+    journal = Journal()
+    monkeypatch.setattr(journal_writer, "OUTBOX_PATH", str(tmp_path / "outbox.sqlite3"))
+    monkeypatch.setattr(journal_writer, "_db", None)
+    monkeypatch.setattr(journal_writer, "time", SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(journal_writer, "get_supabase_client", lambda: journal)
+    journal.clock = clock
+    return journal
+
+
+def entry(ticket, account_id="acc-1"):
+    return {"user_id": "user-1", "account_id": account_id, "mt5_ticket": ticket, "pnl": 1.0}
+
+
+def retry_all(journal):
+    """Move the clock past any backoff, then flush until nothing is due."""
+    journal.clock.now += journal_writer.BACKOFF_MAX_SECONDS + 1
+    while journal_writer.flush_once():
+        pass
+
+
+def test_entries_go_out_in_one_bulk_insert_and_positions_once(journal):
+    for ticket in (1, 2, 3):
+        assert journal_writer.enqueue(entry(ticket)) is not None
+    # The API close path and the reconciler both journaling a position
+    assert journal_writer.enqueue(entry(2)) is None
+    assert journal_writer.enqueue(entry(2, account_id="acc-2")) is not None
+
+    assert journal_writer.flush_once() == 4
+    assert journal.inserts == 1
+    assert [row["mt5_ticket"] for row in journal.rows] == [1, 2, 3, 2]
+    assert journal_writer.backlog() == 0
+
+
+def test_insert_that_landed_despite_an_error_is_not_repeated(journal):
+    journal.lose_responses = True
+    journal_writer.enqueue(entry(1))
+    assert journal_writer.flush_once() == 0
+    assert journal_writer.backlog() == 1
+
+    journal.lose_responses = False
+    retry_all(journal)
+    assert [row["mt5_ticket"] for row in journal.rows] == [1]
+    assert journal_writer.backlog() == 0
+
+
+def test_poison_entry_is_isolated(journal):
+    journal.rejected_tickets = {3}
+    for ticket in (1, 2, 3):
+        journal_writer.enqueue(entry(ticket))
+    for _ in range(journal_writer.POISON_ATTEMPTS):
+        assert journal_writer.flush_once() == 0
+        journal.clock.now += journal_writer.BACKOFF_MAX_SECONDS + 1
+
+    # From now on failed entries go one at a time: the good ones get through
+    retry_all(journal)
+    assert [row["mt5_ticket"] for row in journal.rows] == [1, 2]
+    assert journal_writer.backlog() == 1
+
+    # The rejected entry backs off and doesn't hold back new ones
+    journal_writer.enqueue(entry(4))
+    journal.clock.now += 1
+    assert journal_writer.flush_once() == 1
+    assert [row["mt5_ticket"] for row in journal.rows] == [1, 2, 4]
+
+    journal_writer._refresh_snapshot()
+    status = journal_writer.get_status()
+    assert (status["backlog"], status["retrying"]) == (1, 1)
+    with journal_writer.transaction() as db:
+        assert db.execute("SELECT last_error FROM outbox").fetchone() == ("invalid input syntax",)
+
+
+def test_missing_supabase_client_defers_the_batch(journal, monkeypatch):
+    monkeypatch.setattr(journal_writer, "get_supabase_client", lambda: None)
+    journal_writer.enqueue(entry(1))
+    assert journal_writer.flush_once() == 0
+    assert journal_writer.flush_once() == 0  # backing off, nothing due yet
+    assert journal_writer.backlog() == 1
@@ -0,0 +1,69 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+
+
+def test_counter_exposition_escapes_label_values(registry):
+    errors = metrics.counter("calls_total", "Calls.", ("method", "error"))
+    errors.inc("order_send", 'Timeout "read"\n')
+    errors.inc("order_send", 'Timeout "read"\n', amount=2)
+    assert errors.value("order_send", 'Timeout "read"\n') == 3
+    assert metrics.render().splitlines() == [
+        "# HELP calls_total Calls.",
+        "# TYPE calls_total counter",
+        'calls_total{method="order_send",error="Timeout \\"read\\"\\n"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = metrics.histogram("latency_seconds", "Latency.", ("method",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "positions_get")
+    assert latency.count("positions_get") == 4
+    assert metrics.render().splitlines()[2:] == [
+        'latency_seconds_bucket{method="positions_get",le="0.1"} 2',
+        'latency_seconds_bucket{method="positions_get",le="1.0"} 3',
+        'latency_seconds_bucket{method="positions_get",le="+Inf"} 4',
+        'latency_seconds_sum{method="positions_get"} 3.65',
+        'latency_seconds_count{method="positions_get"} 4',
+    ]
+
+
+def test_gauges_are_read_at_scrape_time_and_a_broken_one_is_skipped(registry):
+    backlog = [3]
+    gauge = metrics.gauge("backlog", "Backlog.")
+    gauge.add_callback(lambda: [((), backlog[0])])
+    gauge.add_callback(lambda: 1 / 0)
+    assert metrics.render().splitlines()[2:] == ["backlog 3"]
+    backlog[0] = 0
+    assert metrics.render().splitlines()[2:] == ["backlog 0"]
+
+
+def test_metrics_are_registered_once_per_name(registry):
+    first = metrics.counter("logins_total", "Logins.")
+    assert metrics.counter("logins_total", "Logins.") is first
+    assert metrics.render().count("# TYPE logins_total") == 1
+
+
+def test_requests_are_recorded_per_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/api/v1/positions/{ticket}")
+    async def position(ticket: int):
+        return {"ticket": ticket}
+
+    client = TestClient(app)
+    before = metrics.HTTP_REQUEST_SECONDS.count("GET", "/api/v1/positions/{ticket}", "200")
+    client.get("/api/v1/positions/1")
+    client.get("/api/v1/positions/2")
+    client.get("/wp-login.php")
+    assert metrics.HTTP_REQUEST_SECONDS.count("GET", "/api/v1/positions/{ticket}", "200") == before + 2
+    assert metrics.HTTP_REQUEST_SECONDS.count("GET", "unmatched", "404") >= 1
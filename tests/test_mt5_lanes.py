@@ -0,0 +1,95 @@
+import threading
+import time
+
+from services.mt5_lanes import ACCOUNT, BULK, DEFAULT_LIMITS, MARKET_DATA, TRADING, Scheduler, parse_limits
+
+TIMEOUT = 2.0
+
+
+def _wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _start(scheduler, lane, admitted):
+    """Acquire ``lane`` in a thread, appending it to ``admitted`` once in."""
+    def run():
+        scheduler.acquire(lane)
+        admitted.append(lane)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    scheduler = Scheduler(1, dict(DEFAULT_LIMITS), reserved=0)
+    scheduler.acquire(ACCOUNT)
+    admitted = []
+    threads = [_start(scheduler, BULK, admitted)]
+    _wait_until(lambda: scheduler.snapshot()[BULK]["queued"] == 1)
+    threads.append(_start(scheduler, MARKET_DATA, admitted))
+    threads.append(_start(scheduler, TRADING, admitted))
+    _wait_until(lambda: scheduler.snapshot()[TRADING]["queued"] == 1 and scheduler.snapshot()[MARKET_DATA]["queued"] == 1)
+    assert admitted == []
+
+    scheduler.release(ACCOUNT)
+    for expected in (TRADING, MARKET_DATA, BULK):
+        _wait_until(lambda: len(admitted) == 1)
+        assert admitted.pop() == expected
+        scheduler.release(expected)
+    for thread in threads:
+        thread.join(TIMEOUT)
+
+
+def test_last_slot_is_reserved_for_trading():
+    scheduler = Scheduler(2, dict(DEFAULT_LIMITS), reserved=1)
+    scheduler.acquire(MARKET_DATA)
+    admitted = []
+    waiter = _start(scheduler, MARKET_DATA, admitted)
+    _wait_until(lambda: scheduler.snapshot()[MARKET_DATA]["queued"] == 1)
+
+    # The reserved slot admits an order at once, with market data queued
+    scheduler.acquire(TRADING)
+    assert admitted == []
+    assert scheduler.snapshot()[TRADING]["running"] == 1
+
+    scheduler.release(TRADING)
+    assert admitted == []  # a free slot that is the reserved one stays reserved
+    scheduler.release(MARKET_DATA)
+    waiter.join(TIMEOUT)
+    assert admitted == [MARKET_DATA]
+
+
+def test_lane_budget_holds_with_free_slots():
+    scheduler = Scheduler(4, dict(DEFAULT_LIMITS, **{BULK: 1}), reserved=1)
+    scheduler.acquire(BULK)
+    admitted = []
+    waiter = _start(scheduler, BULK, admitted)
+    _wait_until(lambda: scheduler.snapshot()[BULK]["queued"] == 1)
+    scheduler.acquire(ACCOUNT)  # other lanes still get the free slots
+    assert admitted == []
+
+    scheduler.release(BULK)
+    waiter.join(TIMEOUT)
+    assert admitted == [BULK]
+
+
+def test_higher_lane_at_its_budget_does_not_block_lower_lanes():
+    scheduler = Scheduler(4, dict(DEFAULT_LIMITS, **{TRADING: 1}), reserved=0)
+    scheduler.acquire(TRADING)
+    admitted = []
+    waiter = _start(scheduler, TRADING, admitted)
+    _wait_until(lambda: scheduler.snapshot()[TRADING]["queued"] == 1)
+
+    scheduler.acquire(ACCOUNT)
+    assert admitted == []
+    scheduler.release(TRADING)
+    waiter.join(TIMEOUT)
+    assert admitted == [TRADING]
+
+
+def test_parse_limits():
+    assert parse_limits("trading=6, bulk=0,unknown=3,market_data") == dict(DEFAULT_LIMITS, **{TRADING: 6, BULK: 1})
@@ -0,0 +1,79 @@
+import pytest
+from fastapi import HTTPException
+
+from services import account_switcher, mt5_remote, order_pipeline
+from services.fake_mt5 import FakeConfig, FakeMetaTrader5, FakeTerminal
+
+BUY = 0
+TRADE_ACTION_DEAL = 1
+
+
+@pytest.fixture
+def terminal(monkeypatch):
+    # Filling mask 0: the symbol claims nothing, only RETURN is accepted
+    mt5 = FakeMetaTrader5(FakeTerminal(FakeConfig(latency_ms=0, login_latency_ms=0, symbol_filling_mode=0)))
+    mt5.login(5001, password="x", server="Demo")
+    monkeypatch.setattr(order_pipeline, "_SYMBOLS", {})
+    monkeypatch.setattr(order_pipeline, "_LEARNED_FILLING", {})
+    monkeypatch.setattr(account_switcher, "_CURRENT_LOGIN", "5001")
+
+    sent = []
+    order_send = mt5_remote.order_send
+
+    def counting(terminal, request):
+        sent.append(request.get("type_filling"))
+        return order_send(terminal, request)
+
+    monkeypatch.setattr(mt5_remote, "order_send", counting)
+    mt5.sent = sent
+    return mt5
+
+
+def buy(volume=0.1):
+    return {"action": TRADE_ACTION_DEAL, "symbol": "EURUSD", "volume": volume, "type": BUY, "price": 1.1, "deviation": 10}
+
+
+def test_filling_mode_that_worked_is_tried_first_next_time(terminal):
+    info = order_pipeline.symbol_info(terminal, "EURUSD")
+    result, filling = order_pipeline.send(terminal, buy(), info)
+    assert result.retcode == order_pipeline.TRADE_RETCODE_DONE
+    assert filling == order_pipeline.ORDER_FILLING_RETURN
+    assert terminal.sent == [None, order_pipeline.ORDER_FILLING_RETURN]
+
+    terminal.sent.clear()
+    order_pipeline.send(terminal, buy(), info)
+    assert terminal.sent == [order_pipeline.ORDER_FILLING_RETURN]
+
+    # Batches learn and use the same modes
+    outcome, = order_pipeline.send_batch(terminal, [(buy(), info)])
+    assert (outcome.result.retcode, outcome.filling_mode) == (order_pipeline.TRADE_RETCODE_DONE, order_pipeline.ORDER_FILLING_RETURN)
+    assert order_pipeline._modes_for(terminal, info, TRADE_ACTION_DEAL)[0] == order_pipeline.ORDER_FILLING_RETURN
+
+
+def test_rejection_other_than_filling_mode_ends_the_loop(terminal):
+    info = order_pipeline.symbol_info(terminal, "EURUSD")
+    with pytest.raises(HTTPException) as rejected:
+        order_pipeline.send(terminal, buy(volume=0), info, failure="Order failed")
+    assert rejected.value.status_code == 400
+    assert rejected.value.detail.startswith("Order failed: ")
+    assert len(terminal.sent) == 2  # None (10030), then RETURN answered with another error
+
+
+def test_transport_error_is_an_unknown_outcome(terminal, monkeypatch):
+    info = order_pipeline.symbol_info(terminal, "EURUSD")
+    mt5_remote.install(terminal)
+    terminal._disconnected = True  # the link drops with the order on its way
+
+    with pytest.raises(HTTPException) as unknown:
+        order_pipeline.send(terminal, buy(), info)
+    assert unknown.value.status_code == 502
+    assert "outcome is unknown" in unknown.value.detail
+    assert len(terminal.sent) == 1  # never resent with another filling mode
+    assert account_switcher.get_current_login() is None
+
+    monkeypatch.setattr(account_switcher, "_CURRENT_LOGIN", "5001")
+    with pytest.raises(HTTPException) as unknown:
+        order_pipeline.send_batch(terminal, [(buy(), info), (buy(), info)], failure="Batch order failed")
+    assert unknown.value.status_code == 502
+    assert unknown.value.detail.startswith("Batch order failed: terminal call failed")
+    assert account_switcher.get_current_login() is None
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from services import mt5_lanes, rate_limiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(rate_limiter, "_BUCKETS", OrderedDict())
+    return clock
+
+
+def test_tokens_refill_at_rate_up_to_burst(clock):
+    key = ("u1", mt5_lanes.ACCOUNT)
+    assert rate_limiter._take(key, 0.5, 2) == 0
+    assert rate_limiter._take(key, 0.5, 2) == 0
+    assert rate_limiter._take(key, 0.5, 2) == pytest.approx(2.0)
+
+    clock.now += 1
+    assert rate_limiter._take(key, 0.5, 2) == pytest.approx(1.0)
+    clock.now += 1
+    assert rate_limiter._take(key, 0.5, 2) == 0
+
+    # An idle bucket fills up to its burst, not beyond
+    clock.now += 100
+    assert rate_limiter._take(key, 0.5, 2) == 0
+    assert rate_limiter._take(key, 0.5, 2) == 0
+    assert rate_limiter._take(key, 0.5, 2) > 0
+
+
+def test_limited_request_gets_retry_after_rounded_up(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "USER_QUOTAS", {mt5_lanes.TRADING: (0.4, 1.0), mt5_lanes.ACCOUNT: (10.0, 1.0)})
+    user = {"user_id": "u1"}
+
+    rate_limiter.check(user, mt5_lanes.TRADING)
+    with pytest.raises(HTTPException) as limited:
+        rate_limiter.check(user, mt5_lanes.TRADING)
+    assert limited.value.status_code == 429
+    assert limited.value.headers["Retry-After"] == "3"  # 2.5s to the next token
+
+    # Never below one second, even when the next token is due sooner
+    rate_limiter.check(user, mt5_lanes.ACCOUNT)
+    with pytest.raises(HTTPException) as limited:
+        rate_limiter.check(user, mt5_lanes.ACCOUNT)
+    assert limited.value.headers["Retry-After"] == "1"
+
+
+def test_buckets_are_per_client_and_service_is_separate(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "USER_QUOTAS", {mt5_lanes.BULK: (1.0, 1.0)})
+    monkeypatch.setattr(rate_limiter, "SERVICE_QUOTAS", {mt5_lanes.BULK: (1.0, 1.0)})
+
+    rate_limiter.check({"user_id": "u1"}, mt5_lanes.BULK)
+    rate_limiter.check({"user_id": "u2"}, mt5_lanes.BULK)
+    rate_limiter.check({"user_id": "u1", "service_role": True}, mt5_lanes.BULK)
+    with pytest.raises(HTTPException):
+        rate_limiter.check({"user_id": "u1"}, mt5_lanes.BULK)
+
+    # Unlisted classes and a rate of 0 are unlimited
+    for _ in range(10):
+        rate_limiter.check({"user_id": "u1"}, mt5_lanes.TRADING)
+
+
+def test_least_recently_used_buckets_are_dropped(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "MAX_CLIENTS", 2)
+    for user in ("u1", "u2", "u1", "u3"):
+        rate_limiter._take((user, mt5_lanes.BULK), 1.0, 5.0)
+    assert list(rate_limiter._BUCKETS) == [("u1", mt5_lanes.BULK), ("u3", mt5_lanes.BULK)]
+
+
+def test_parse_quotas():
+    quotas = rate_limiter.parse_quotas("market_data=2:8, bulk=0.5,trading=0", rate_limiter.DEFAULT_QUOTAS)
+    assert quotas[mt5_lanes.MARKET_DATA] == (2.0, 8.0)
+    assert quotas[mt5_lanes.BULK] == (0.5, 1.0)
+    assert quotas[mt5_lanes.TRADING] == (0.0, 1.0)
+    assert quotas[mt5_lanes.ACCOUNT] == rate_limiter.DEFAULT_QUOTAS[mt5_lanes.ACCOUNT]
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from services import single_flight
+
+TIMEOUT = 2.0
+
+
+class Call:
+    """A terminal read that blocks until released, counting how often it ran."""
+
+    def __init__(self, result="rows"):
+        self.result = result
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        assert self.release.wait(TIMEOUT), "never released"
+        if isinstance(self.result, Exception):
+            raise self.result
+        return (self.result,) + args
+
+
+async def _until_in_flight(count):
+    while single_flight.in_flight() != count:
+        await asyncio.sleep(0.001)
+
+
+def test_identical_concurrent_reads_share_one_call():
+    call = Call()
+
+    async def scenario():
+        first = asyncio.ensure_future(single_flight.run("positions_get", ("t", "5001"), call, 1))
+        await _until_in_flight(1)
+        second = asyncio.ensure_future(single_flight.run("positions_get", ("t", "5001"), call, 1))
+        other = asyncio.ensure_future(single_flight.run("positions_get", ("t", "5002"), call, 1))
+        await _until_in_flight(2)
+        call.release.set()
+        return await asyncio.gather(first, second, other)
+
+    first, second, other = asyncio.run(scenario())
+    assert first == second == other == ("rows", 1)
+    assert first is second  # waiters get the very same object
+    assert call.calls == 2  # one per key
+    assert single_flight.in_flight() == 0
+
+
+def test_errors_are_shared_and_nothing_is_cached():
+    call = Call(result=ConnectionError("terminal gone"))
+
+    async def scenario():
+        calls = [asyncio.ensure_future(single_flight.run("symbols_get", (), call)) for _ in range(3)]
+        await _until_in_flight(1)
+        call.release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, ConnectionError) for error in errors)
+    assert call.calls == 1
+
+    # Once done, the next read makes a fresh call
+    call.result = "symbols"
+    assert asyncio.run(single_flight.run("symbols_get", (), call)) == ("symbols",)
+    assert call.calls == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    call = Call()
+
+    async def scenario():
+        leader = asyncio.ensure_future(single_flight.run("account_info", ("5001",), call))
+        await _until_in_flight(1)
+        waiter = asyncio.ensure_future(single_flight.run("account_info", ("5001",), call))
+        await asyncio.sleep(0)
+        leader.cancel()  # the client that started the call hung up
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        call.release.set()
+        return await waiter
+
+    assert asyncio.run(scenario()) == ("rows",)
+    assert call.calls == 1